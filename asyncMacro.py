@@ -0,0 +1,114 @@
+import asyncio
+
+from eventStore import Event, EventStore, KINDS, MOUSE_MOVE, MOUSE_WHEEL
+from hotkeyDispatcher import getDispatcher
+from inputCapture import InputCapture
+from keyMacro import KeyMacro
+from playScheduler import PlayHandle
+
+
+# asyncio 接口: 播放仍由共用的调度线程执行, 协程只等待结束通知, 不为每个宏占用线程
+# 取消协程会立即取消对应的播放或录制, 不必等到下一个事件或循环间隔
+
+
+def toEvent(row) -> Event:
+    time, kind, name, x, y, delta = row
+    eventType, type = KINDS[kind]
+    if kind == MOUSE_MOVE:
+        return Event(eventType, type, (x, y), time)
+    if kind == MOUSE_WHEEL:
+        return Event(eventType, type, delta, time)
+    return Event(eventType, type, name, time)
+
+
+class AsyncKeyMacro:
+
+    def __init__(self, keyMacro: KeyMacro = None):
+        self.keyMacro = KeyMacro() if keyMacro is None else keyMacro
+        # until 为 None 时的录制由 finishRecording() 结束
+        self.recordStopped = None
+
+    async def play(self, keepInterval: bool = True, isLoop: bool = False, delay: int = 0, isDeadline: bool = True) -> PlayHandle:
+        if self.keyMacro.isPlaying:
+            raise RuntimeError("宏正在播放")
+        handle = self.keyMacro.playRecord(keepInterval, isLoop, delay, isDeadline=isDeadline)
+        if handle is None:
+            return None
+        await waitHandle(handle)
+        return handle
+
+    async def record(self, until=None, isKey: bool = True, isMouse: bool = True) -> EventStore:
+        # until: 结束录制的快捷键、录制时长(秒)、asyncio.Event 或可等待对象; 为 None 时录制到调用 finishRecording()
+        # 协程被取消时停止录制并照常抛出 CancelledError, 不返回录制结果(录制的内容仍在 keyMacro.eventsRecord 中)
+        if self.keyMacro.isRecording:
+            raise RuntimeError("宏正在录制")
+        self.keyMacro.startRecording(isKey, isMouse)
+        try:
+            if until is None:
+                self.recordStopped = asyncio.Event()
+                await self.recordStopped.wait()
+            elif isinstance(until, str):
+                await waitHotkey(until)
+            elif isinstance(until, (int, float)):
+                await asyncio.sleep(until)
+            elif isinstance(until, asyncio.Event):
+                await until.wait()
+            else:
+                await until
+        finally:
+            self.recordStopped = None
+            self.keyMacro.stopRecording(isKey, isMouse)
+        return self.keyMacro.eventsRecord
+
+    def finishRecording(self):
+        # 结束 until 为 None 的录制, record() 随后返回录制结果; 需在事件循环所在线程调用
+        if self.recordStopped is not None:
+            self.recordStopped.set()
+
+    def stop(self):
+        self.keyMacro.terminateRecord(False)
+
+
+async def waitHandle(handle: PlayHandle):
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def finished(handle):
+        loop.call_soon_threadsafe(lambda: future.done() or future.set_result(handle))
+
+    handle.addDoneCallback(finished)
+    try:
+        await future
+    except asyncio.CancelledError:
+        handle.cancel(False)
+        raise
+
+
+async def waitHotkey(hotkey: str):
+    loop = asyncio.get_running_loop()
+    pressed = asyncio.Event()
+    dispatcher, name = getDispatcher(), f"waitHotkey-{id(pressed)}"
+    dispatcher.bind(name, hotkey, loop.call_soon_threadsafe, (pressed.set,))
+    try:
+        await pressed.wait()
+    finally:
+        dispatcher.unbind(name)
+
+
+async def captureEvents(isKey: bool = True, isMouse: bool = True):
+    # 录制输入的异步事件流, 按时间顺序逐个产出 Event, 停止迭代或取消时卸载钩子
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def sink(rows):
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(queue.put_nowait, rows)
+
+    capture = InputCapture(sink)
+    capture.start(isKey, isMouse)
+    try:
+        while True:
+            for row in await queue.get():
+                yield toEvent(row)
+    finally:
+        capture.stop()
@@ -0,0 +1,991 @@
+import argparse
+import gc
+import io
+import logging
+import platform
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from collections import namedtuple
+from pathlib import Path
+
+import ujson
+
+import perfStats
+from eventStore import EventStore, KEY_DOWN, KEY_UP, MOUSE_MOVE
+from hotkeyDispatcher import HotkeyDispatcher
+from inputCapture import HookLatency, InputCapture
+from inputBackend import getBackend
+from keyMacro import KeyMacro, compilePlan
+from macroContainer import MacroContainer, writeContainer
+from macroProgram import LazyPlan, flattenProgram, linkProgram, parseText
+from scriptCodec import decodeRecord, decodeText, encodeText
+from scriptPages import PAGE_EVENTS, applyPage, encodePage, pageCount, validateText
+from playScheduler import getScheduler
+from recordFilter import FilterPipeline, recordRows
+from utils import createQueueHandler, dumpJson, loadJson, logger
+from workerPool import WorkerPool
+
+
+def makeRecord(count: int, moveRatio: float = 0.95, seed: int = 0, keyRatio: float = 0.5) -> list:
+    rand = random.Random(seed)
+    records, now, x, y = [], time.time(), 960, 540
+    keys = ["a", "s", "d", "w", "space", "shift", "ctrl", "enter"]
+    while len(records) < count:
+        now += rand.uniform(0.001, 0.02)
+        if rand.random() < moveRatio:
+            x, y = x + rand.randint(-5, 5), y + rand.randint(-5, 5)
+            records.append({"mouse": {"offset": [x, y], "type": "move", "time": now}})
+        elif rand.random() < keyRatio:
+            key = rand.choice(keys)
+            records.append({"key": {"key": key, "type": "down", "time": now}})
+            now += 0.05
+            records.append({"key": {"key": key, "type": "up", "time": now}})
+        else:
+            button = rand.choice(["left", "right"])
+            records.append({"mouse": {"key": button, "type": "down", "time": now}})
+            now += 0.05
+            records.append({"mouse": {"key": button, "type": "up", "time": now}})
+    return records[:count]
+
+
+def measureMemory(build):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        began = time.perf_counter()
+        result = build()
+        elapsed = time.perf_counter() - began
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    return result, used, elapsed
+
+
+def benchMemory(counts):
+    print(f"{'events':>10} {'dict MB':>10} {'store MB':>10} {'ratio':>8} {'dict B/ev':>10} {'store B/ev':>11}")
+    for count in counts:
+        # 两种表示都从同一份 json 文本解析得到, 保证对比的是常驻内存
+        text = ujson.dumps(makeRecord(count))
+        records, dictBytes, _ = measureMemory(lambda: ujson.loads(text))
+        store, storeBytes, _ = measureMemory(lambda: EventStore.fromList(ujson.loads(text)))
+        assert len(store) == len(records)
+        del records, store
+        print(f"{count:>10} {dictBytes / 1048576:>10.2f} {storeBytes / 1048576:>10.2f} {dictBytes / max(storeBytes, 1):>8.1f} "
+              f"{dictBytes / count:>10.1f} {storeBytes / count:>11.1f}")
+
+
+def noop(arg):
+    pass
+
+
+NOOP_HANDLER = {
+    "key": {"up": noop, "down": noop},
+    "mouse": {"up": noop, "down": noop, "double": noop, "move": noop, "wheel": noop}
+}
+
+
+def dispatchDicts(eventsRecord, eventHandler):
+    # 原先 playRecord 中逐事件的字典派发方式
+    for event in eventsRecord:
+        for eventType, eventRecord in event.items():
+            keyValue = eventRecord['key' if "key" in eventRecord else ('offset' if 'offset' in eventRecord else "delta")]
+            eventHandler[eventType][eventRecord['type']](keyValue)
+
+
+def dispatchPlan(plan):
+    for offset, handler, arg in plan:
+        handler(arg)
+
+
+def benchDispatch(counts, repeat: int = 5):
+    print(f"{'events':>10} {'dict ns/ev':>11} {'plan ns/ev':>11} {'compile ms':>11} {'speedup':>8}")
+    for count in counts:
+        records = makeRecord(count, moveRatio=0.7)
+        store = EventStore.fromList(records)
+        began = time.perf_counter()
+        plan = compilePlan(store, NOOP_HANDLER)
+        compileTime = time.perf_counter() - began
+
+        dictTime = min(timeit(lambda: dispatchDicts(records, NOOP_HANDLER)) for _ in range(repeat))
+        planTime = min(timeit(lambda: dispatchPlan(plan)) for _ in range(repeat))
+        print(f"{count:>10} {dictTime / count * 1e9:>11.1f} {planTime / count * 1e9:>11.1f} {compileTime * 1000:>11.2f} {dictTime / planTime:>8.2f}")
+
+
+KeyEvent = namedtuple("KeyEvent", ["event_type", "name", "time"])
+MoveEvent = namedtuple("MoveEvent", ["x", "y", "time"])
+ButtonEvent = namedtuple("ButtonEvent", ["event_type", "button", "time"])
+
+
+def benchHook(count: int):
+    # 直接用构造的事件对象调用回调, 只测钩子回调本身的耗时
+    events = []
+    for index, record in enumerate(makeRecord(count, moveRatio=0.9)):
+        eventType, eventRecord = next(iter(record.items()))
+        if eventRecord['type'] == "move":
+            events.append(MoveEvent(*eventRecord['offset'], eventRecord['time']))
+        elif eventType == "key":
+            events.append(KeyEvent(eventRecord['type'], eventRecord['key'], eventRecord['time']))
+        else:
+            events.append(ButtonEvent(eventRecord['type'], eventRecord['key'], eventRecord['time']))
+
+    records = []
+
+    def appendDict(event):
+        if isinstance(event, MoveEvent):
+            records.append({"mouse": {"offset": [event.x, event.y], "type": "move", "time": event.time}})
+        elif isinstance(event, ButtonEvent):
+            records.append({"mouse": {"key": event.button, "type": event.event_type, "time": event.time}})
+        else:
+            records.append({"key": {"key": event.name, "type": event.event_type, "time": event.time}})
+
+    capture = InputCapture(lambda rows: None, capacity=count * 2, measureLatency=True)
+    capture.moveEvent, capture.buttonEvent = MoveEvent, ButtonEvent
+    onKeyEvent = capture.timed(capture.onKeyEvent, capture.latency[0])
+    onMouseEvent = capture.timed(capture.onMouseEvent, capture.latency[1])
+
+    def putRing(event):
+        if isinstance(event, KeyEvent):
+            onKeyEvent(event)
+        else:
+            onMouseEvent(event)
+
+    dictLatency = capture.timed(appendDict, HookLatency())
+    dictTime = timeit(lambda: [dictLatency(event) for event in events])
+    ringTime = timeit(lambda: [putRing(event) for event in events])
+    print(f"dict append : {dictTime / count * 1e9:.1f} ns/event (incl. timing)")
+    print(f"ring buffer : {ringTime / count * 1e9:.1f} ns/event (incl. timing)")
+    for name, latency in zip(("key hook", "mouse hook"), capture.latency):
+        print(f"{name:<11} : {latency.summary()}")
+
+
+def encodeDicts(eventsRecord: list) -> str:
+    # 原先 __editing 中逐事件拼接字符串的文本化方式
+    contents = ""
+    lastTime = next(iter(eventsRecord[0].values()))['time']
+    for eventRecord in eventsRecord:
+        for eventType, record in eventRecord.items():
+            recordKey = record['key' if "key" in record else ('offset' if 'offset' in record else "delta")]
+            if eventType == "mouse" and (recordKey == "left" or recordKey == "right" or recordKey == "middle"):
+                recordKey = f"mouse {recordKey}"
+            contents += f"{int((record['time'] - lastTime) * 1000):04d}\n{recordKey}: {record['type']}\n"
+            lastTime = record['time']
+    return contents
+
+
+def decodeDicts(contents: str) -> list:
+    # 原先 setRecord 中逐行 ujson.loads 与 add*Record 的解析方式
+    eventsRecord, delay = [], 0
+    for line in contents.splitlines():
+        if len(line.strip()) == 0:
+            continue
+        if ':' in line:
+            baseTime = 0 if len(eventsRecord) == 0 else next(iter(eventsRecord[-1].values()))['time']
+            lineSplit = line.split(":")
+            recordKey, recordType = lineSplit[0].strip(), lineSplit[1].strip()
+            if recordType == "move":
+                eventsRecord.append({"mouse": {"offset": ujson.loads(recordKey), "type": "move", "time": baseTime + delay / 1000}})
+            elif recordType == "wheel":
+                eventsRecord.append({"mouse": {"delta": float(recordKey), "type": "wheel", "time": baseTime + delay / 1000}})
+            elif recordKey in {"mouse left", "mouse right", "mouse middle"}:
+                eventsRecord.append({"mouse": {"key": recordKey.replace("mouse ", ''), "type": recordType, "time": baseTime + delay / 1000}})
+            else:
+                eventsRecord.append({"key": {"key": recordKey, "type": recordType, "time": baseTime + delay / 1000}})
+            delay = 0
+        else:
+            delay = float(line.strip())
+    return eventsRecord
+
+
+def benchCodec(counts):
+    print(f"{'events':>10} {'encode ev/s':>12} {'decode ev/s':>12} {'MB/s':>8} {'old encode ev/s':>16} {'old decode ev/s':>16}")
+    for count in counts:
+        records = makeRecord(count, moveRatio=0.8)
+        store = EventStore.fromList(records)
+        encodeTime = timeit(lambda: encodeText(store))
+        contents = encodeText(store)
+        decodeTime = timeit(lambda: decodeText(contents))
+        decoded = decodeText(contents)
+        assert len(decoded) == count and encodeText(decoded) == contents, "round trip mismatch"
+
+        oldEncode = oldDecode = float("nan")
+        if count <= 100000:
+            oldEncodeTime = timeit(lambda: encodeDicts(records))
+            oldDecodeTime = timeit(lambda: decodeDicts(contents))
+            oldEncode, oldDecode = count / oldEncodeTime, count / oldDecodeTime
+        megabytes = len(contents.encode('utf-8')) / 1048576
+        print(f"{count:>10} {count / encodeTime:>12.0f} {count / decodeTime:>12.0f} {megabytes / (encodeTime + decodeTime):>8.1f} "
+              f"{oldEncode:>16.0f} {oldDecode:>16.0f}")
+
+
+def benchStartup(counts, events: int = 500):
+    # 在临时目录中生成宏文件, 测量 KeyMacroUI 构造并完成首次显示的耗时
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication([])
+    from keyMacroUI import KeyMacroUI
+
+    workDir = os.getcwd()
+    print(f"{'macros':>8} {'startup ms':>11} {'widgets':>8}")
+    for count in counts:
+        with tempfile.TemporaryDirectory() as folder:
+            record = EventStore.fromList(makeRecord(events))
+            keyMacros = {str(index): {"id": str(index), "title": "Script", "name": f"宏{index}", "record": record} for index in range(count)}
+            writeContainer(os.path.join(folder, "keyMacros.kmc"), keyMacros)
+            os.chdir(folder)
+            try:
+                began = time.perf_counter()
+                window = KeyMacroUI()
+                window.show()
+                app.processEvents()
+                elapsed = time.perf_counter() - began
+                print(f"{count:>8} {elapsed * 1000:>11.1f} {len(window.macroList.widgets):>8}")
+                window.close()
+                app.processEvents()
+            finally:
+                os.chdir(workDir)
+
+
+# 在新进程中执行, 逐阶段输出距脚本开始的毫秒数, 以及首次绘制时已导入的可延迟模块
+STARTUP_PROBE = """
+import os, sys, time
+began = time.perf_counter()
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+stages = {}
+from PySide6.QtCore import QObject, QEvent
+from PySide6.QtWidgets import QApplication
+import qfluentwidgets
+stages["qt"] = time.perf_counter()
+from keyMacroUI import KeyMacroUI
+stages["keyMacroUI"] = time.perf_counter()
+app = QApplication(sys.argv)
+stages["application"] = time.perf_counter()
+window = KeyMacroUI()
+stages["window"] = time.perf_counter()
+
+
+class PaintFilter(QObject):
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Type.Paint and "firstPaint" not in stages:
+            stages["firstPaint"] = time.perf_counter()
+            stages["lazy"] = [name for name in ("winsound", "keyboard", "mouse", "ujson") if name in sys.modules]
+            app.quit()
+        return False
+
+
+paintFilter = PaintFilter()
+app.installEventFilter(paintFilter)
+window.show()
+app.exec()
+lazy = stages.pop("lazy", [])
+print(" ".join(f"{name}={(value - began) * 1000:.1f}" for name, value in stages.items()), "loaded=" + ",".join(lazy))
+"""
+
+
+def parseImportTime(stderr: str, top: int) -> list:
+    # -X importtime 输出: import time: self [us] | cumulative | imported package, 缩进表示嵌套层级
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith(" ") or name.startswith("  "):
+            continue
+        entries.append((int(cumulative) / 1000, name.strip()))
+    return sorted(entries, reverse=True)[:top]
+
+
+def probeFailed(result) -> bool:
+    # 探测进程失败(如没有输入设备时 import keyboard 出错)时输出退出码与完整的错误信息
+    if result.returncode == 0:
+        return False
+    print(f"probe failed with exit code {result.returncode}")
+    print(result.stderr.strip() or "(no stderr)")
+    return True
+
+
+def benchImports(runs: int, top: int, macros: int = 100):
+    packageDir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", PYTHONPATH=os.pathsep.join(filter(None, [packageDir, os.environ.get("PYTHONPATH")])))
+    with tempfile.TemporaryDirectory() as folder:
+        record = EventStore.fromList(makeRecord(500))
+        keyMacros = {str(index): {"id": str(index), "title": "Script", "name": f"宏{index}", "record": record} for index in range(macros)}
+        writeContainer(os.path.join(folder, "keyMacros.kmc"), keyMacros)
+
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import keyMacroUI"], cwd=folder, env=env, capture_output=True, text=True)
+        if probeFailed(result):
+            return
+        print(f"{'cumulative ms':>14}  top-level import")
+        for cumulative, name in parseImportTime(result.stderr, top):
+            print(f"{cumulative:>14.1f}  {name}")
+
+        samples, walls, loaded = {}, [], ""
+        for _ in range(runs):
+            began = time.perf_counter()
+            result = subprocess.run([sys.executable, "-c", STARTUP_PROBE], cwd=folder, env=env, capture_output=True, text=True)
+            walls.append((time.perf_counter() - began) * 1000)
+            if probeFailed(result):
+                return
+            # 只取 name=value 形式的输出, 其余(如库打印的提示)忽略
+            for item in result.stdout.split():
+                name, separator, value = item.partition("=")
+                if not separator:
+                    continue
+                if name == "loaded":
+                    loaded = value
+                    continue
+                try:
+                    samples.setdefault(name, []).append(float(value))
+                except ValueError:
+                    continue
+        print(f"\n{'stage':>12} {'median ms':>10}  (since script start, {runs} runs, {macros} macros)")
+        for name, values in samples.items():
+            print(f"{name:>12} {statistics.median(values):>10.1f}")
+        print(f"{'process':>12} {statistics.median(walls):>10.1f}  (wall, including interpreter start and exit)")
+        print(f"modules {loaded or '-'} imported before first paint")
+
+
+def injectionErrors(keyMacro: KeyMacro, virtual) -> list:
+    # 以首个注入时刻为基准, 计算每个事件相对计划播放时间(经时间变换)的偏差(微秒), 升序排列
+    offsets = keyMacro.timeWarp.offsets(keyMacro.eventsRecord)
+    return sorted(abs(virtual.times[index] - virtual.times[0] - offsets[index]) * 1e6 for index in range(len(virtual)))
+
+
+def benchPlayback(events: int, speed: float):
+    # 通过虚拟设备播放, 无需桌面环境即可测量吞吐与每个事件相对计划时间的偏差
+    store = EventStore.fromList(makeRecord(events))
+    virtual = getBackend("virtual")
+    print(f"{'backend':>8} {'mode':>10} {'events/s':>11} {'p50 us':>8} {'p99 us':>8} {'max us':>8}")
+    for backend, keepInterval, isDeadline in (("null", False, False), ("virtual", False, False), ("virtual", True, False), ("virtual", True, True)):
+        keyMacro = KeyMacro(store)
+        keyMacro.backend, keyMacro.speed = backend, speed
+        keyMacro.getPlan()
+        virtual.clear()
+        began = time.perf_counter()
+        keyMacro.playRecord(keepInterval, isDeadline=isDeadline)
+        keyMacro.waitPlayed()
+        elapsed = time.perf_counter() - began
+        mode = "deadline" if isDeadline else ("sleep" if keepInterval else "burst")
+
+        percentiles = ("-", "-", "-")
+        if backend == "virtual" and keepInterval:
+            errors = injectionErrors(keyMacro, virtual)
+            percentiles = tuple(f"{value:.0f}" for value in (errors[len(errors) // 2], errors[int(len(errors) * 0.99)], errors[-1]))
+        print(f"{backend:>8} {mode:>10} {events / elapsed:>11.0f} {percentiles[0]:>8} {percentiles[1]:>8} {percentiles[2]:>8}")
+
+
+# 合成宏的种类: (移动事件占比, 非移动事件中按键事件的占比)
+SUITE_PROFILES = {
+    "key": (0.0, 1.0),
+    "mouse": (0.98, 0.5),
+    "mixed": (0.5, 0.5)
+}
+# 指标: (是否越大越好, 默认允许的退化比例, 忽略的绝对变化量), 比例为 None 的指标只记录不检查
+# 抖动与毫秒级耗时受系统调度影响大, 变化量小于第三项时不算退化
+SUITE_METRICS = {
+    "burstRate": (True, 0.2, 0),
+    "timedRate": (True, None, 0),
+    "jitterP50Us": (False, 1.0, 200),
+    "jitterP99Us": (False, 1.0, 1000),
+    "jitterMaxUs": (False, None, 0),
+    "recordRate": (True, 0.2, 0),
+    "jsonSaveMs": (False, 0.25, 5),
+    "jsonLoadMs": (False, 0.25, 5),
+    "containerSaveMs": (False, 0.25, 5),
+    "containerLoadMs": (False, 0.25, 5),
+    "peakMB": (False, 0.1, 0.5)
+}
+
+
+def measureJitter(keyMacro: KeyMacro, virtual) -> dict:
+    errors = injectionErrors(keyMacro, virtual)
+    return {
+        "jitterP50Us": errors[len(errors) // 2],
+        "jitterP99Us": errors[min(len(errors) - 1, int(len(errors) * 0.99))],
+        "jitterMaxUs": errors[-1]
+    }
+
+
+def measureRecording(records: list) -> float:
+    # 构造事件对象依次调用钩子回调, 每 4096 个事件整理一次, 返回每秒录制的事件数
+    events = []
+    for record in records:
+        eventType, eventRecord = next(iter(record.items()))
+        if eventRecord['type'] == "move":
+            events.append(MoveEvent(*eventRecord['offset'], eventRecord['time']))
+        elif eventType == "key":
+            events.append(KeyEvent(eventRecord['type'], eventRecord['key'], eventRecord['time']))
+        else:
+            events.append(ButtonEvent(eventRecord['type'], eventRecord['key'], eventRecord['time']))
+
+    store = EventStore()
+
+    def sink(rows):
+        for stamp, kind, name, x, y, delta in rows:
+            store.appendKind(kind, stamp, name, x, y, delta)
+
+    capture = InputCapture(sink, capacity=8192)
+    capture.moveEvent, capture.buttonEvent = MoveEvent, ButtonEvent
+    began = time.perf_counter()
+    for index, event in enumerate(events):
+        if isinstance(event, KeyEvent):
+            capture.onKeyEvent(event)
+        else:
+            capture.onMouseEvent(event)
+        if index & 4095 == 4095:
+            capture.drain(float("inf"))
+    capture.drain(float("inf"))
+    elapsed = time.perf_counter() - began
+    assert len(store) == len(events), "recording lost events"
+    return len(events) / elapsed
+
+
+def runSuiteCase(profile: str, count: int, timedSeconds: float, timedLimit: int, folder: Path) -> dict:
+    moveRatio, keyRatio = SUITE_PROFILES[profile]
+    records = makeRecord(count, moveRatio=moveRatio, keyRatio=keyRatio)
+    store = EventStore.fromList(records)
+    virtual = getBackend("virtual")
+    result = {}
+
+    keyMacro = KeyMacro(store)
+    keyMacro.backend = "virtual"
+    keyMacro.getPlan()
+    virtual.clear()
+    result["burstRate"] = count / timeit(lambda: (keyMacro.playRecord(False), keyMacro.waitPlayed()))
+
+    if count <= timedLimit:
+        # 按倍速把整段播放压缩到约 timedSeconds 秒
+        keyMacro.speed = max(1.0, (store.lastTime - store.firstTime) / timedSeconds)
+        keyMacro.getPlan()
+        virtual.clear()
+        result["timedRate"] = count / timeit(lambda: (keyMacro.playRecord(True), keyMacro.waitPlayed()))
+        result.update(measureJitter(keyMacro, virtual))
+    virtual.clear()
+
+    result["recordRate"] = measureRecording(records)
+
+    jsonPath, containerPath = folder / f"{profile}{count}.json", folder / f"{profile}{count}.kmc"
+    keyMacros = {"0": {"id": "0", "title": "Script", "name": profile, "record": store}}
+    result["jsonSaveMs"] = timeit(lambda: dumpJson(jsonPath, {"0": dict(keyMacros["0"], record=store.toList())})) * 1000
+    result["jsonLoadMs"] = timeit(lambda: EventStore.fromList(loadJson(jsonPath)["0"]["record"])) * 1000
+    result["containerSaveMs"] = timeit(lambda: writeContainer(containerPath, keyMacros)) * 1000
+
+    def loadContainer():
+        container = MacroContainer(containerPath)
+        try:
+            return container.loadRecord("0")
+        finally:
+            container.close()
+
+    result["containerLoadMs"] = timeit(loadContainer) * 1000
+
+    # 从 json 载入到生成播放计划过程中的内存峰值
+    del records, store, keyMacro, keyMacros
+    gc.collect()
+    tracemalloc.start()
+    try:
+        keyMacro = KeyMacro(EventStore.fromList(loadJson(jsonPath)["0"]["record"]))
+        keyMacro.backend = "null"
+        keyMacro.getPlan()
+        result["peakMB"] = tracemalloc.get_traced_memory()[1] / 1048576
+    finally:
+        tracemalloc.stop()
+    return result
+
+
+def compareResults(results: dict, baseline: dict, thresholds: dict) -> list:
+    # 返回超出允许退化比例的 (用例, 指标, 基准值, 当前值, 变化比例)
+    regressions = []
+    for case, metrics in results.items():
+        for metric, value in metrics.items():
+            baseValue = baseline.get(case, {}).get(metric)
+            threshold = thresholds.get(metric)
+            if baseValue is None or threshold is None or baseValue <= 0:
+                continue
+            higherIsBetter, _, floor = SUITE_METRICS[metric]
+            difference = baseValue - value if higherIsBetter else value - baseValue
+            change = difference / baseValue
+            if change > threshold and difference > floor:
+                regressions.append((case, metric, baseValue, value, change))
+    return regressions
+
+
+def benchSuite(profiles, counts, output: str, baseline: str = None, overrides: list = (), timedSeconds: float = 2.0, timedLimit: int = 100000) -> int:
+    thresholds = {metric: threshold for metric, (_, threshold, _) in SUITE_METRICS.items()}
+    for override in overrides:
+        metric, _, value = override.partition("=")
+        if metric not in SUITE_METRICS:
+            raise SystemExit(f"unknown metric: {metric}")
+        thresholds[metric] = None if value in {"", "none"} else float(value)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for profile in profiles:
+            for count in counts:
+                case = f"{profile}/{count}"
+                results[case] = runSuiteCase(profile, count, timedSeconds, timedLimit, Path(folder))
+                metrics = results[case]
+                print(f"{case:>14}  burst {metrics['burstRate']:>10.0f} ev/s  record {metrics['recordRate']:>10.0f} ev/s  "
+                      f"p99 {metrics.get('jitterP99Us', float('nan')):>7.0f} us  json {metrics['jsonLoadMs']:>8.1f}/{metrics['jsonSaveMs']:.1f} ms  "
+                      f"kmc {metrics['containerLoadMs']:>7.1f}/{metrics['containerSaveMs']:.1f} ms  peak {metrics['peakMB']:>7.1f} MB")
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "thresholds": thresholds,
+        "results": results
+    }
+    dumpJson(output, report)
+    print(f"results written to {output}")
+
+    if baseline is None:
+        return 0
+    regressions = compareResults(results, loadJson(Path(baseline))["results"], thresholds)
+    for case, metric, baseValue, value, change in regressions:
+        print(f"REGRESSION {case} {metric}: {baseValue:.1f} -> {value:.1f} ({change:+.0%})")
+    if len(regressions) == 0:
+        print(f"no regressions against {baseline}")
+    return 1 if regressions else 0
+
+
+def benchBatch(count: int, windows, repeat: int = 3):
+    # 鼠标密集的宏在不同合批窗口下的每事件开销(不保留间隔, 只测派发本身)
+    store = EventStore.fromList(makeRecord(count, moveRatio=0.98))
+    virtual = getBackend("virtual")
+    print(f"{'window ms':>10} {'collapse':>9} {'plan items':>11} {'injected':>9} {'null ns/ev':>11} {'virtual ns/ev':>14}")
+    configs = [(None, False)] + [(window, False) for window in windows] + [(window, True) for window in windows if window > 0]
+    for window, collapseMoves in configs:
+        costs = {}
+        for backend in ("null", "virtual"):
+            keyMacro = KeyMacro(store)
+            keyMacro.backend, keyMacro.batchWindow, keyMacro.collapseMoves = backend, None if window is None else window / 1000, collapseMoves
+            plan = keyMacro.getPlan()
+            elapsed = []
+            for _ in range(repeat):
+                virtual.clear()
+                elapsed.append(timeit(lambda: (keyMacro.playRecord(False), keyMacro.waitPlayed())))
+            costs[backend] = min(elapsed) / count * 1e9
+        injected = len(virtual)
+        label = "off" if window is None else f"{window:g}"
+        print(f"{label:>10} {str(collapseMoves):>9} {len(plan):>11} {injected:>9} {costs['null']:>11.1f} {costs['virtual']:>14.1f}")
+
+
+def benchStats(count: int, repeat: int = 3):
+    # 运行统计关闭、开启、开启并写跟踪文件时的每事件播放开销(null 后端, 不保留间隔)
+    keyMacro = KeyMacro(EventStore.fromList(makeRecord(count)))
+    keyMacro.backend = "null"
+    keyMacro.getPlan()
+    print(f"{'stats':>8} {'ns/event':>9} {'overhead':>9}")
+    with tempfile.TemporaryDirectory() as folder:
+        baseline = None
+        for mode in ("off", "on", "trace"):
+            elapsed = []
+            for _ in range(repeat):
+                if mode != "off":
+                    perfStats.enableStats(Path(folder) / "trace.jsonl" if mode == "trace" else None)
+                elapsed.append(timeit(lambda: (keyMacro.playRecord(False), keyMacro.waitPlayed())))
+                perfStats.disableStats()
+            cost = min(elapsed) / count * 1e9
+            baseline = cost if baseline is None else baseline
+            print(f"{mode:>8} {cost:>9.1f} {cost - baseline:>+9.1f}")
+
+
+class SlowHandler(logging.Handler):
+    # 模拟慢速磁盘或控制台, 每条日志耗时 delay 秒
+    def __init__(self, delay: float):
+        super().__init__()
+        self.delay = delay
+
+    def emit(self, record):
+        self.format(record)
+        time.sleep(self.delay)
+
+
+def benchLogging(events: int, speed: float, slowMs: float):
+    # 逐事件输出 debug 日志时的播放时间偏差: 直接写慢速处理器 vs 经队列由后台线程写
+    keyMacro = KeyMacro(EventStore.fromList(makeRecord(events)))
+    keyMacro.backend, keyMacro.speed = "virtual", speed
+    keyMacro.getPlan()
+    virtual, scheduler = getBackend("virtual"), getScheduler()
+    level, handlers = logger.level, logger.handlers[:]
+    # 先空跑一轮, 避免调度线程启动等一次性开销计入第一种模式
+    keyMacro.playRecord(False)
+    keyMacro.waitPlayed()
+    print(f"{'logging':>8} {'p50 us':>8} {'p99 us':>8} {'max us':>8}")
+    try:
+        logger.setLevel(logging.DEBUG)
+        for mode in ("off", "sync", "queue"):
+            logger.handlers.clear()
+            listener = None
+            if mode == "sync":
+                logger.addHandler(SlowHandler(slowMs / 1000))
+            elif mode == "queue":
+                queueHandler, listener = createQueueHandler(SlowHandler(slowMs / 1000))
+                logger.addHandler(queueHandler)
+            scheduler.logEvents = mode != "off"
+            virtual.clear()
+            keyMacro.playRecord(True)
+            keyMacro.waitPlayed()
+            jitter = measureJitter(keyMacro, virtual)
+            print(f"{mode:>8} {jitter['jitterP50Us']:>8.0f} {jitter['jitterP99Us']:>8.0f} {jitter['jitterMaxUs']:>8.0f}")
+            if listener is not None:
+                listener.stop()
+    finally:
+        scheduler.logEvents = False
+        logger.setLevel(level)
+        logger.handlers[:] = handlers
+
+
+HotkeyEvent = namedtuple("HotkeyEvent", ["event_type", "scan_code", "name"])
+
+
+def benchHotkeys(counts, events: int = 100000):
+    # 每个按键事件的匹配开销: 逐个检查已注册的快捷键 vs 单钩子字典索引
+    def linear(bindings, modifiers, event):
+        for bindModifiers, scanCode, callback in bindings:
+            if bindModifiers == modifiers and scanCode == event.scan_code:
+                return callback
+        return None
+
+    # 不命中任何快捷键的普通按键(占绝大多数)
+    stream = [HotkeyEvent(eventType, 1000000 + index % 50, "x") for index in range(events // 2) for eventType in ("down", "up")]
+    print(f"{'bindings':>9} {'linear ns/ev':>13} {'indexed ns/ev':>14}")
+    for count in counts:
+        dispatcher = HotkeyDispatcher()
+        bindings = []
+        for index in range(count):
+            # 扫描码从 1000 开始, 避开修饰键判断
+            modifiers, scanCode = index % 16, 1000 + index // 16
+            dispatcher.bindKeys(str(index), f"#{index}", modifiers, (scanCode,), noop)
+            bindings.append((modifiers, scanCode, noop))
+        linearCost = timeit(lambda: [linear(bindings, 0, event) for event in stream]) / len(stream) * 1e9
+        indexedCost = timeit(lambda: [dispatcher.onKeyEvent(event) for event in stream]) / len(stream) * 1e9
+        print(f"{count:>9} {linearCost:>13.0f} {indexedCost:>14.0f}")
+
+
+def makeCorpus(macros: int, seed: int = 0) -> dict:
+    # 模拟常见的宏集合: 各宏由共用的操作片段(登录、菜单导航等)与各自录制的部分拼接而成
+    rand = random.Random(seed)
+    library = []
+    for index in range(8):
+        sequence = EventStore.fromList(makeRecord(rand.randint(100, 600), moveRatio=rand.choice([0.0, 0.5, 0.9]), seed=1000 + index))
+        library.append(sequence)
+    keyMacros = {}
+    for index in range(macros):
+        store, now = EventStore(), rand.uniform(1e5, 1e6)
+        parts = [EventStore.fromList(makeRecord(rand.randint(50, 400), seed=seed * 100000 + index))]
+        parts += rand.sample(library, rand.randint(1, 3))
+        rand.shuffle(parts)
+        for part in parts:
+            begin = part.firstTime
+            now += rand.uniform(0.1, 1.0)
+            for row in range(len(part)):
+                store.appendKind(part.kinds[row], now + part.times[row] - begin, part.keyNames[part.keys[row]], part.xs[row], part.ys[row], part.deltas[row])
+            now = store.lastTime
+        keyMacros[str(index)] = {"id": str(index), "title": "Script", "name": f"macro{index}", "record": store}
+    return keyMacros
+
+
+def benchSegments(counts):
+    # 分片去重: 文件大小、去重率与全部宏的保存/载入耗时, 并检查拼接后与原记录一致
+    print(f"{'macros':>7} {'events':>9} {'flat KB':>8} {'seg KB':>8} {'dedup':>6} {'save ms':>13} {'load ms':>13} {'max err us':>11}")
+    with tempfile.TemporaryDirectory() as folder:
+        for count in counts:
+            keyMacros = makeCorpus(count)
+            events = sum(len(macroConfig['record']) for macroConfig in keyMacros.values())
+            sizes, saves, loads, loaded = {}, {}, {}, {}
+            for segmented in (False, True):
+                path = Path(folder) / f"corpus{count}{'s' if segmented else ''}.kmc"
+                saves[segmented] = timeit(lambda: writeContainer(path, keyMacros, segmented)) * 1000
+                sizes[segmented] = path.stat().st_size / 1024
+
+                def loadAll():
+                    container = MacroContainer(path)
+                    try:
+                        loaded[segmented] = {macroID: container.loadRecord(macroID) for macroID in container.index}
+                        return container.segmentReport()
+                    finally:
+                        container.close()
+
+                began = time.perf_counter()
+                report = loadAll()
+                loads[segmented] = (time.perf_counter() - began) * 1000
+            maxError = 0
+            for macroID, macroConfig in keyMacros.items():
+                original, assembled = macroConfig['record'], loaded[True][macroID]
+                assert len(original) == len(assembled) and original.kinds == assembled.kinds and original.xs == assembled.xs
+                assert [original.keyNames[code] for code in original.keys] == [assembled.keyNames[code] for code in assembled.keys]
+                maxError = max(maxError, max(abs(a - b) for a, b in zip(original.times, assembled.times)) * 1e6)
+            print(f"{count:>7} {events:>9} {sizes[False]:>8.0f} {sizes[True]:>8.0f} {report['dedupRatio']:>6.2f} "
+                  f"{saves[False]:>6.0f}/{saves[True]:<6.0f} {loads[False]:>6.0f}/{loads[True]:<6.0f} {maxError:>11.2f}")
+
+
+def benchEditor(counts):
+    # 修改中间一页的一个延迟: 整体编码+解析 vs 只编码该页并应用改动的行; 打开编辑器时的编码耗时同样对比
+    print(f"{'events':>9} {'open full ms':>13} {'open page ms':>13} {'save full ms':>13} {'save page ms':>13} {'validate ms':>12}")
+    for count in counts:
+        store = EventStore.fromList(makeRecord(count))
+        page = pageCount(store) // 2
+        openFull = timeit(lambda: encodeText(store)) * 1000
+        openPage = timeit(lambda: encodePage(store, page)) * 1000
+        lines = encodePage(store, page).splitlines()
+        lines[PAGE_EVENTS] = f"{int(lines[PAGE_EVENTS]) + 100:04d}"
+        text = "\n".join(lines)
+        validate = timeit(lambda: validateText(text)) * 1000
+
+        def saveFull():
+            contents = encodeText(store).splitlines()
+            contents[page * PAGE_EVENTS * 2 + PAGE_EVENTS] = lines[PAGE_EVENTS]
+            return decodeText("\n".join(contents))
+
+        expected = saveFull()
+        untouched = [encodePage(store, other) for other in range(pageCount(store)) if other != page]
+        savePage = timeit(lambda: applyPage(store, page, text)) * 1000
+        assert [encodePage(store, other) for other in range(pageCount(store)) if other != page] == untouched, "untouched pages changed"
+        saveFullTime = timeit(saveFull) * 1000
+        # 整体解析会把所有时间取整到毫秒, 只比较事件本身与修改的那一行
+        assert len(expected) == len(store) and expected.kinds == store.kinds, "event mismatch"
+        assert encodePage(store, page).splitlines()[PAGE_EVENTS] == lines[PAGE_EVENTS], "edited line mismatch"
+        print(f"{count:>9} {openFull:>13.1f} {openPage:>13.2f} {saveFullTime:>13.1f} {savePage:>13.2f} {validate:>12.2f}")
+
+
+def benchWorker(counts, tick: float = 0.001):
+    # 解析整段脚本: 在"界面线程"中直接执行 vs 交给工作线程; 后者模拟界面事件循环每 tick 秒处理一次投递, 记录最长停顿
+    print(f"{'events':>9} {'inline ms':>10} {'worker ms':>10} {'max stall ms':>13} {'p99 stall ms':>13}")
+    for count in counts:
+        contents = encodeText(EventStore.fromList(makeRecord(count)))
+        inline = timeit(lambda: decodeText(contents)) * 1000
+
+        posted = []
+        pool = WorkerPool(2, posted.append)
+        try:
+            results, stalls = [], []
+            began = last = time.perf_counter()
+            job = pool.submit(lambda job: decodeRecord(job.iterate(io.StringIO(contents), contents.count("\n") + 1)), onDone=results.append, onProgress=lambda progress: None)
+            while not results:
+                time.sleep(tick)
+                now = time.perf_counter()
+                stalls.append(now - last)
+                last = now
+                while posted:
+                    posted.pop(0)()
+            elapsed = (time.perf_counter() - began) * 1000
+        finally:
+            pool.shutdown()
+        assert len(results[0]) == count and job.state == "done"
+        stalls.sort()
+        print(f"{count:>9} {inline:>10.1f} {elapsed:>10.1f} {stalls[-1] * 1000:>13.2f} {stalls[int(len(stalls) * 0.99)] * 1000:>13.2f}")
+
+
+FILTER_CONFIGS = {
+    "stripHotkeys": [{"type": "stripHotkeys", "hotkeys": ["ctrl+alt+f9", "ctrl+alt+f10", "ctrl+alt+f11"]}],
+    "collapseRepeats": [{"type": "collapseRepeats"}],
+    "keys": [{"type": "keys", "deny": ["f1", "f2"]}],
+    "region": [{"type": "region", "region": [0, 0, 1919, 1079]}],
+    "dedupe": [{"type": "dedupe"}],
+}
+
+
+def benchFilters(counts, batch: int = 64):
+    # 录制过滤在整理线程中按批执行(每批约为一次整理间隔的事件数), 钩子回调不变; 对比不过滤与各级/全部过滤器的每事件耗时
+    configs = dict(FILTER_CONFIGS, all=[config for configs in FILTER_CONFIGS.values() for config in configs])
+    # 被抑制的快捷键停止录制: 只收到 ctrl、alt 按下, 收不到 f9 与释放, 记录中不应留下没有释放的修饰键
+    pipeline = FilterPipeline.fromConfig([{"type": "stripHotkeys", "hotkeys": ["ctrl+alt+f9"]}])
+    stopped = [(0.0, KEY_DOWN, "a", 0, 0, 0), (0.1, KEY_UP, "a", 0, 0, 0), (0.2, KEY_DOWN, "ctrl", 0, 0, 0),
+               (0.3, KEY_DOWN, "alt", 0, 0, 0), (0.4, MOUSE_MOVE, None, 5, 5, 0)]
+    output = pipeline.process(stopped) + pipeline.finish()
+    assert output == [stopped[0], stopped[1], stopped[4]], f"快捷键停止录制后残留修饰键: {output}"
+    print(f"{'events':>9} {'stage':>16} {'us/ev':>7} {'removed':>8}")
+    for count in counts:
+        rows = list(recordRows(EventStore.fromList(makeRecord(count))))
+        batches = [rows[index:index + batch] for index in range(0, len(rows), batch)]
+        baseline = min(timeit(lambda: [list(rows) for rows in batches]) for _ in range(3))
+        print(f"{count:>9} {'(none)':>16} {baseline / count * 1e6:>7.3f} {0:>8}")
+        for name, config in configs.items():
+            pipeline = FilterPipeline.fromConfig(config)
+
+            def run():
+                pipeline.reset()
+                for rows in batches:
+                    pipeline.process(rows)
+                pipeline.finish()
+
+            elapsed = min(timeit(run) for _ in range(3))
+            print(f"{count:>9} {name:>16} {elapsed / count * 1e6:>7.3f} {pipeline.report.removed:>8}")
+
+
+def measurePeak(func) -> tuple[int, float]:
+    # 返回 (执行期间的内存峰值字节数, 耗时秒)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        began = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - began
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak, elapsed
+
+
+def benchCompose(repeats, events: int = 1000):
+    # 组合宏: "@repeat N / @call base / @end" 按需展开 vs 先完整展开再编译, 遍历整个播放计划的内存峰值与耗时
+    # @end 前与两个 @call 之间的延迟都应保留: pair 为相隔 10 毫秒的按下与释放
+    pair = EventStore()
+    pair.appendKind(KEY_DOWN, 0.0, "a")
+    pair.appendKind(KEY_UP, 0.01, "a")
+    for script, expected in (("@repeat 3\n@call pair\n0010\n@end\n", [0, 10, 20, 30, 40, 50]),
+                             ("@call pair\n0010\n@call pair\n", [0, 10, 20, 30])):
+        times = [round(stamp * 1000) for stamp, _, _ in linkProgram(parseText(script), lambda target: ("pair", pair)).rows(0.0)]
+        assert times == expected, f"延迟丢失: {script!r} -> {times}"
+    base = EventStore.fromList(makeRecord(events))
+    handlers = getBackend("null").kindHandlers()
+    resolve = lambda target: ("base", base)
+    print(f"{'repeats':>8} {'events':>10} {'lazy MB':>8} {'flat MB':>8} {'lazy us/ev':>11} {'flat us/ev':>11}")
+    for repeat in repeats:
+        program = linkProgram(parseText(f"@repeat {repeat}\n@call base\n0100\n@end\n"), resolve)
+        count = program.count
+        lastItems = {}
+
+        def lazy():
+            plan = LazyPlan(program, handlers)
+            for index in range(len(plan)):
+                item = plan[index]
+            lastItems["lazy"] = item
+
+        def flat():
+            plan = compilePlan(flattenProgram(program), getBackend("null").handlerTable())
+            for item in plan:
+                pass
+            lastItems["flat"] = item
+
+        lazyPeak, lazyTime = measurePeak(lazy)
+        flatPeak, flatTime = measurePeak(flat)
+        assert abs(lastItems["lazy"][0] - lastItems["flat"][0]) < 1e-6 and lastItems["lazy"][2] == lastItems["flat"][2], "plan mismatch"
+        print(f"{repeat:>8} {count:>10} {lazyPeak / 1048576:>8.2f} {flatPeak / 1048576:>8.2f} "
+              f"{lazyTime / count * 1e6:>11.2f} {flatTime / count * 1e6:>11.2f}")
+
+
+def timeit(func) -> float:
+    began = time.perf_counter()
+    func()
+    return time.perf_counter() - began
+
+
+def main():
+    parser = argparse.ArgumentParser(description="keyMacro benchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    memoryParser = subparsers.add_parser("memory", help="事件存储内存占用: 字典列表 vs 列存储")
+    memoryParser.add_argument("--events", type=int, nargs="+", default=[10000, 100000, 1000000])
+
+    dispatchParser = subparsers.add_parser("dispatch", help="播放派发开销: 字典逐事件查找 vs 预编译计划")
+    dispatchParser.add_argument("--events", type=int, nargs="+", default=[10000, 100000])
+
+    hookParser = subparsers.add_parser("hook", help="录制钩子回调耗时: 字典追加 vs 环形缓冲")
+    hookParser.add_argument("--events", type=int, default=100000)
+
+    startupParser = subparsers.add_parser("startup", help="界面启动耗时与宏数量的关系")
+    startupParser.add_argument("--macros", type=int, nargs="+", default=[10, 100, 1000])
+
+    suiteParser = subparsers.add_parser("suite", help="播放/录制/读写的综合基准, 结果写入 json 并可与基准结果对比")
+    suiteParser.add_argument("--profiles", nargs="+", choices=sorted(SUITE_PROFILES), default=list(SUITE_PROFILES))
+    suiteParser.add_argument("--events", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    suiteParser.add_argument("--output", default="benchmark.json")
+    suiteParser.add_argument("--baseline", default=None, help="之前的结果文件, 超出阈值的退化以非零状态码退出")
+    suiteParser.add_argument("--threshold", action="append", default=[], metavar="METRIC=RATIO", help="覆盖默认阈值, 如 burstRate=0.1, 或 jitterP99Us=none 不检查")
+    suiteParser.add_argument("--timedSeconds", type=float, default=2.0, help="计时播放被压缩到的时长(秒)")
+    suiteParser.add_argument("--timedLimit", type=int, default=100000, help="超过该事件数时跳过计时播放")
+
+    batchParser = subparsers.add_parser("batch", help="合批注入: 鼠标密集宏的每事件开销")
+    batchParser.add_argument("--events", type=int, default=200000)
+    batchParser.add_argument("--windows", type=float, nargs="+", default=[0, 4, 16], help="合批窗口(毫秒)")
+
+    playbackParser = subparsers.add_parser("playback", help="虚拟设备播放: 吞吐与时间偏差")
+    playbackParser.add_argument("--events", type=int, default=5000)
+    playbackParser.add_argument("--speed", type=float, default=10.0)
+
+    statsParser = subparsers.add_parser("stats", help="运行统计关闭/开启时的播放每事件开销")
+    statsParser.add_argument("--events", type=int, default=100000)
+
+    loggingParser = subparsers.add_parser("logging", help="逐事件日志对播放时间偏差的影响: 同步写 vs 队列写")
+    loggingParser.add_argument("--events", type=int, default=2000)
+    loggingParser.add_argument("--speed", type=float, default=5.0)
+    loggingParser.add_argument("--slowMs", type=float, default=2.0, help="模拟的每条日志写入耗时(毫秒)")
+
+    hotkeysParser = subparsers.add_parser("hotkeys", help="快捷键匹配: 每个按键事件的开销与绑定数量的关系")
+    hotkeysParser.add_argument("--bindings", type=int, nargs="+", default=[10, 100, 1000, 10000])
+
+    segmentsParser = subparsers.add_parser("segments", help="分片去重: 文件大小、去重率与保存/载入耗时(普通/分片)")
+    segmentsParser.add_argument("--macros", type=int, nargs="+", default=[20, 100, 500])
+
+    workerParser = subparsers.add_parser("worker", help="后台任务: 解析大脚本时界面线程的最长停顿(直接执行 vs 工作线程)")
+    workerParser.add_argument("--events", type=int, nargs="+", default=[10000, 100000, 500000])
+
+    filtersParser = subparsers.add_parser("filters", help="录制过滤: 整理线程中各级过滤器的每事件开销")
+    filtersParser.add_argument("--events", type=int, nargs="+", default=[100000, 1000000])
+
+    editorParser = subparsers.add_parser("editor", help="分页编辑: 打开与保存一处修改的耗时(整体 vs 分页)")
+    editorParser.add_argument("--events", type=int, nargs="+", default=[10000, 100000, 200000])
+
+    composeParser = subparsers.add_parser("compose", help="组合宏: 按需展开 vs 完整展开的内存峰值与每事件耗时")
+    composeParser.add_argument("--repeats", type=int, nargs="+", default=[10, 100, 1000])
+    composeParser.add_argument("--events", type=int, default=1000)
+
+    importsParser = subparsers.add_parser("imports", help="冷启动: 各顶层模块导入耗时与首次绘制时间")
+    importsParser.add_argument("--runs", type=int, default=5)
+    importsParser.add_argument("--top", type=int, default=15)
+
+    codecParser = subparsers.add_parser("codec", help="脚本文本编码/解码往返吞吐")
+    codecParser.add_argument("--events", type=int, nargs="+", default=[10000, 100000, 1000000])
+
+    args = parser.parse_args()
+    if args.command == "memory":
+        benchMemory(args.events)
+    elif args.command == "dispatch":
+        benchDispatch(args.events)
+    elif args.command == "hook":
+        benchHook(args.events)
+    elif args.command == "codec":
+        benchCodec(args.events)
+    elif args.command == "suite":
+        sys.exit(benchSuite(args.profiles, args.events, args.output, args.baseline, args.threshold, args.timedSeconds, args.timedLimit))
+    elif args.command == "batch":
+        benchBatch(args.events, args.windows)
+    elif args.command == "playback":
+        benchPlayback(args.events, args.speed)
+    elif args.command == "stats":
+        benchStats(args.events)
+    elif args.command == "logging":
+        benchLogging(args.events, args.speed, args.slowMs)
+    elif args.command == "hotkeys":
+        benchHotkeys(args.bindings)
+    elif args.command == "segments":
+        benchSegments(args.macros)
+    elif args.command == "worker":
+        benchWorker(args.events)
+    elif args.command == "filters":
+        benchFilters(args.events)
+    elif args.command == "editor":
+        benchEditor(args.events)
+    elif args.command == "compose":
+        benchCompose(args.repeats, args.events)
+    elif args.command == "imports":
+        benchImports(args.runs, args.top)
+    elif args.command == "startup":
+        benchStartup(args.macros)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import struct
+import sys
+import threading
+
+from array import array
+
+import ujson
+
+# (eventType, type) 与事件种类编号的对应, 编号即 kinds 列中的值
+KINDS = (
+    ("key", "up"),
+    ("key", "down"),
+    ("mouse", "up"),
+    ("mouse", "down"),
+    ("mouse", "double"),
+    ("mouse", "move"),
+    ("mouse", "wheel"),
+)
+KIND_INDEX = {kind: index for index, kind in enumerate(KINDS)}
+
+KEY_UP, KEY_DOWN, MOUSE_UP, MOUSE_DOWN, MOUSE_DOUBLE, MOUSE_MOVE, MOUSE_WHEEL = range(len(KINDS))
+
+# 界面线程原地修改事件记录(如分页编辑)时持有; 其他线程在锁内复制记录, 释放后再使用副本, 不会读到修改到一半的记录
+recordLock = threading.Lock()
+
+# 二进制格式: 事件数、按键名表长度, 按键名表(json), 之后依次为各列的小端字节
+BYTES_HEADER = struct.Struct('<II')
+
+
+class Event:
+    __slots__ = ("eventType", "type", "key", "time")
+
+    def __init__(self, eventType: str, type: str, key, time: float):
+        self.eventType = eventType
+        self.type = type
+        self.key = key
+        self.time = time
+
+    def __repr__(self):
+        return str(self.toDict())
+
+    def __eq__(self, other):
+        if not isinstance(other, Event):
+            return NotImplemented
+        return (self.eventType, self.type, self.key, self.time) == (other.eventType, other.type, other.key, other.time)
+
+    def toDict(self) -> dict:
+        if self.type == "move":
+            return {self.eventType: {"offset": list(self.key), "type": self.type, "time": self.time}}
+        if self.type == "wheel":
+            return {self.eventType: {"delta": self.key, "type": self.type, "time": self.time}}
+        return {self.eventType: {"key": self.key, "type": self.type, "time": self.time}}
+
+    @classmethod
+    def fromDict(cls, record: dict):
+        eventType, eventRecord = next(iter(record.items()))
+        key = eventRecord['key' if "key" in eventRecord else ('offset' if 'offset' in eventRecord else "delta")]
+        return cls(eventType, eventRecord['type'], key, eventRecord['time'])
+
+
+# 按列存储的事件记录, 每个事件只占用各类型数组中的一格
+class EventStore:
+    __slots__ = ("times", "kinds", "keys", "xs", "ys", "deltas", "keyNames", "keyIndex", "version")
+
+    def __init__(self):
+        self.times = array('d')
+        self.kinds = array('B')
+        self.keys = array('H')
+        self.xs = array('i')
+        self.ys = array('i')
+        self.deltas = array('d')
+        # 按键名字符串表, keys 列只存下标, 0 号固定为空
+        self.keyNames = [None]
+        self.keyIndex = {None: 0}
+        # 每次修改递增, 供播放计划等缓存判断是否失效
+        self.version = 0
+
+    def __len__(self):
+        return len(self.times)
+
+    def __iter__(self):
+        for index in range(len(self.times)):
+            yield self.event(index)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.take(range(*index.indices(len(self.times))))
+        if index < 0:
+            index += len(self.times)
+        if not 0 <= index < len(self.times):
+            raise IndexError("event index out of range")
+        return self.event(index)
+
+    def __repr__(self):
+        return str(self.toList())
+
+    @property
+    def firstTime(self) -> float:
+        return self.times[0] if len(self.times) > 0 else 0
+
+    @property
+    def lastTime(self) -> float:
+        return self.times[-1] if len(self.times) > 0 else 0
+
+    def keyCode(self, key) -> int:
+        code = self.keyIndex.get(key)
+        if code is None:
+            code = len(self.keyNames)
+            self.keyNames.append(key)
+            self.keyIndex[key] = code
+        return code
+
+    def value(self, index: int):
+        kind = self.kinds[index]
+        if kind == MOUSE_MOVE:
+            return self.xs[index], self.ys[index]
+        if kind == MOUSE_WHEEL:
+            return self.deltas[index]
+        return self.keyNames[self.keys[index]]
+
+    def event(self, index: int) -> Event:
+        eventType, type = KINDS[self.kinds[index]]
+        return Event(eventType, type, self.value(index), self.times[index])
+
+    def appendKind(self, kind: int, time: float, key=None, x: int = 0, y: int = 0, delta: float = 0):
+        self.times.append(time)
+        self.kinds.append(kind)
+        self.keys.append(self.keyCode(key))
+        self.xs.append(x)
+        self.ys.append(y)
+        self.deltas.append(delta)
+        self.version += 1
+
+    def append(self, eventType: str, type: str, key, time: float):
+        kind = KIND_INDEX.get((eventType, type))
+        if kind is None:
+            raise ValueError(f"unknown event {eventType} {type}")
+        if kind == MOUSE_MOVE:
+            self.appendKind(kind, time, x=int(key[0]), y=int(key[1]))
+        elif kind == MOUSE_WHEEL:
+            self.appendKind(kind, time, delta=key)
+        else:
+            self.appendKind(kind, time, key)
+
+    def take(self, indices):
+        store = EventStore()
+        keyNames = self.keyNames
+        for index in indices:
+            store.appendKind(self.kinds[index], self.times[index], keyNames[self.keys[index]], self.xs[index], self.ys[index], self.deltas[index])
+        return store
+
+    def copy(self) -> "EventStore":
+        store = EventStore()
+        store.times, store.kinds, store.keys, store.xs, store.ys, store.deltas = (column[:] for column in self.columns)
+        store.keyNames = list(self.keyNames)
+        store.keyIndex = dict(self.keyIndex)
+        store.version = self.version
+        return store
+
+    def extend(self, events):
+        for event in events:
+            self.append(event.eventType, event.type, event.key, event.time)
+
+    def splice(self, start: int, end: int, other: "EventStore", shift: float = 0.0):
+        # 用 other 的全部事件替换 [start, end), 其后的事件时间整体加上 shift
+        tail = self.times[end:]
+        if shift:
+            tail = array('d', (time + shift for time in tail))
+        codes = [self.keyCode(key) for key in other.keyNames]
+        self.times[start:] = other.times + tail
+        self.kinds[start:end] = other.kinds
+        self.keys[start:end] = array('H', (codes[code] for code in other.keys))
+        self.xs[start:end] = other.xs
+        self.ys[start:end] = other.ys
+        self.deltas[start:end] = other.deltas
+        self.version += 1
+
+    def clear(self):
+        for column in (self.times, self.kinds, self.keys, self.xs, self.ys, self.deltas):
+            del column[:]
+        self.keyNames = [None]
+        self.keyIndex = {None: 0}
+        self.version += 1
+
+    @property
+    def columns(self) -> tuple:
+        return self.times, self.kinds, self.keys, self.xs, self.ys, self.deltas
+
+    def nbytes(self) -> int:
+        return sum(column.itemsize * len(column) for column in self.columns)
+
+    def toBytes(self) -> bytes:
+        keyNames = ujson.dumps(self.keyNames, ensure_ascii=False).encode('utf-8')
+        chunks = [BYTES_HEADER.pack(len(self), len(keyNames)), keyNames]
+        for column in self.columns:
+            if sys.byteorder != 'little':
+                column = array(column.typecode, column)
+                column.byteswap()
+            chunks.append(column.tobytes())
+        return b"".join(chunks)
+
+    @classmethod
+    def fromBytes(cls, data):
+        data = memoryview(data)
+        count, keyLength = BYTES_HEADER.unpack_from(data, 0)
+        position = BYTES_HEADER.size + keyLength
+        store = cls()
+        store.keyNames = ujson.loads(bytes(data[BYTES_HEADER.size:position]).decode('utf-8'))
+        store.keyIndex = {key: index for index, key in enumerate(store.keyNames)}
+        for column in store.columns:
+            size = column.itemsize * count
+            column.frombytes(data[position:position + size])
+            if sys.byteorder != 'little':
+                column.byteswap()
+            position += size
+        if position != len(data):
+            raise ValueError("事件数据长度不匹配!")
+        return store
+
+    def toList(self) -> list:
+        return [event.toDict() for event in self]
+
+    @classmethod
+    def fromList(cls, records: list):
+        store = cls()
+        for record in records:
+            eventType, eventRecord = next(iter(record.items()))
+            key = eventRecord['key' if "key" in eventRecord else ('offset' if 'offset' in eventRecord else "delta")]
+            store.append(eventType, eventRecord['type'], key, eventRecord['time'])
+        return store
+
+
+def snapshotRecord(record):
+    # 非 EventStore(如尚未解码的延迟记录)原样返回
+    if not isinstance(record, EventStore):
+        return record
+    with recordLock:
+        return record.copy()
@@ -0,0 +1,190 @@
+import threading
+
+from utils import logger
+
+# 所有快捷键共用一个键盘钩子, 按 (修饰键状态, 主键扫描码) 在字典中查找, 查找耗时与绑定数量无关
+# 与 keyboard.add_hotkey(..., suppress=True, trigger_on_release=True) 一致: 吞掉主键的按下与释放, 在释放时触发
+CTRL, SHIFT, ALT, WINDOWS = 1, 2, 4, 8
+MODIFIERS = {
+    "ctrl": CTRL, "control": CTRL,
+    "shift": SHIFT,
+    "alt": ALT, "alt gr": ALT,
+    "windows": WINDOWS, "win": WINDOWS, "meta": WINDOWS, "command": WINDOWS
+}
+
+
+class HotkeyError(ValueError):
+    pass
+
+
+def modifierOf(name: str | None) -> int:
+    if not name:
+        return 0
+    name = name.lower()
+    if name.startswith("left ") or name.startswith("right "):
+        name = name.split(" ", 1)[1]
+    return MODIFIERS.get(name, 0)
+
+
+def parseHotkey(hotkey: str) -> tuple[int, tuple]:
+    # 返回 (修饰键位掩码, 主键的全部扫描码), 只支持一个主键的组合键
+    import keyboard
+
+    modifiers, keys = 0, []
+    for part in hotkey.split("+"):
+        part = part.strip().lower() or "plus"
+        modifier = modifierOf(part)
+        if modifier:
+            modifiers |= modifier
+        else:
+            keys.append(part)
+    if len(keys) != 1:
+        raise HotkeyError(f"快捷键 {hotkey} 必须且只能包含一个非修饰键")
+    try:
+        scanCodes = keyboard.key_to_scan_codes(keys[0])
+    except ValueError:
+        raise HotkeyError(f"无法识别的按键: {keys[0]}")
+    return modifiers, tuple(scanCodes)
+
+
+class Binding:
+    __slots__ = ("name", "hotkey", "modifiers", "scanCodes", "callback", "args", "label")
+
+    def __init__(self, name: str, hotkey: str, modifiers: int, scanCodes: tuple, callback, args: tuple = (), label: str = None):
+        self.name = name
+        # 冲突提示中显示的名称
+        self.label = name if label is None else label
+        self.hotkey = hotkey
+        self.modifiers = modifiers
+        self.scanCodes = scanCodes
+        self.callback = callback
+        self.args = args
+
+
+class HotkeyDispatcher:
+
+    def __init__(self):
+        # (修饰键位掩码, 扫描码) -> Binding; 修改时整体替换, 钩子线程读取时无需加锁
+        self.index: dict = {}
+        self.bindings: dict = {}
+        self.lock = threading.Lock()
+        self.modifiers = 0
+        # 扫描码 -> 修饰键位(非修饰键为 0), 避免每个事件都解析按键名
+        self.modifierCodes: dict = {}
+        # 已吞掉按下的主键扫描码 -> Binding, 在释放时触发
+        self.triggered: dict = {}
+        self.hook = None
+
+    def __len__(self):
+        return len(self.bindings)
+
+    def bind(self, name: str, hotkey: str, callback=None, args: tuple = (), label: str = None):
+        # 同名绑定原子地替换为新快捷键, hotkey 为空时解绑; 冲突时抛出 HotkeyError, 原绑定保持不变
+        if not hotkey:
+            self.unbind(name)
+            return
+        modifiers, scanCodes = parseHotkey(hotkey)
+        self.bindKeys(name, hotkey, modifiers, scanCodes, callback, args, label)
+
+    def bindKeys(self, name: str, hotkey: str, modifiers: int, scanCodes: tuple, callback, args: tuple = (), label: str = None):
+        binding = Binding(name, hotkey, modifiers, scanCodes, callback, args, label)
+        with self.lock:
+            for scanCode in scanCodes:
+                other = self.index.get((modifiers, scanCode))
+                if other is not None and other.name != name:
+                    raise HotkeyError(f"快捷键 {hotkey} 与 {other.label} 的 {other.hotkey} 冲突")
+            index = self.__without(name)
+            for scanCode in scanCodes:
+                index[(modifiers, scanCode)] = binding
+            self.bindings[name] = binding
+            self.index = index
+
+    def unbind(self, name: str) -> bool:
+        with self.lock:
+            if name not in self.bindings:
+                return False
+            self.index = self.__without(name)
+            self.bindings.pop(name)
+        return True
+
+    def clear(self):
+        with self.lock:
+            self.index = {}
+            self.bindings.clear()
+
+    def __without(self, name: str) -> dict:
+        index = dict(self.index)
+        old = self.bindings.get(name)
+        if old is not None:
+            for scanCode in old.scanCodes:
+                index.pop((old.modifiers, scanCode), None)
+        return index
+
+    def lookup(self, modifiers: int, scanCode: int) -> Binding | None:
+        return self.index.get((modifiers, scanCode))
+
+    def onKeyEvent(self, event) -> bool:
+        # 返回 False 时 keyboard 吞掉该事件
+        scanCode = event.scan_code
+        modifier = self.modifierCodes.get(scanCode)
+        if modifier is None:
+            modifier = self.modifierCodes[scanCode] = modifierOf(event.name)
+        isDown = event.event_type == "down"
+        if modifier:
+            if isDown:
+                self.modifiers |= modifier
+            else:
+                self.modifiers &= ~modifier
+            return True
+
+        if isDown:
+            if scanCode in self.triggered:
+                # 按住时的重复按下
+                return False
+            binding = self.index.get((self.modifiers, scanCode))
+            if binding is None:
+                return True
+            self.triggered[scanCode] = binding
+            return False
+
+        binding = self.triggered.pop(scanCode, None)
+        if binding is None:
+            return True
+        try:
+            binding.callback(*binding.args)
+        except Exception as e:
+            logger.exception(f"快捷键 {binding.hotkey} 回调失败! {e}")
+        return False
+
+    def start(self):
+        import keyboard
+
+        if self.hook is None:
+            self.modifiers = 0
+            self.triggered.clear()
+            self.hook = keyboard.hook(self.onKeyEvent, suppress=True)
+
+    def stop(self):
+        import keyboard
+
+        if self.hook is not None:
+            keyboard.unhook(self.hook)
+            self.hook = None
+
+
+dispatcher: HotkeyDispatcher | None = None
+
+
+def getDispatcher() -> HotkeyDispatcher:
+    # 首次取得时安装键盘钩子
+    global dispatcher
+    if dispatcher is None:
+        dispatcher = HotkeyDispatcher()
+    dispatcher.start()
+    return dispatcher
+
+
+def stopDispatcher():
+    if dispatcher is not None:
+        dispatcher.stop()
+        dispatcher.clear()
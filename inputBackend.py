@@ -0,0 +1,248 @@
+import os
+import time
+
+from array import array
+
+from eventStore import KIND_INDEX, KINDS
+
+# 输入注入后端, 播放计划通过 handlerTable() 取得各事件种类的处理函数
+# 进程内默认后端可由环境变量 KEYMACRO_BACKEND 或 setDefaultBackend 指定, 单个宏可通过 KeyMacro.backend 覆盖
+BACKEND_ENV = "KEYMACRO_BACKEND"
+
+
+class InputBackend:
+    name = ""
+
+    def __init__(self):
+        # 按事件种类编号排列的处理函数, 首次编译计划时生成
+        self.handlers = None
+
+    def keyPress(self, key):
+        raise NotImplementedError
+
+    def keyRelease(self, key):
+        raise NotImplementedError
+
+    def mousePress(self, button):
+        raise NotImplementedError
+
+    def mouseRelease(self, button):
+        raise NotImplementedError
+
+    def mouseMove(self, offset):
+        raise NotImplementedError
+
+    def mouseWheel(self, delta):
+        raise NotImplementedError
+
+    def restoreState(self):
+        pass
+
+    def handlerTable(self) -> dict:
+        return {
+            "key": {
+                "up": self.keyRelease,
+                "down": self.keyPress
+            },
+            "mouse": {
+                "up": self.mouseRelease,
+                "down": self.mousePress,
+                "double": self.mousePress,
+                "move": self.mouseMove,
+                "wheel": self.mouseWheel
+            }
+        }
+
+    def kindHandlers(self) -> list:
+        if self.handlers is None:
+            table = self.handlerTable()
+            self.handlers = [table[eventType][type] for eventType, type in KINDS]
+        return self.handlers
+
+    def injectBatch(self, events: tuple):
+        # 一次注入同一时刻的多个事件, events 为 (事件种类, 参数) 序列; 调用前须已调用过 kindHandlers
+        handlers = self.handlers
+        for kind, arg in events:
+            handlers[kind](arg)
+
+
+class KeyboardMouseBackend(InputBackend):
+    # 通过 keyboard、mouse 库向系统注入, 首次使用时才导入; 播放计划直接使用库函数, 逐个调用的方法供其他场合使用
+    name = "default"
+
+    def keyPress(self, key):
+        import keyboard
+        keyboard.press(key)
+
+    def keyRelease(self, key):
+        import keyboard
+        keyboard.release(key)
+
+    def mousePress(self, button):
+        import mouse
+        mouse.press(button)
+
+    def mouseRelease(self, button):
+        import mouse
+        mouse.release(button)
+
+    def mouseMove(self, offset):
+        import mouse
+        mouse.move(*offset)
+
+    def mouseWheel(self, delta):
+        import mouse
+        mouse.wheel(delta)
+
+    def handlerTable(self) -> dict:
+        import keyboard
+        import mouse
+
+        def mouseMove(offset):
+            mouse.move(*offset)
+
+        return {
+            "key": {
+                "up": keyboard.release,
+                "down": keyboard.press
+            },
+            "mouse": {
+                "up": mouse.release,
+                "down": mouse.press,
+                "double": mouse.press,
+                "move": mouseMove,
+                "wheel": mouse.wheel
+            }
+        }
+
+    def restoreState(self):
+        import keyboard
+        keyboard.restore_state([])
+
+
+class NullBackend(InputBackend):
+    # 丢弃所有事件, 用于测量调度本身的开销
+    name = "null"
+
+    def keyPress(self, key):
+        pass
+
+    def keyRelease(self, key):
+        pass
+
+    def mousePress(self, button):
+        pass
+
+    def mouseRelease(self, button):
+        pass
+
+    def mouseMove(self, offset):
+        pass
+
+    def mouseWheel(self, delta):
+        pass
+
+
+class VirtualBackend(InputBackend):
+    # 内存中的虚拟设备, 记录每次注入的时间(perf_counter)、事件种类与参数
+    name = "virtual"
+
+    def __init__(self):
+        super().__init__()
+        self.actions = None
+        self.times = array('d')
+        self.kinds = array('B')
+        self.args = []
+        # 虚拟设备当前状态, 便于检查播放结束后是否有按键未释放
+        self.pressed = set()
+        self.position = (0, 0)
+
+    def __len__(self):
+        return len(self.times)
+
+    def clear(self):
+        del self.times[:]
+        del self.kinds[:]
+        self.args.clear()
+        self.pressed.clear()
+
+    def record(self, kind: int, arg):
+        self.times.append(time.perf_counter())
+        self.kinds.append(kind)
+        self.args.append(arg)
+
+    def handlerTable(self) -> dict:
+        def handler(kind, action):
+            kindIndex = KIND_INDEX[kind]
+
+            def inject(arg):
+                self.record(kindIndex, arg)
+                action(arg)
+
+            return inject
+
+        table = super().handlerTable()
+        self.actions = [table[eventType][type] for eventType, type in KINDS]
+        return {eventType: {type: handler((eventType, type), action) for type, action in actions.items()} for eventType, actions in table.items()}
+
+    def injectBatch(self, events: tuple):
+        # 同一批事件记录为同一注入时间
+        now, actions = time.perf_counter(), self.actions
+        for kind, arg in events:
+            self.times.append(now)
+            self.kinds.append(kind)
+            self.args.append(arg)
+            actions[kind](arg)
+
+    def keyPress(self, key):
+        self.pressed.add(key)
+
+    def keyRelease(self, key):
+        self.pressed.discard(key)
+
+    def mousePress(self, button):
+        self.pressed.add(f"mouse {button}")
+
+    def mouseRelease(self, button):
+        self.pressed.discard(f"mouse {button}")
+
+    def mouseMove(self, offset):
+        self.position = tuple(offset)
+
+    def mouseWheel(self, delta):
+        pass
+
+    def restoreState(self):
+        self.pressed.clear()
+
+
+BACKENDS = {}
+INSTANCES = {}
+defaultBackend = os.environ.get(BACKEND_ENV, KeyboardMouseBackend.name)
+
+
+def registerBackend(name: str, factory):
+    BACKENDS[name] = factory
+    INSTANCES.pop(name, None)
+
+
+def setDefaultBackend(name: str):
+    global defaultBackend
+    if name not in BACKENDS:
+        raise KeyError(f"未知的输入后端: {name}")
+    defaultBackend = name
+
+
+def getBackend(name: str = None) -> InputBackend:
+    # 同名后端在进程内共用一个实例
+    name = defaultBackend if name is None else name
+    if name not in INSTANCES:
+        if name not in BACKENDS:
+            raise KeyError(f"未知的输入后端: {name}")
+        INSTANCES[name] = BACKENDS[name]()
+    return INSTANCES[name]
+
+
+registerBackend(KeyboardMouseBackend.name, KeyboardMouseBackend)
+registerBackend(NullBackend.name, NullBackend)
+registerBackend(VirtualBackend.name, VirtualBackend)
@@ -0,0 +1,189 @@
+import threading
+import time
+
+from array import array
+
+import perfStats
+from eventStore import KEY_DOWN, KEY_UP, MOUSE_DOUBLE, MOUSE_DOWN, MOUSE_MOVE, MOUSE_UP, MOUSE_WHEEL
+
+KEY_SOURCE, MOUSE_SOURCE = 0, 1
+
+KEY_KINDS = {"down": KEY_DOWN, "up": KEY_UP}
+BUTTON_KINDS = {"down": MOUSE_DOWN, "up": MOUSE_UP, "double": MOUSE_DOUBLE}
+
+
+class RingBuffer:
+    # 单生产者(钩子线程)、单消费者(整理线程)的定长环形缓冲, 写入时不分配任何对象
+    def __init__(self, capacity: int = 65536):
+        capacity = 1 << max(capacity - 1, 1).bit_length()
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.times = array('d', bytes(8 * capacity))
+        self.kinds = array('B', bytes(capacity))
+        self.names = [None] * capacity
+        self.xs = array('i', bytes(4 * capacity))
+        self.ys = array('i', bytes(4 * capacity))
+        self.deltas = array('d', bytes(8 * capacity))
+        # head/tail 只增不减, 分别只由生产者/消费者修改
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def put(self, kind: int, time: float, name=None, x: int = 0, y: int = 0, delta: float = 0):
+        head = self.head
+        if head - self.tail >= self.capacity:
+            self.dropped += 1
+            return
+        slot = head & self.mask
+        self.times[slot] = time
+        self.kinds[slot] = kind
+        self.names[slot] = name
+        self.xs[slot] = x
+        self.ys[slot] = y
+        self.deltas[slot] = delta
+        self.head = head + 1
+
+    def drain(self) -> list:
+        rows, head, mask = [], self.head, self.mask
+        for index in range(self.tail, head):
+            slot = index & mask
+            rows.append((self.times[slot], self.kinds[slot], self.names[slot], self.xs[slot], self.ys[slot], self.deltas[slot]))
+            self.names[slot] = None
+        self.tail = head
+        return rows
+
+
+class HookLatency:
+    # 钩子回调自身耗时(纳秒), 保留最近 capacity 个样本
+    def __init__(self, capacity: int = 4096):
+        self.samples = array('q', bytes(8 * capacity))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, duration: int):
+        self.samples[self.count % len(self.samples)] = duration
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+
+    def percentile(self, percent: float) -> int:
+        samples = sorted(self.samples[:min(self.count, len(self.samples))])
+        if not samples:
+            return 0
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "meanNs": self.total // self.count if self.count else 0,
+            "p50Ns": self.percentile(50),
+            "p99Ns": self.percentile(99),
+            "maxNs": self.max
+        }
+
+
+class InputCapture:
+    # 钩子回调只写入各自的环形缓冲, 由整理线程按时间戳合并后交给 sink
+    def __init__(self, sink, capacity: int = 65536, drainInterval: float = 0.01, reorderWindow: float = 0.05, measureLatency: bool = False):
+        self.sink = sink
+        self.drainInterval = drainInterval
+        # 晚于当前时间 reorderWindow 秒内的事件暂不合并, 等待另一路可能更早的事件
+        self.reorderWindow = reorderWindow
+        self.measureLatency = measureLatency
+        self.rings = (RingBuffer(capacity), RingBuffer(capacity))
+        self.latency = (HookLatency(), HookLatency())
+        self.pending = ([], [])
+        self.sequence = 0
+        self.hooks = []
+        # 由 start 从 mouse 库取得, 用于区分鼠标事件类型
+        self.moveEvent = self.buttonEvent = None
+        self.stopEvent = threading.Event()
+        self.drainThread = None
+        self.drainLock = threading.Lock()
+
+    @property
+    def dropped(self) -> int:
+        return sum(ring.dropped for ring in self.rings)
+
+    def onKeyEvent(self, event):
+        self.rings[KEY_SOURCE].put(KEY_KINDS.get(event.event_type, KEY_DOWN), event.time, event.name)
+
+    def onMouseEvent(self, event):
+        ring = self.rings[MOUSE_SOURCE]
+        if isinstance(event, self.moveEvent):
+            ring.put(MOUSE_MOVE, event.time, None, event.x, event.y)
+        elif isinstance(event, self.buttonEvent):
+            ring.put(BUTTON_KINDS.get(event.event_type, MOUSE_DOWN), event.time, event.button)
+        else:
+            ring.put(MOUSE_WHEEL, event.time, None, 0, 0, event.delta)
+
+    def timed(self, callback, latency: HookLatency, histogram=None):
+        def hooked(event):
+            began = time.perf_counter_ns()
+            callback(event)
+            duration = time.perf_counter_ns() - began
+            latency.add(duration)
+            if histogram is not None:
+                histogram.add(duration)
+
+        return hooked
+
+    def start(self, isKey: bool = True, isMouse: bool = True):
+        import keyboard
+        import mouse
+
+        self.moveEvent, self.buttonEvent = mouse.MoveEvent, mouse.ButtonEvent
+        onKeyEvent, onMouseEvent = self.onKeyEvent, self.onMouseEvent
+        # 统计开启与否在开始录制时确定, 未开启时钩子不做计时
+        stats = perfStats.stats
+        if self.measureLatency or stats is not None:
+            keyHistogram, mouseHistogram = (None, None) if stats is None else stats.hookDuration
+            onKeyEvent = self.timed(onKeyEvent, self.latency[KEY_SOURCE], keyHistogram)
+            onMouseEvent = self.timed(onMouseEvent, self.latency[MOUSE_SOURCE], mouseHistogram)
+
+        self.stopEvent.clear()
+        self.drainThread = threading.Thread(target=self.draining, name="inputCapture", daemon=True)
+        self.drainThread.start()
+        if isKey:
+            keyboard.hook(onKeyEvent)
+            self.hooks.append((keyboard.unhook, onKeyEvent))
+        if isMouse:
+            mouse.hook(onMouseEvent)
+            self.hooks.append((mouse.unhook, onMouseEvent))
+
+    def stop(self):
+        for unhook, callback in self.hooks:
+            unhook(callback)
+        self.hooks.clear()
+        self.stopEvent.set()
+        if self.drainThread is not None:
+            self.drainThread.join()
+            self.drainThread = None
+        self.drain(float("inf"))
+
+    def draining(self):
+        while not self.stopEvent.wait(self.drainInterval):
+            self.drain(time.time() - self.reorderWindow)
+
+    def drain(self, watermark: float):
+        with self.drainLock:
+            ready = []
+            for source, ring in enumerate(self.rings):
+                pending = self.pending[source]
+                for row in ring.drain():
+                    pending.append((row[0], source, self.sequence, row))
+                    self.sequence += 1
+                count = 0
+                while count < len(pending) and pending[count][0] <= watermark:
+                    count += 1
+                ready.extend(pending[:count])
+                del pending[:count]
+            if ready:
+                # 同一时间戳时键盘先于鼠标, 同一来源保持到达顺序
+                ready.sort()
+                self.sink([row for _, _, _, row in ready])
@@ -1,132 +1,333 @@
 import _thread
-import time
+import threading
 
-import keyboard
-import mouse
+from array import array
+from typing import Callable, NamedTuple
 
+from eventStore import EventStore, KINDS, MOUSE_MOVE, MOUSE_WHEEL, snapshotRecord
+from inputBackend import InputBackend, getBackend
+from inputCapture import InputCapture
+from macroProgram import LazyPlan, ScriptProgram, linkProgram
+from pathSimplify import MoveSimplifier, SimplifyReport
+from playScheduler import PlayHandle, PlayScheduler, getScheduler
+from recordFilter import FilterPipeline, FilterReport
+from timeWarp import TimeWarp
 from utils import logger
 
 
-def mouseMove(offset):
-    mouse.move(*offset)
+# 录制时连续移动超过该数量就先简化一次, 限制钩子回调中的单次耗时
+MAX_PENDING_MOVES = 4096
+
+
+def compilePlan(eventsRecord: EventStore, eventHandler: dict, timeWarp: TimeWarp = TimeWarp()) -> tuple:
+    # 展平成 (相对首个事件的播放时间, 处理函数, 参数) 序列, 播放时不再做任何字典查找; 时间变换在此一次算好
+    if len(eventsRecord) == 0:
+        return ()
+    handlers = [eventHandler[eventType][type] for eventType, type in KINDS]
+    kinds, value = eventsRecord.kinds, eventsRecord.value
+    offsets = timeWarp.offsets(eventsRecord)
+    return tuple((offsets[index], handlers[kinds[index]], value(index)) for index in range(len(offsets)))
+
+
+def compileBatchPlan(eventsRecord: EventStore, backend: InputBackend, timeWarp: TimeWarp = TimeWarp(), window: float = 0.0, collapseMoves: bool = False) -> tuple:
+    # 与 compilePlan 相同, 但播放时间距批首不超过 window 秒的事件合为一项, 由后端 injectBatch 一次注入
+    # collapseMoves 为 True 时批内连续的移动只保留最后一个位置
+    if len(eventsRecord) == 0:
+        return ()
+    handlers = backend.kindHandlers()
+    kinds, value = eventsRecord.kinds, eventsRecord.value
+    offsets = timeWarp.offsets(eventsRecord)
+    count, index, plan = len(offsets), 0, []
+    while index < count:
+        offset = offsets[index]
+        end = index + 1
+        while end < count and offsets[end] - offset <= window:
+            end += 1
+        events = []
+        for current in range(index, end):
+            kind = kinds[current]
+            if collapseMoves and kind == MOUSE_MOVE and len(events) > 0 and events[-1][0] == MOUSE_MOVE:
+                events[-1] = (kind, value(current))
+            else:
+                events.append((kind, value(current)))
+        if len(events) == 1:
+            plan.append((offset, handlers[events[0][0]], events[0][1]))
+        else:
+            plan.append((offset, backend.injectBatch, tuple(events)))
+        index = end
+    return tuple(plan)
+
+
+def compileRecordPlan(eventsRecord: EventStore, timeWarp: TimeWarp, backend: InputBackend, batchWindow: float | None, collapseMoves: bool) -> tuple:
+    if batchWindow is None:
+        return compilePlan(eventsRecord, backend.handlerTable(), timeWarp)
+    return compileBatchPlan(eventsRecord, backend, timeWarp, batchWindow, collapseMoves)
+
+
+class PlanSource(NamedTuple):
+    # 生成播放计划所需的输入, 由 KeyMacro.planSource() 在界面线程取得; buildPlan 只读取它, 可在后台线程执行
+    # origin 为取得时宏的记录(事件记录或延迟记录), record 为其副本或延迟记录本身
+    origin: object
+    record: object
+    # record 为事件记录时的版本, 与 settings (timeWarp, backend, batchWindow, collapseMoves) 组成计划缓存的键
+    version: int
+    settings: tuple
+    # 缓存的计划仍然有效时直接使用
+    plan: tuple = None
+    program: ScriptProgram = None
+    resolver: Callable = None
+    name: str = ""
+
+
+def buildPlan(source: PlanSource) -> tuple:
+    # 返回 (播放计划, 解码或复制的事件记录), 后者交给 KeyMacro.installPlan; 组合宏失败时抛出 ScriptError
+    timeWarp, backend = source.settings[:2]
+    if source.program is not None:
+        return LazyPlan(linkProgram(source.program, source.resolver, source.name), backend.kindHandlers(), timeWarp), None
+    if source.plan is not None:
+        return source.plan, None
+    record = source.record if isinstance(source.record, EventStore) else source.record.load()
+    return compileRecordPlan(record, *source.settings), record
 
 
 class KeyMacro:
-    __EVENT_HANDLER = {
-        "default": {
-            "key": {
-                "up": keyboard.release,
-                "down": keyboard.press
-            },
-            "mouse": {
-                "up": mouse.release,
-                "down": mouse.press,
-                "double": mouse.press,
-                "move": mouseMove,
-                "wheel": mouse.wheel
-            }
-        }
-    }
-
-    def __init__(self, eventsRecord: list = None):
-        self.eventsRecord = [] if eventsRecord is None else eventsRecord
+
+    def __init__(self, eventsRecord: list | EventStore = None):
+        # 也可以是带 load() 的延迟记录(如 macroContainer.LazyRecord), 首次访问 eventsRecord 时才解码
+        self.__eventsRecord = None
+        self.eventsRecord = eventsRecord
+        # 键盘、鼠标钩子在不同线程回调, 追加事件时需保证各列对齐
+        self.recordLock = threading.Lock()
         self.isRecording = False
-        self.isPlaying = False
-        self.isCallback = True
+        # 宏名称, 用于运行统计与跟踪文件
+        self.name = ""
+        # 播放时间变换(倍速、最大间隔、最短按住时长), 在生成播放计划时应用
+        self.timeWarp = TimeWarp()
+        # 输入注入后端名称, 为 None 时使用进程默认后端(见 inputBackend)
+        self.backend: str | None = None
+        # 计划时间相差不超过该值(秒)的事件合批注入, 0 为只合并同一时刻的事件, None 为不合批
+        self.batchWindow: float | None = 0.0
+        self.collapseMoves = False
+        # 播放交由调度器执行, 为 None 时使用进程共用的调度器
+        self.scheduler: PlayScheduler | None = None
+        self.priority = 0
+        self.handle: PlayHandle | None = None
+        # 最近一轮播放中每个事件相对计划时间的延后(秒)
+        self.lateness = array('d')
+        self.__plan = ()
+        self.__planRecord = None
+        self.__planKey = None
+        # 组合宏(含 @call/@repeat 的脚本), 不为 None 时播放它而不是 eventsRecord; resolver 用于查找被调用的宏, 见 macroProgram
+        self.program: ScriptProgram | None = None
+        self.resolver = None
+        # 录制时的鼠标轨迹简化, 为 None 时保留全部移动事件
+        self.simplifier: MoveSimplifier | None = None
+        self.simplifyReport = SimplifyReport()
+        self.__pendingMoves = ([], [], [])
+        # 录制过滤(去掉快捷键、按键重复等), 在整理线程中先于轨迹简化执行, 为 None 时不过滤, 见 recordFilter
+        self.filters: FilterPipeline | None = None
+        self.capture: InputCapture | None = None
+        # 为 True 时录制期间统计钩子回调耗时, 见 capture.latency
+        self.measureLatency = False
 
     def __repr__(self):
         return str(self.eventsRecord)
 
+    def __len__(self):
+        if self.program is not None:
+            return len(self.program)
+        return len(self.__eventsRecord)
+
+    @property
+    def eventsRecord(self) -> EventStore:
+        if not isinstance(self.__eventsRecord, EventStore):
+            self.__eventsRecord = self.__eventsRecord.load()
+        return self.__eventsRecord
+
+    @eventsRecord.setter
+    def eventsRecord(self, eventsRecord):
+        if eventsRecord is None:
+            eventsRecord = EventStore()
+        elif isinstance(eventsRecord, list):
+            eventsRecord = EventStore.fromList(eventsRecord)
+        self.__eventsRecord = eventsRecord
+
+    @property
+    def speed(self) -> float:
+        return self.timeWarp.speed
+
+    @speed.setter
+    def speed(self, speed: float):
+        self.timeWarp = self.timeWarp._replace(speed=speed)
+
+    @property
+    def isLoaded(self) -> bool:
+        return isinstance(self.__eventsRecord, EventStore)
+
+    def getBackend(self) -> InputBackend:
+        return getBackend(self.backend)
+
+    def getPlan(self) -> tuple | LazyPlan:
+        # 在当前线程生成播放计划并缓存; 在后台线程生成时改用 planSource / buildPlan / installPlan
+        if self.program is not None:
+            # 组合宏每次播放重新链接, 被调用的宏修改后立即生效; 按需展开, 不合批; 失败时抛出 ScriptError
+            return LazyPlan(linkProgram(self.program, self.resolver, self.name), self.getBackend().kindHandlers(), self.timeWarp)
+        record, settings = self.eventsRecord, self.__planSettings()
+        planKey = (record.version, *settings)
+        if self.__planRecord is not record or self.__planKey != planKey:
+            self.__plan = compileRecordPlan(record, *settings)
+            self.__planRecord, self.__planKey = record, planKey
+        return self.__plan
+
+    def __planSettings(self) -> tuple:
+        return self.timeWarp, self.getBackend(), self.batchWindow, self.collapseMoves
+
+    def planSource(self, resolver=None) -> PlanSource:
+        # 与 eventsRecord、计划缓存在同一线程(界面线程)调用; 已解码的记录在锁内复制, 之后的编辑或录制不影响后台生成
+        # resolver 为组合宏查找被调用宏的函数, 默认为 self.resolver, 交给后台时应只读取快照(见 macroProgram.snapshotResolver)
+        settings = self.__planSettings()
+        if self.program is not None:
+            return PlanSource(None, None, 0, settings, program=self.program, resolver=self.resolver if resolver is None else resolver, name=self.name)
+        origin = self.__eventsRecord
+        if not isinstance(origin, EventStore):
+            return PlanSource(origin, origin, 0, settings)
+        if self.__planRecord is origin and self.__planKey == (origin.version, *settings):
+            return PlanSource(origin, None, origin.version, settings, self.__plan)
+        with self.recordLock:
+            record = snapshotRecord(origin)
+        return PlanSource(origin, record, record.version, settings)
+
+    def installPlan(self, source: PlanSource, plan: tuple, record: EventStore = None):
+        # 在界面线程保存 buildPlan 的结果: 记录在此期间未被替换或修改时, 换上解码的记录并缓存计划
+        if record is None or self.__eventsRecord is not source.origin:
+            return
+        if isinstance(source.origin, EventStore):
+            if source.origin.version != source.version:
+                return
+            record = source.origin
+        else:
+            self.__eventsRecord = record
+        self.__plan, self.__planRecord, self.__planKey = plan, record, (record.version, *source.settings)
+
     def startRecording(self, isKey: bool = True, isMouse: bool = True, isUntil: str = None):
         def waiting():
+            import keyboard
             keyboard.wait(isUntil)
             self.stopRecording(isKey, isMouse)
 
         if not self.isRecording:
-            self.eventsRecord.clear()
+            self.eventsRecord = EventStore()
+            self.simplifyReport = SimplifyReport()
+            if self.filters is not None:
+                self.filters.reset()
             self.isRecording = True
 
-            if isKey:
-                keyboard.hook(self.__recordKeyEvent)
-            if isMouse:
-                mouse.hook(self.__recordMouseEvent)
+            self.capture = InputCapture(self.__receiveEvents, measureLatency=self.measureLatency)
+            self.capture.start(isKey, isMouse)
             if isUntil is not None:
                 _thread.start_new_thread(waiting, ())
 
     def stopRecording(self, isKey: bool = True, isMouse: bool = True):
         if self.isRecording:
             self.isRecording = False
-            if isKey:
-                keyboard.unhook(self.__recordKeyEvent)
-            if isMouse:
-                mouse.unhook(self.__recordMouseEvent)
-
-    def __recordKeyEvent(self, event):
-        self.eventsRecord.append({"key": {"key": event.name, "type": event.event_type, "time": event.time}})
-
-    def __recordMouseEvent(self, event):
-        if isinstance(event, mouse.ButtonEvent):
-            self.eventsRecord.append({"mouse": {"key": event.button, "type": event.event_type, "time": event.time}})
-        elif isinstance(event, mouse.MoveEvent):
-            self.eventsRecord.append({"mouse": {"offset": [event.x, event.y], "type": "move", "time": event.time}})
+            self.capture.stop()
+            if self.filters:
+                self.__appendEvents(self.filters.finish())
+            with self.recordLock:
+                self.__flushMoves()
+            if self.capture.dropped > 0:
+                logger.warning(f"录制缓冲已满, 丢弃了 {self.capture.dropped} 个事件")
+
+    def __flushMoves(self, isFinal: bool = True):
+        times, xs, ys = self.__pendingMoves
+        if len(times) == 0:
+            return
+        kept, report = self.simplifier.simplifyRun(times, xs, ys)
+        self.simplifyReport = self.simplifyReport.merge(report)
+        if not isFinal:
+            # 末点留作下一段的起点, 保证分段简化后轨迹仍然连续
+            kept.pop()
+        for index in kept:
+            self.eventsRecord.appendKind(MOUSE_MOVE, times[index], x=xs[index], y=ys[index])
+        if isFinal:
+            self.__pendingMoves = ([], [], [])
         else:
-            self.eventsRecord.append({"mouse": {"delta": event.delta, "type": "wheel", "time": event.time}})
-
-    def playRecord(self, keepInterval: bool = True, isLoop: bool = False, delay: int = 0, callback=None, kwargs: dict = None):
-        def playing(eventsRecord, keepInterval, isLoop, delay):
-            self.isPlaying = True
-            try:
-                eventHandler = self.__EVENT_HANDLER['default']
-                while True:
-                    keyTime = next(iter(eventsRecord[0].values()))['time']
-                    for event in eventsRecord:
-                        if not self.isPlaying:
-                            isLoop = False
-                            break
-                        for eventType, eventRecord in event.items():
-                            duration = max(eventRecord['time'] - keyTime, 0)
-                            if keepInterval and duration > 0:
-                                time.sleep(float(duration))
-                            keyTime = eventRecord['time']
-                            keyValue = eventRecord['key' if "key" in eventRecord else ('offset' if 'offset' in eventRecord else "delta")]
-                            eventHandler[eventType][eventRecord['type']](keyValue)
-                    if not isLoop:
-                        break
-                    if delay > 0:
-                        time.sleep(delay / 1000)
-                keyboard.restore_state([])
-                if callback is not None and self.isCallback:
-                    logger.info("calling back...")
-                    if isinstance(kwargs, dict):
-                        callback(**kwargs)
-                    else:
-                        callback()
-            except Exception as e:
-                logger.exception(f"执行宏失败! {e}")
-            finally:
-                self.isPlaying = False
-
-        if not self.isPlaying and len(self.eventsRecord) > 0:
-            self.isCallback = True
-            _thread.start_new_thread(playing, (self.eventsRecord, keepInterval, isLoop, delay))
+            self.__pendingMoves = ([times[-1]], [xs[-1]], [ys[-1]])
+
+    def __receiveEvents(self, rows):
+        # 在整理线程中调用, rows 已按时间戳排好序
+        if self.filters:
+            rows = self.filters.process(rows)
+        self.__appendEvents(rows)
+
+    def __appendEvents(self, rows):
+        with self.recordLock:
+            eventsRecord, simplifier = self.eventsRecord, self.simplifier
+            times, xs, ys = self.__pendingMoves
+            for time, kind, name, x, y, delta in rows:
+                if kind == MOUSE_MOVE and simplifier is not None:
+                    times.append(time)
+                    xs.append(x)
+                    ys.append(y)
+                    if len(times) >= MAX_PENDING_MOVES:
+                        self.__flushMoves(False)
+                        times, xs, ys = self.__pendingMoves
+                    continue
+                if len(times) > 0:
+                    self.__flushMoves()
+                    times, xs, ys = self.__pendingMoves
+                eventsRecord.appendKind(kind, time, name, x, y, delta)
+
+    def simplifyRecord(self, simplifier: MoveSimplifier = None) -> SimplifyReport:
+        simplifier = self.simplifier if simplifier is None else simplifier
+        if simplifier is None:
+            return SimplifyReport()
+        self.eventsRecord, report = simplifier.simplify(self.eventsRecord)
+        return report
+
+    def filterRecord(self, filters: FilterPipeline = None) -> FilterReport:
+        filters = self.filters if filters is None else filters
+        if not filters:
+            return FilterReport()
+        self.eventsRecord, report = filters.apply(self.eventsRecord)
+        return report
+
+    @property
+    def isPlaying(self) -> bool:
+        return self.handle is not None and self.handle.isActive
+
+    def playRecord(self, keepInterval: bool = True, isLoop: bool = False, delay: int = 0, callback=None, kwargs: dict = None, isDeadline: bool = True,
+                   plan=None) -> PlayHandle | None:
+        # plan 为事先(如在后台线程)调用 getPlan 得到的计划, 为 None 时当场生成
+        def calling():
+            if isinstance(kwargs, dict):
+                callback(**kwargs)
+            else:
+                callback()
+
+        if not self.isPlaying and len(self) > 0:
+            scheduler = getScheduler() if self.scheduler is None else self.scheduler
+            self.handle = scheduler.play(self.getPlan() if plan is None else plan, self.getBackend(), keepInterval, isLoop, delay, self.priority,
+                                         None if callback is None else calling, isDeadline, self.name, self.lateness)
+        return self.handle
 
     def terminateRecord(self, isCallback=True):
-        self.isPlaying = False
-        self.isCallback = isCallback
+        if self.handle is not None:
+            self.handle.cancel(isCallback)
+
+    def waitPlayed(self, timeout: float = None) -> bool:
+        return self.handle is None or self.handle.wait(timeout)
 
     def addKeyRecord(self, key, event, msec):
-        baseTime = 0 if len(self.eventsRecord) == 0 else next(iter(self.eventsRecord[-1].values()))['time']
-        time = msec / 1000
-        self.eventsRecord.append({"key": {"key": key, "type": event, "time": baseTime + time}})
+        self.eventsRecord.append("key", event, key, self.eventsRecord.lastTime + msec / 1000)
 
     def addMouseRecord(self, key, event, msec):
-        baseTime = 0 if len(self.eventsRecord) == 0 else next(iter(self.eventsRecord[-1].values()))['time']
-        time = msec / 1000
+        time = self.eventsRecord.lastTime + msec / 1000
         if event == 'move':
-            self.eventsRecord.append({"mouse": {"offset": key, "type": "move", "time": baseTime + time}})
+            self.eventsRecord.appendKind(MOUSE_MOVE, time, x=key[0], y=key[1])
         elif event == 'wheel':
-            self.eventsRecord.append({"mouse": {"delta": key, "type": "wheel", "time": baseTime + time}})
+            self.eventsRecord.appendKind(MOUSE_WHEEL, time, delta=key)
         elif key in {'left', 'right', 'middle'}:
-            self.eventsRecord.append({"mouse": {"key": key, "type": event, "time": baseTime + time}})
+            self.eventsRecord.append("mouse", event, key, time)
         else:
             raise Exception('error mouse record!')
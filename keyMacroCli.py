@@ -0,0 +1,244 @@
+import argparse
+import logging
+import sys
+import time
+
+from pathlib import Path
+
+import ujson
+
+import perfStats
+from hotkeyDispatcher import getDispatcher, stopDispatcher
+from inputBackend import BACKENDS
+from keyMacro import KeyMacro
+from playScheduler import getScheduler
+from timeWarp import TimeWarp
+from macroContainer import LazyRecord, MacroContainer, decodeBlock
+from macroProgram import hasDirectives, macroResolver, parseText
+from scriptCodec import ScriptError, decodeText
+from utils import initLogger, loadJson, logger
+
+# 无界面的命令行入口, 不导入任何界面相关的库(PySide6、qfluentwidgets、winsound)
+
+
+class LoadedRecord:
+    # 宏文件关闭后仍可读取的延迟记录, 只复制事件块字节而不解码
+    __slots__ = ("block", "count")
+
+    def __init__(self, record):
+        self.block = record.rawBlock()
+        self.count = len(record)
+
+    def __len__(self):
+        return self.count
+
+    def load(self):
+        return decodeBlock(self.block)
+
+
+def loadMacros(path: Path) -> dict:
+    # 支持二进制宏文件(.kmc)、宏配置(keyMacros.json 或导出的单个宏) 以及脚本文本
+    if not path.exists():
+        raise FileNotFoundError(f'[{path}] 宏文件读取失败, 文件不存在!')
+    if path.suffix == ".kmc":
+        container = MacroContainer(path)
+        keyMacros = container.loadConfigs()
+        if container.isSegmented:
+            # 分片格式的事件块需拼接后才能复制, 保持文件打开并直接使用延迟记录, 由 closeMacros 关闭
+            return keyMacros
+        try:
+            for macroConfig in keyMacros.values():
+                # 只解码要播放的宏, 其余保持延迟记录
+                macroConfig['record'] = LoadedRecord(macroConfig['record'])
+        finally:
+            container.close()
+        return keyMacros
+    if path.suffix == ".json":
+        keyMacros = loadJson(path)
+        if 'record' in keyMacros:
+            macroID = keyMacros.get('id', path.stem)
+            keyMacros = {macroID: keyMacros}
+        return keyMacros
+    contents = path.read_text(encoding='utf-8')
+    if hasDirectives(contents):
+        # 组合宏脚本; 单个脚本文件中没有其他宏可供 @call, 只有 @repeat 可用
+        return {path.stem: {"id": path.stem, "name": path.stem, "script": contents, "record": None}}
+    return {path.stem: {"id": path.stem, "name": path.stem, "record": decodeText(contents)}}
+
+
+def closeMacros(keyMacros: dict):
+    containers = {id(record.container): record.container for macroConfig in keyMacros.values()
+                  if isinstance(record := macroConfig.get('record'), LazyRecord)}
+    for container in containers.values():
+        container.close()
+
+
+def findMacro(keyMacros: dict, macro: str) -> tuple[str, dict]:
+    if macro in keyMacros:
+        return macro, keyMacros[macro]
+    matched = [(macroID, macroConfig) for macroID, macroConfig in keyMacros.items() if macroConfig.get('name') == macro]
+    if len(matched) == 0:
+        raise ValueError(f"找不到宏: {macro}")
+    if len(matched) > 1:
+        raise ValueError(f"存在多个名为 {macro} 的宏, 请使用 id: {', '.join(macroID for macroID, _ in matched)}")
+    return matched[0]
+
+
+def createKeyMacro(macroConfig: dict, args) -> KeyMacro:
+    keyMacro = KeyMacro(macroConfig.get('record'))
+    timeWarp = TimeWarp.fromConfig(macroConfig)
+    keyMacro.timeWarp = TimeWarp(timeWarp.speed if args.speed is None else args.speed,
+                                 timeWarp.maxGap if args.maxGap is None else args.maxGap / 1000,
+                                 timeWarp.minHold if args.minHold is None else args.minHold / 1000)
+    # 命令行指定的后端优先于宏配置中的后端
+    keyMacro.backend = args.backend or macroConfig.get('backend')
+    batchWindow = macroConfig.get('batchWindow', 0) if args.batchWindow is None else args.batchWindow
+    keyMacro.batchWindow = None if batchWindow < 0 else batchWindow / 1000
+    keyMacro.collapseMoves = args.collapseMoves or macroConfig.get('collapseMoves', False)
+    keyMacro.priority = macroConfig.get('priority', 0)
+    keyMacro.name = macroConfig.get('name', "")
+    if macroConfig.get('script'):
+        keyMacro.program = parseText(macroConfig['script'])
+    return keyMacro
+
+
+def macroFactory(keyMacros: dict, args):
+    # 同一宏只创建一次 KeyMacro, 组合宏按对象检测循环调用
+    keyMacroObjects = {}
+
+    def getKeyMacro(macroConfig: dict) -> KeyMacro:
+        keyMacro = keyMacroObjects.get(id(macroConfig))
+        if keyMacro is None:
+            keyMacro = keyMacroObjects[id(macroConfig)] = createKeyMacro(macroConfig, args)
+            keyMacro.resolver = resolver
+        return keyMacro
+
+    resolver = macroResolver(keyMacros, getKeyMacro)
+    return getKeyMacro
+
+
+def playMacro(keyMacro: KeyMacro, args, delay: int):
+    keyMacro.playRecord(not args.noInterval, args.loop, delay)
+    try:
+        # 带超时等待, 使 ctrl+c 在 windows 下也能及时响应
+        while not keyMacro.waitPlayed(0.1):
+            pass
+    except KeyboardInterrupt:
+        keyMacro.terminateRecord(False)
+        keyMacro.waitPlayed()
+
+
+def listMacros(keyMacros: dict):
+    for macroID, macroConfig in keyMacros.items():
+        if macroConfig.get('script'):
+            # 组合宏的记录为空, 事件数在播放时才确定, 只列出脚本的行数
+            try:
+                size = f"composite, {len(parseText(macroConfig['script']))} lines"
+            except ScriptError as e:
+                size = f"composite, 第{e.line}行: {e.message}"
+        else:
+            size = f"{len(macroConfig.get('record') or [])} events"
+        print(f"{macroID}\t{macroConfig.get('name', '')}\t{macroConfig.get('hotkey', '')}\t{size}")
+
+
+def runDaemon(keyMacros: dict, args):
+    def toggle(macroID):
+        keyMacro = keyMacroObjects[macroID]
+        if keyMacro.isPlaying:
+            logger.info(f'stop playing {macroID}.')
+            keyMacro.terminateRecord(False)
+        else:
+            logger.info(f"playing {macroID}...")
+            keyMacro.playRecord(not args.noInterval, args.loop, delays[macroID])
+
+    keyMacroObjects, delays, getKeyMacro = {}, {}, macroFactory(keyMacros, args)
+    try:
+        for macroID, macroConfig in keyMacros.items():
+            if not macroConfig.get('hotkey') or (args.macro and macroID not in args.macro and macroConfig.get('name') not in args.macro):
+                continue
+            keyMacroObjects[macroID] = getKeyMacro(macroConfig)
+            delays[macroID] = macroConfig.get('delay', 0) if args.delay is None else args.delay
+            # 快捷键冲突时抛出 HotkeyError(ValueError), 已安装的键盘钩子在 finally 中卸载
+            getDispatcher().bind(macroID, macroConfig['hotkey'], toggle, (macroID,), macroConfig.get('name'))
+            logger.info(f"set {macroConfig['hotkey']} {macroConfig.get('name', '')} shortcut play")
+        if len(keyMacroObjects) == 0:
+            raise ValueError("没有绑定了快捷键的宏")
+
+        while True:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stopDispatcher()
+        for keyMacro in keyMacroObjects.values():
+            keyMacro.terminateRecord(False)
+            keyMacro.waitPlayed()
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="无界面播放已保存的按键宏")
+    parser.add_argument("macro", nargs="*", help="宏的 id 或名称; 守护模式下为空表示全部")
+    parser.add_argument("-f", "--file", type=Path, default=Path.cwd() / "keyMacros.kmc",
+                        help="宏文件(.kmc)、宏配置(.json) 或脚本文本, 默认为当前目录下的 keyMacros.kmc")
+    parser.add_argument("-l", "--loop", action="store_true", help="循环播放, ctrl+c 停止")
+    parser.add_argument("-d", "--delay", type=int, default=None, help="循环间隔(毫秒), 默认使用宏配置中的值")
+    parser.add_argument("-s", "--speed", type=float, default=None, help="播放倍速, 默认使用宏配置中的值")
+    parser.add_argument("--maxGap", type=float, default=None, help="倍速换算后相邻事件的最长间隔(毫秒), 0 为不限")
+    parser.add_argument("--minHold", type=float, default=None, help="倍速换算后按下到释放的最短时长(毫秒)")
+    parser.add_argument("-b", "--backend", choices=sorted(BACKENDS), default=None, help="输入注入后端, 默认为宏配置或环境变量 KEYMACRO_BACKEND 指定的后端")
+    parser.add_argument("--batchWindow", type=float, default=None, help="计划时间相差不超过该值(毫秒)的事件合批注入, 负数为不合批")
+    parser.add_argument("--collapseMoves", action="store_true", help="合批时连续的鼠标移动只保留最后位置")
+    parser.add_argument("--noInterval", action="store_true", help="不保留事件间的时间间隔")
+    parser.add_argument("--daemon", action="store_true", help="常驻并按各宏的快捷键播放")
+    parser.add_argument("--maxRunning", type=int, default=0, help="守护模式下同时播放的宏数量上限, 0 为不限")
+    parser.add_argument("--list", action="store_true", help="列出文件中的宏")
+    parser.add_argument("--logEvents", action="store_true", help="逐事件输出 debug 日志(会增加播放线程的开销)")
+    parser.add_argument("--stats", action="store_true", help="结束时输出运行统计(JSON)")
+    parser.add_argument("--trace", type=Path, default=None, help="将每个播放事件的延后与注入耗时逐行写入该 JSONL 文件")
+    args = parser.parse_args(argv)
+    initLogger("keyMacro", 10 * 1048576, level=logging.DEBUG if args.logEvents else logging.INFO)
+    getScheduler().logEvents = args.logEvents
+
+    if args.speed is not None and args.speed <= 0:
+        parser.error("倍速必须大于 0")
+    path = args.file
+    if path.suffix == ".kmc" and not path.exists() and path.with_suffix(".json").exists():
+        path = path.with_suffix(".json")
+
+    if args.stats or args.trace is not None:
+        perfStats.enableStats(args.trace)
+    keyMacros = {}
+    try:
+        keyMacros = loadMacros(path)
+        if args.list:
+            listMacros(keyMacros)
+            return 0
+        if args.daemon:
+            getScheduler().maxRunning = args.maxRunning
+            runDaemon(keyMacros, args)
+            return 0
+        if len(args.macro) == 0:
+            if len(keyMacros) != 1:
+                parser.error("请指定要播放的宏")
+            args.macro = list(keyMacros)
+        getKeyMacro = macroFactory(keyMacros, args)
+        for macro in args.macro:
+            macroID, macroConfig = findMacro(keyMacros, macro)
+            keyMacro = getKeyMacro(macroConfig)
+            logger.info(f"playing {macroID} {macroConfig.get('name', '')}...")
+            playMacro(keyMacro, args, macroConfig.get('delay', 0) if args.delay is None else args.delay)
+    except (OSError, ValueError, ScriptError) as e:
+        logger.error(e)
+        return 1
+    finally:
+        closeMacros(keyMacros)
+        stats = perfStats.getStats()
+        if stats is not None:
+            if args.stats:
+                print(ujson.dumps(stats.snapshot(), indent=2, ensure_ascii=False))
+            perfStats.disableStats()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
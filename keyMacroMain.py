@@ -5,9 +5,10 @@ from PySide6.QtWidgets import QApplication
 from qfluentwidgets import FluentTranslator
 
 from keyMacroUI import KeyMacroUI
-from utils import logger
+from utils import initLogger
 
 if __name__ == "__main__":
+    logger = initLogger("keyMacro", 10 * 1048576)
     logger.info("----------------------------begin--------------------------------")
     try:
         app = QApplication(sys.argv)
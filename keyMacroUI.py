@@ -1,43 +1,126 @@
+import io
 import time
-import winsound
-import keyboard
-import ujson
-import _thread
 
 from enum import Enum
 from pathlib import Path
 
-from PySide6.QtCore import Qt, Signal, QPropertyAnimation, Slot
-from PySide6.QtGui import QKeySequence, QPainter, QPen, QColor
-from PySide6.QtWidgets import QVBoxLayout, QFrame, QLabel, QHBoxLayout, QGraphicsOpacityEffect, QWidget
-
-from keyMacro import KeyMacro
-from utils import loadJson, dumpJson, logger
+from PySide6.QtCore import Qt, Signal, QPropertyAnimation, Slot, QAbstractListModel, QModelIndex, QSize, QTimer, QObject
+from PySide6.QtGui import QKeySequence, QShortcut, QPainter, QPen, QColor, QTextCharFormat, QTextCursor, QTextFormat
+from PySide6.QtWidgets import QVBoxLayout, QFrame, QLabel, QHBoxLayout, QGraphicsOpacityEffect, QWidget, QListView, QTextEdit
+
+import perfStats
+from eventStore import recordLock
+from hotkeyDispatcher import HotkeyError, getDispatcher, stopDispatcher
+from keyMacro import KeyMacro, PlanSource, buildPlan
+from macroProgram import ScriptProgram, hasDirectives, linkProgram, macroResolver, parseProgram, parseText, snapshotResolver
+from macroPersist import MacroPersistence
+from pathSimplify import MoveSimplifier
+from playScheduler import getScheduler
+from recordFilter import FilterPipeline
+from scriptCodec import ScriptError, decodeRecord, encodeLines
+from scriptPages import PAGE_EVENTS, applyPage, encodePage, pageCount, pageLine, validateText
+from timeWarp import TimeWarp
+from utils import logger
+from workerPool import Job, getWorkerPool, shutdownWorkerPool
 
 from qfluentwidgets import MSFluentTitleBar, Icon, FluentIcon, TransparentToolButton, TransparentToggleToolButton, CheckBox, LineEdit, MessageBox, FlyoutView, \
-    FlyoutAnimationType, Flyout, ScrollArea, PushButton, SpinBox, TextEdit, setFont
+    FlyoutAnimationType, Flyout, PushButton, SpinBox, DoubleSpinBox, TextEdit, ProgressBar, setFont
 from qfluentwidgets.components.widgets.frameless_window import FramelessWindow
 from qfluentwidgets.components.widgets.info_bar import InfoIconWidget, InfoBar, InfoBarPosition
 
 
 SOUND_DIR = Path.cwd() / "sound"
+# 程序自身的全局快捷键: (动作, 快捷键, 名称)
+APP_HOTKEYS = (("record", "ctrl+alt+f9", "录制"), ("play", "ctrl+alt+f10", "播放"))
+# 显示/隐藏运行统计面板, 只在本窗口内生效, 不占用其他程序的快捷键
+STATS_SHORTCUT = "ctrl+alt+f11"
+# 宏配置中没有 filters 时, 录制只去掉程序自身的快捷键
+DEFAULT_FILTERS = [{"type": "stripHotkeys", "hotkeys": [hotkey for _, hotkey, _ in APP_HOTKEYS] + [STATS_SHORTCUT]}]
+
+
+def playSound(name: str):
+    # winsound 只在首次播放提示音时导入
+    import winsound
+    winsound.PlaySound(str(SOUND_DIR / name), winsound.SND_FILENAME | winsound.SND_ASYNC)
+
+
+def loadForEditing(job: Job, keyMacro: KeyMacro) -> str:
+    # 后台执行: 解码延迟记录; 超过一页的录制按页编辑, 直接返回记录, 其余整体文本化
+    eventsRecord = keyMacro.eventsRecord
+    if len(eventsRecord) > PAGE_EVENTS:
+        return eventsRecord
+    return "".join(job.iterate(encodeLines(eventsRecord), len(eventsRecord)))
+
+
+def parseScript(job: Job, contents: str, resolver, name: str):
+    # 后台执行: 组合宏返回 ScriptProgram(并链接一次以检查调用目标与循环调用), 否则返回事件记录
+    # 逐行读取, 不一次性切分整段文本(长时间占用 GIL 会卡住界面线程)
+    lines, total = io.StringIO(contents), contents.count("\n") + 1
+    if hasDirectives(contents):
+        program = parseProgram(job.iterate(lines, total))
+        linkProgram(program, resolver, name)
+        return program
+    return decodeRecord(job.iterate(lines, total))
+
+
+def preparePlan(job: Job, source: PlanSource):
+    # 后台执行: 解码延迟记录并生成播放计划, 只读取提交任务时在界面线程取得的快照
+    return buildPlan(source)
+
+
+ROW_HEIGHT = 75
+ROW_SPACING = 10
+
+INFO_BAR_QSS = """
+    KeyMacroInfoBar {
+        border: 1px solid rgb(229, 229, 229);
+        border-radius: 6px;
+        background-color: rgb(246, 246, 246);
+    }
+
+    KeyMacroInfoBar:focus {
+        border: 1px solid rgb(219, 219, 219);
+        border-radius: 6px;
+        background-color: rgb(250, 250, 250);
+    }
+
+    #titleLabel {
+        font: 14px 'Segoe UI', 'Microsoft YaHei', 'PingFang SC';
+        font-weight: bold;
+        color: black;
+        background-color: transparent;
+    }
+
+    #contentLabel {
+        font: 14px 'Segoe UI', 'Microsoft YaHei', 'PingFang SC';
+        color: black;
+        background-color: transparent;
+    }
+    """
 
 
 class KeyMacroUI(FramelessWindow):
+    hotkeyPlaySignal = Signal(str)
+    shortcutSignal = Signal(str)
 
     def __init__(self):
         super().__init__()
         self.keyMacros: dict = {}
-        self.keyMacroWidgets: dict = {}
+        # 宏对象与快捷键独立于行控件存在, 行控件只在可见时创建
+        self.keyMacroObjects: dict = {}
+        # 后台任务的回调都经此投递到界面线程
+        self.guiDispatcher = GuiDispatcher(self)
+        getWorkerPool().dispatch = self.guiDispatcher.post
         self.macrosPath = Path.cwd() / "keyMacros.json"
+        # 宏保存在二进制宏文件中, 旧的 json 文件只在首次启动时导入
+        self.containerPath = Path.cwd() / "keyMacros.kmc"
+        self.persistence = MacroPersistence(self.containerPath, self.macrosPath)
         self.loadKeyMacros()
 
-        self.currentInfoBar = None
-        self.currentNewInfoBar = None
+        self.currentMacroID = None
+        self.newMacroConfig = None
         self.__initUI()
-
-        keyboard.add_hotkey("ctrl+alt+f9", self.__shortCutRecord, suppress=True, trigger_on_release=True)
-        keyboard.add_hotkey("ctrl+alt+f10", self.__shortCutPlay, suppress=True, trigger_on_release=True)
+        self.__initHotkeys()
 
     def __initUI(self):
         self.setContentsMargins(0, 35, 0, 10)
@@ -49,120 +132,356 @@ class KeyMacroUI(FramelessWindow):
         self.setMinimumSize(700, 200)
         self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
 
-        self.keyMacrosUI = self.__loadKeyMacrosUI()
-        keyMacrosBg = BackgroundWidget()
-        keyMacrosBg.setLayout(self.keyMacrosUI)
+        self.macroList = KeyMacroListView(self.__createKeyMacroInfoBar)
+        self.macroList.setMacroIDs(list(self.keyMacros) + [self.__newKeyMacroConfig()])
+        if len(self.keyMacros) > 0:
+            self.resize(self.width(), self.height() + min(len(self.keyMacros) * 75, 500))
 
-        keyMacrosArea = ScrollArea()
-        keyMacrosArea.setWidgetResizable(True)
-        keyMacrosArea.setWidget(keyMacrosBg)
-        keyMacrosArea.setObjectName("keyMacrosArea")
-        keyMacrosArea.setStyleSheet("""#keyMacrosArea{border: 0px ;}""")
+        # 运行统计面板, 默认隐藏且不开启统计
+        self.statsView = PerfStatsView()
+        self.statsView.setVisible(False)
 
         mainLayout = QVBoxLayout()
-        mainLayout.addWidget(keyMacrosArea)
+        mainLayout.addWidget(self.macroList)
+        mainLayout.addWidget(self.statsView)
         self.setLayout(mainLayout)
 
-    def __newKeyMacroInfoBar(self):
-        macroConfig = {
+    def __initHotkeys(self):
+        self.hotkeyPlaySignal.connect(self.__hotkeyPlay)
+        self.shortcutSignal.connect(self.__shortCut)
+        self.statsShortcut = QShortcut(QKeySequence(STATS_SHORTCUT), self, self.__toggleStats)
+        # 键盘钩子在首次绘制之后再安装, 不占用启动时间
+        QTimer.singleShot(0, self.__bindHotkeys)
+
+    def __bindHotkeys(self):
+        dispatcher = getDispatcher()
+        for action, hotkey, label in APP_HOTKEYS:
+            dispatcher.bind(action, hotkey, self.shortcutSignal.emit, (action,), label)
+
+        for macroID, macroConfig in self.keyMacros.items():
+            if macroConfig.get('hotkey'):
+                self.bindHotkey(macroID, macroConfig['hotkey'])
+
+    def __newKeyMacroConfig(self) -> str:
+        self.newMacroConfig = {
             "id": str(time.time_ns()),
             'title': "New",
             "name": "新建脚本"
         }
-        keyMacroInfoBar = KeyMacroInfoBar(FluentIcon.ADD_TO, macroConfig)
-        keyMacroInfoBar.deletedSignal.connect(self.__deleteKeyMacro)
-        keyMacroInfoBar.recordedSignal.connect(self.__updateKeyMacro)
-        keyMacroInfoBar.clickedSignal.connect(self.__clickKeyMacro)
-        self.keyMacroWidgets[keyMacroInfoBar.id] = keyMacroInfoBar
-        self.currentNewInfoBar = keyMacroInfoBar
-        return keyMacroInfoBar
-
-    def __loadKeyMacrosUI(self):
-        keyMacroLayout = QVBoxLayout()
-        keyMacroLayout.setSpacing(10)
-        for macroID, keyMacro in self.keyMacros.items():
-            macroInfoBar = KeyMacroInfoBar(FluentIcon.QUICK_NOTE, keyMacro)
-            macroInfoBar.deletedSignal.connect(self.__deleteKeyMacro)
-            macroInfoBar.recordedSignal.connect(self.__updateKeyMacro)
-            macroInfoBar.clickedSignal.connect(self.__clickKeyMacro)
-            keyMacroLayout.addWidget(macroInfoBar)
-            self.keyMacroWidgets[macroID] = macroInfoBar
-
-        newInfoBar = self.__newKeyMacroInfoBar()
-        keyMacroLayout.addWidget(newInfoBar)
-        if len(self.keyMacros) > 0:
-            self.resize(self.width(), self.height() + min(len(self.keyMacros) * 75, 500))
-        return keyMacroLayout
+        return self.newMacroConfig['id']
+
+    def getKeyMacro(self, macroConfig: dict) -> KeyMacro:
+        macroID = macroConfig.get("id")
+        keyMacro = self.keyMacroObjects.get(macroID)
+        if keyMacro is None:
+            keyMacro = KeyMacro(macroConfig.get("record"))
+            if isinstance(macroConfig.get("record"), list):
+                # 只保留紧凑的事件存储, 释放加载时的字典列表
+                macroConfig['record'] = keyMacro.eventsRecord
+            if macroConfig.get('simplify'):
+                keyMacro.simplifier = MoveSimplifier(**macroConfig['simplify'])
+            try:
+                keyMacro.filters = FilterPipeline.fromConfig(macroConfig.get('filters', DEFAULT_FILTERS))
+            except (TypeError, ValueError) as e:
+                logger.warning(f"[{macroID}] 录制过滤配置错误! {e}")
+            keyMacro.backend = macroConfig.get('backend')
+            # 合批窗口以毫秒保存, 负数为不合批
+            batchWindow = macroConfig.get('batchWindow', 0)
+            keyMacro.batchWindow = None if batchWindow < 0 else batchWindow / 1000
+            keyMacro.collapseMoves = macroConfig.get('collapseMoves', False)
+            keyMacro.priority = macroConfig.get('priority', 0)
+            keyMacro.timeWarp = TimeWarp.fromConfig(macroConfig)
+            keyMacro.name = macroConfig.get('name', "")
+            keyMacro.resolver = self.resolveMacro
+            if macroConfig.get('script'):
+                try:
+                    keyMacro.program = parseText(macroConfig['script'])
+                except ScriptError as e:
+                    logger.warning(f"[{macroID}] 组合宏解析失败! {e}")
+            self.keyMacroObjects[macroID] = keyMacro
+        return keyMacro
+
+    def resolveMacro(self, target: str) -> tuple:
+        # 组合宏中 @call 的目标按 id 或名称在已保存的宏中查找, 只能在界面线程调用
+        return macroResolver(self.keyMacros, self.getKeyMacro)(target)
+
+    def snapshotResolver(self):
+        # 在界面线程复制各宏的名称与记录(或组合宏), 返回只读取该快照的查找函数, 供后台任务使用
+        entries = {}
+        for macroID, macroConfig in self.keyMacros.items():
+            keyMacro = self.keyMacroObjects.get(macroID)
+            if keyMacro is not None and keyMacro.program is not None:
+                source = keyMacro.program
+            else:
+                source = macroConfig.get('script') or macroConfig.get('record')
+            entries[macroID] = (macroConfig.get('name', ""), source)
+        return snapshotResolver(entries)
+
+    def __createKeyMacroInfoBar(self, macroID: str):
+        if macroID in self.keyMacros:
+            icon, macroConfig = FluentIcon.QUICK_NOTE, self.keyMacros[macroID]
+        else:
+            icon, macroConfig = FluentIcon.ADD_TO, self.newMacroConfig
+        macroInfoBar = KeyMacroInfoBar(icon, macroConfig, self.getKeyMacro(macroConfig), self.snapshotResolver)
+        macroInfoBar.deletedSignal.connect(self.__deleteKeyMacro)
+        macroInfoBar.recordedSignal.connect(self.__updateKeyMacro)
+        macroInfoBar.clickedSignal.connect(self.__clickKeyMacro)
+        macroInfoBar.changedSignal.connect(self.__changeKeyMacro)
+        macroInfoBar.hotkeyChangedSignal.connect(self.__changeHotkey)
+        return macroInfoBar
 
     def __updateKeyMacro(self, macroID: str):
         if macroID not in self.keyMacros:
-            keyMacroInfoBar = self.keyMacroWidgets[macroID]
-            if len(keyMacroInfoBar.keyMacro.eventsRecord) <= 0:
+            if len(self.keyMacroObjects[macroID]) <= 0:
                 return
-            self.keyMacros[macroID] = keyMacroInfoBar.macroConfig
+            self.keyMacros[macroID] = self.newMacroConfig
+            self.persistence.markDirty(macroID)
 
-            newInfoBar = self.__newKeyMacroInfoBar()
+            newMacroID = self.__newKeyMacroConfig()
             if self.height() < 500:
                 self.resize(self.width(), self.height() + 75)
+            self.macroList.appendMacro(newMacroID)
+            newInfoBar = self.macroList.widgetFor(newMacroID)
             newInfoBar.setOpacity(0)
-            self.keyMacrosUI.addWidget(newInfoBar)
             newInfoBar.fadeIn()
             self.update()
 
     def __deleteKeyMacro(self, macroID: str):
         if macroID in self.keyMacros:
             self.keyMacros.pop(macroID)
+            self.persistence.markDirty(macroID)
+            self.bindHotkey(macroID, "")
+            self.keyMacroObjects.pop(macroID, None)
+            if self.currentMacroID == macroID:
+                self.currentMacroID = None
+            # 等淡出动画结束再移除行
+            QTimer.singleShot(150, lambda: self.macroList.removeMacro(macroID))
+
+    def __changeKeyMacro(self, macroID: str, isRecord: bool):
+        if macroID in self.keyMacros:
+            self.persistence.markDirty(macroID, isRecord)
+
+    def __changeHotkey(self, macroID: str, hotkey: str):
+        macroConfig = self.keyMacros.get(macroID)
+        if macroConfig is not None and self.bindHotkey(macroID, hotkey):
+            macroConfig['hotkey'] = hotkey
+            self.persistence.markDirty(macroID, False)
+
+    def bindHotkey(self, macroID: str, hotkey: str) -> bool:
+        # 新快捷键冲突或无法识别时保留原绑定
+        name = self.keyMacros.get(macroID, {}).get("name", "")
+        try:
+            # 快捷键在钩子线程触发, 通过信号回到界面线程
+            getDispatcher().bind(macroID, hotkey, self.hotkeyPlaySignal.emit, (macroID,), name)
+        except HotkeyError as e:
+            logger.warning(e)
+            InfoBar.error("", f"绑定新快捷键失败! {e}", Qt.Orientation.Horizontal, True, 5000, InfoBarPosition.TOP_LEFT, self)
+            return False
+        if len(hotkey) > 0:
+            logger.info(f'set {hotkey} {name} shortcut play')
+        else:
+            logger.info(f'clear {name} shortcut play')
+        return True
 
     def __clickKeyMacro(self, macroID: str):
         if macroID in self.keyMacros:
-            self.currentInfoBar = self.keyMacroWidgets.get(macroID)
+            self.currentMacroID = macroID
 
-    def __shortCutPlay(self):
-        if self.currentInfoBar is not None:
-            logger.info("shortcut play...")
-            self.currentInfoBar.playing(not self.currentInfoBar.playButton.isChecked())
+    def __hotkeyPlay(self, macroID: str):
+        if macroID in self.keyMacros:
+            self.macroList.widgetFor(macroID).playing()
 
-    def __shortCutRecord(self):
-        if self.currentNewInfoBar is not None:
+    def __shortCut(self, action: str):
+        if action == "play" and self.currentMacroID is not None:
+            logger.info("shortcut play...")
+            currentInfoBar = self.macroList.widgetFor(self.currentMacroID)
+            currentInfoBar.playing(not currentInfoBar.playButton.isChecked())
+        elif action == "record" and self.newMacroConfig is not None:
             logger.info("shortcut record...")
-            self.currentNewInfoBar.recording(not self.currentNewInfoBar.recordButton.isChecked())
+            currentNewInfoBar = self.macroList.widgetFor(self.newMacroConfig['id'])
+            currentNewInfoBar.recording(not currentNewInfoBar.recordButton.isChecked())
+
+    def __toggleStats(self):
+        enable = not self.statsView.isVisible()
+        self.statsView.setActive(enable)
+        height = self.statsView.sizeHint().height() + max(self.layout().spacing(), 0)
+        self.resize(self.width(), self.height() + (height if enable else -height))
 
     def loadKeyMacros(self):
-        if self.macrosPath.exists():
-            self.keyMacros = loadJson(self.macrosPath)
+        self.keyMacros = self.persistence.load()
 
     def saveKeyMacros(self):
-        dumpJson(self.macrosPath, self.keyMacros)
+        self.persistence.flush()
 
     def closeEvent(self, event):
-        self.saveKeyMacros()
-        keyboard.remove_all_hotkeys()
+        for handle in getScheduler().active():
+            handle.cancel(False)
+        perfStats.disableStats()
+        shutdownWorkerPool()
+        self.persistence.close()
+        stopDispatcher()
         event.accept()
 
 
+class KeyMacroListModel(QAbstractListModel):
+
+    def __init__(self, parent=None):
+        super().__init__(parent=parent)
+        self.macroIDs: list = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.macroIDs)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.SizeHintRole:
+            return QSize(0, ROW_HEIGHT)
+        return None
+
+    def setMacroIDs(self, macroIDs: list):
+        self.beginResetModel()
+        self.macroIDs = macroIDs
+        self.endResetModel()
+
+    def appendMacro(self, macroID: str):
+        self.beginInsertRows(QModelIndex(), len(self.macroIDs), len(self.macroIDs))
+        self.macroIDs.append(macroID)
+        self.endInsertRows()
+
+    def removeMacro(self, macroID: str):
+        if macroID in self.macroIDs:
+            row = self.macroIDs.index(macroID)
+            self.beginRemoveRows(QModelIndex(), row, row)
+            self.macroIDs.pop(row)
+            self.endRemoveRows()
+
+
+class KeyMacroListView(QListView):
+    # 只为可见行(及上下各 OVERSCAN_ROWS 行)创建 KeyMacroInfoBar, 滚出可见区域且空闲的行控件会被释放
+    OVERSCAN_ROWS = 2
+
+    def __init__(self, createWidget, parent=None):
+        super().__init__(parent=parent)
+        self.createWidget = createWidget
+        self.widgets: dict = {}
+        # 行控件释放时保存的勾选状态
+        self.rowStates: dict = {}
+        self.listModel = KeyMacroListModel(self)
+        self.setModel(self.listModel)
+        self.__initUI()
+
+    def __initUI(self):
+        self.setUniformItemSizes(True)
+        self.setSpacing(ROW_SPACING // 2)
+        self.setSelectionMode(QListView.SelectionMode.NoSelection)
+        self.setEditTriggers(QListView.EditTrigger.NoEditTriggers)
+        self.setVerticalScrollMode(QListView.ScrollMode.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setFocusPolicy(Qt.FocusPolicy.NoFocus)
+        self.verticalScrollBar().setSingleStep(20)
+        self.setObjectName("keyMacrosArea")
+        # 样式表设置在列表上, 所有行控件共用一份
+        self.setStyleSheet(INFO_BAR_QSS + """
+            #keyMacrosArea {border: 0px; background-color: transparent;}
+            #keyMacrosArea::item {border: 0px; background-color: transparent;}
+            """)
+
+        self.verticalScrollBar().valueChanged.connect(self.updateWidgets)
+        self.listModel.rowsInserted.connect(self.updateWidgets)
+        self.listModel.rowsRemoved.connect(self.updateWidgets)
+        self.listModel.modelReset.connect(self.updateWidgets)
+
+    def setMacroIDs(self, macroIDs: list):
+        for macroID in list(self.widgets):
+            self.widgets.pop(macroID).deleteLater()
+        self.listModel.setMacroIDs(macroIDs)
+
+    def appendMacro(self, macroID: str):
+        self.listModel.appendMacro(macroID)
+
+    def removeMacro(self, macroID: str):
+        # 行控件已在淡出后自行关闭, 移除行即可
+        self.widgets.pop(macroID, None)
+        self.rowStates.pop(macroID, None)
+        self.listModel.removeMacro(macroID)
+
+    def visibleRows(self) -> range:
+        rowHeight = ROW_HEIGHT + ROW_SPACING
+        top = self.verticalScrollBar().value()
+        first = max(top // rowHeight - self.OVERSCAN_ROWS, 0)
+        last = min((top + self.viewport().height()) // rowHeight + self.OVERSCAN_ROWS, len(self.listModel.macroIDs) - 1)
+        return range(first, last + 1)
+
+    def updateWidgets(self):
+        macroIDs = self.listModel.macroIDs
+        visible = {macroIDs[row] for row in self.visibleRows()}
+        for macroID, widget in list(self.widgets.items()):
+            if macroID not in visible and not widget.isBusy():
+                self.rowStates[macroID] = widget.saveState()
+                self.widgets.pop(macroID).deleteLater()
+        for macroID in visible:
+            self.widgetFor(macroID)
+
+    def widgetFor(self, macroID: str):
+        widget = self.widgets.get(macroID)
+        if widget is None:
+            widget = self.createWidget(macroID)
+            widget.restoreState(self.rowStates.pop(macroID, None))
+            self.widgets[macroID] = widget
+            self.setIndexWidget(self.listModel.index(self.listModel.macroIDs.index(macroID)), widget)
+        return widget
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.updateWidgets()
+
+    def paintEvent(self, event):
+        painter = QPainter(self.viewport())
+        painter.setPen(QPen(QColor(200, 200, 200), 0.5, Qt.PenStyle.DotLine))
+
+        # 绘制水平网格线
+        for y in range(0, self.viewport().height(), 10):  # 10为网格间距
+            painter.drawLine(0, y, self.viewport().width(), y)
+
+        # 绘制垂直网格线
+        for x in range(0, self.viewport().width(), 10):
+            painter.drawLine(x, 0, x, self.viewport().height())
+        painter.end()
+        super().paintEvent(event)
+
+
 class KeyMacroInfoBar(QFrame):
     clickedSignal = Signal(str)
     deletedSignal = Signal(str)
     playedSignal = Signal(str)
     recordedSignal = Signal(str)
+    changedSignal = Signal(str, bool)
+    hotkeyChangedSignal = Signal(str, str)
 
-    def __init__(self, icon, macroConfig: dict, parent=None):
+    def __init__(self, icon, macroConfig: dict, keyMacro: KeyMacro = None, snapshotResolver=None, parent=None):
         super().__init__(parent=parent)
         self.macroConfig = macroConfig
         self.id = macroConfig.get("id")
-        self.keyMacro = KeyMacro(macroConfig.get("record"))
-        self.hotkey = None
+        self.keyMacro = KeyMacro(macroConfig.get("record")) if keyMacro is None else keyMacro
+        # 后台任务不能读取界面线程的宏列表, 提交任务前由 snapshotResolver 取得只读的查找函数
+        self.snapshotResolver = snapshotResolver
 
         self.icon = icon
         self.flyoutHandler = None
+        # 编辑、设置弹窗与透明度动画在首次使用时才创建
+        self.editingView = None
+        self.settingView = None
+        self.opacityEffect = None
+        self.opacityAni = None
+        # 任务类型(edit、parse、play) -> 后台任务, 进度条在首次报告进度时创建
+        self.jobs: dict = {}
+        self.progressBar = None
 
         self.__initUI()
-        self.setHotkey(macroConfig.get('hotkey', ""))
 
     def __initUI(self):
         self.playedSignal.connect(self.__played)
         self.recordedSignal.connect(self.__recorded)
-        self.setFixedHeight(75)
+        self.setFixedHeight(ROW_HEIGHT)
         self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
 
         self.titleLabel = QLabel(self.macroConfig.get('title', ""))
@@ -175,11 +494,6 @@ class KeyMacroInfoBar(QFrame):
         self.textLayout = QHBoxLayout()
         self.widgetLayout = QHBoxLayout()
 
-        self.opacityEffect = QGraphicsOpacityEffect(self)
-        self.opacityAni = QPropertyAnimation(self.opacityEffect, b'opacity', self)
-        self.opacityEffect.setOpacity(1)
-        self.setGraphicsEffect(self.opacityEffect)
-
         self.recordButton = TransparentToggleToolButton(FluentIcon.PLAY, None)
         self.recordButton.clicked.connect(self.recording)
         self.recordButton.setToolTip("开始录制")
@@ -204,17 +518,7 @@ class KeyMacroInfoBar(QFrame):
         self.settingButton.clicked.connect(self.__setting)
         self.settingButton.setToolTip("设置")
 
-        self.editingView = EditScriptView('编辑')
-        self.editingView.submitSignal.connect(self.setRecord)
-
-        self.settingView = SettingsView("设置")
-        self.settingView.setDelayValue(self.macroConfig.get("delay", 0))
-        self.settingView.setHotKey(self.macroConfig.get("hotkey", ""))
-        self.settingView.removeSignal.connect(self.__deleting)
-        self.settingView.delayChangedSignal.connect(self.setDelay)
-        self.settingView.hotkeyChangedSignal.connect(self.setHotkey)
-
-        if len(self.keyMacro.eventsRecord) <= 0:
+        if len(self.keyMacro) <= 0:
             self.playButton.setEnabled(False)
             self.settingButton.setEnabled(False)
 
@@ -259,125 +563,93 @@ class KeyMacroInfoBar(QFrame):
         self.contentLabel.setObjectName('contentLabel')
         if isinstance(self.icon, Enum):
             self.setProperty('type', self.icon.value)
-        self.setStyleSheet("""
-            KeyMacroInfoBar {
-                border: 1px solid rgb(229, 229, 229);
-                border-radius: 6px;
-                background-color: rgb(246, 246, 246);
-            }
-
-            KeyMacroInfoBar:focus {
-                border: 1px solid rgb(219, 219, 219);
-                border-radius: 6px;
-                background-color: rgb(250, 250, 250);
-            }
-
-            #titleLabel {
-                font: 14px 'Segoe UI', 'Microsoft YaHei', 'PingFang SC';
-                font-weight: bold;
-                color: black;
-                background-color: transparent;
-            }
-
-            #contentLabel {
-                font: 14px 'Segoe UI', 'Microsoft YaHei', 'PingFang SC';
-                color: black;
-                background-color: transparent;
-            }
-            """)
 
     def setName(self, text: str):
         self.macroConfig['name'] = text
+        self.keyMacro.name = text
+        self.changedSignal.emit(self.id, False)
 
     def setDelay(self, delay: int):
         self.macroConfig['delay'] = delay
+        self.changedSignal.emit(self.id, False)
+
+    def setTimeWarp(self, name: str, value):
+        # name 为 speed、maxGap 或 minHold, 播放计划在下次播放时按新参数重新生成
+        self.macroConfig[name] = value
+        self.keyMacro.timeWarp = TimeWarp.fromConfig(self.macroConfig)
+        self.changedSignal.emit(self.id, False)
 
     def setHotkey(self, hotkey: str = ""):
-        if self.hotkey is not None:
-            try:
-                keyboard.remove_hotkey(self.hotkey)
-            except Exception as e:
-                logger.exception(e)
-                InfoBar.warning("", "解绑旧快捷键失败!", Qt.Orientation.Horizontal, True, 5000, InfoBarPosition.TOP_LEFT, self.window())
-                self.hotkey = None
+        # 快捷键由 KeyMacroUI 统一绑定, 与行控件的生命周期无关
+        self.hotkeyChangedSignal.emit(self.id, hotkey)
 
-        if len(hotkey) > 0:
-            logger.info(f'set {hotkey} {self.macroConfig.get("name", "")} shortcut play')
-            try:
-                self.hotkey = keyboard.add_hotkey(hotkey, self.playing, suppress=True, trigger_on_release=True)
-                self.macroConfig['hotkey'] = hotkey
-            except Exception as e:
-                logger.exception(e)
-                InfoBar.error("", "绑定新快捷键失败!", Qt.Orientation.Horizontal, True, 5000, InfoBarPosition.TOP_LEFT, self.window())
-                self.hotkey = None
+    def setRecord(self, contents: str):
+        if len(contents) > 0:
+            # 解析与组合宏的链接检查在后台执行, 完成后才替换记录
+            self.submitJob("parse", parseScript, contents, self.getResolver(), self.keyMacro.name,
+                           onDone=lambda result: self.__applyScript(contents, result), onError=lambda error: self.__jobFailed("保存失败!", error))
         else:
-            logger.info(f'clear {self.macroConfig.get("name", "")} shortcut play')
-            self.macroConfig['hotkey'] = ""
+            InfoBar.warning("", "脚本内容不能为空!", Qt.Orientation.Horizontal, True, 2000, InfoBarPosition.TOP_LEFT, self.window())
 
-    def setRecord(self, contents: str):
-        def recorded():
-            self.recordedSignal.emit(self.id)
+    def __applyScript(self, contents: str, result):
+        if isinstance(result, ScriptProgram):
+            # 组合宏保存脚本原文
+            self.keyMacro.program = result
+            self.keyMacro.eventsRecord = None
+            self.macroConfig['script'] = contents
+        else:
+            self.keyMacro.eventsRecord = result
+            self.keyMacro.program = None
+            self.macroConfig.pop('script', None)
 
-        if len(contents) > 0:
-            keyMacro = KeyMacro()
-            row, delay = 0, 0
-            try:
-                for row, line in enumerate(contents.splitlines()):
-                    if len(line.strip()) == 0:
-                        continue
-                    if ':' in line:
-                        lineSplit = line.split(":")
-                        recordKey, recordType = lineSplit[0].strip(), lineSplit[1].strip()
-                        if recordType == "move":
-                            keyMacro.addMouseRecord(ujson.loads(recordKey), recordType, delay)
-                        elif recordType == "wheel":
-                            keyMacro.addMouseRecord(float(recordKey), recordType, delay)
-                        elif recordKey in {"mouse left", "mouse right", "mouse middle"}:
-                            keyMacro.addMouseRecord(recordKey.replace("mouse ", ''), recordType, delay)
-                        else:
-                            keyMacro.addKeyRecord(recordKey, recordType, delay)
-                        delay = 0
-                    else:
-                        delay = float(line.strip())
-                self.keyMacro = keyMacro
-            except Exception as e:
-                logger.exception(e)
-                InfoBar.error("", f"保存失败!第{row + 1}行发现错误!", Qt.Orientation.Horizontal, True, 5000, InfoBarPosition.TOP_LEFT, self.window())
-                return
+        self.clearFlyout()
+        self.switchRecordStatus(True)
+        getWorkerPool().post(self.recordedSignal.emit, self.id)
+        InfoBar.info("", "保存成功!", Qt.Orientation.Horizontal, True, 2000, InfoBarPosition.TOP_LEFT, self.window())
 
-            self.clearFlyout()
-            self.switchRecordStatus(True)
-            _thread.start_new_thread(recorded, ())
+    def setPage(self, page: int, text: str):
+        # 分页编辑: 只解析改动的行并原地替换对应事件, 不重建整个记录; 耗时只与页大小有关, 直接在界面线程执行
+        try:
+            with recordLock:
+                _, removed, added = applyPage(self.keyMacro.eventsRecord, page, text)
+        except ScriptError as e:
+            logger.warning(e)
+            InfoBar.error("", f"保存失败!第{e.line}行: {e.message}", Qt.Orientation.Horizontal, True, 5000, InfoBarPosition.TOP_LEFT, self.window())
+            return
+
+        self.editingView.reloadPage()
+        if removed > 0 or added > 0:
+            getWorkerPool().post(self.recordedSignal.emit, self.id)
             InfoBar.info("", "保存成功!", Qt.Orientation.Horizontal, True, 2000, InfoBarPosition.TOP_LEFT, self.window())
-        else:
-            InfoBar.warning("", "脚本内容不能为空!", Qt.Orientation.Horizontal, True, 2000, InfoBarPosition.TOP_LEFT, self.window())
 
     def recording(self, enable: bool):
-        def recorded():
-            self.recordedSignal.emit(self.id)
-
         if enable:
-            if len(self.keyMacro.eventsRecord) > 0 and not showMessageDialog("提示", "是否要重新录制脚本?", self):
+            if len(self.keyMacro) > 0 and not showMessageDialog("提示", "是否要重新录制脚本?", self):
                 self.recordButton.setChecked(False)
                 return
+            self.cancelJobs()
             self.keyMacro.terminateRecord()
-            winsound.PlaySound(str(SOUND_DIR / "recordOn.wav"), winsound.SND_FILENAME | winsound.SND_ASYNC)
+            # 重新录制后不再是组合宏
+            self.keyMacro.program = None
+            self.macroConfig.pop('script', None)
+            playSound("recordOn.wav")
             self.switchRecordStatus(False)
             self.keyMacro.startRecording(self.isKeyCheckBox.isChecked(), self.isMouseCheckBox.isChecked())
         else:
             self.keyMacro.stopRecording(self.isKeyCheckBox.isChecked(), self.isMouseCheckBox.isChecked())
-            winsound.PlaySound(str(SOUND_DIR / "recordOff.wav"), winsound.SND_FILENAME | winsound.SND_ASYNC)
+            playSound("recordOff.wav")
             self.switchRecordStatus(True)
-            _thread.start_new_thread(recorded, ())
+            getWorkerPool().post(self.recordedSignal.emit, self.id)
 
     @Slot()
     def __recorded(self):
-        if len(self.keyMacro.eventsRecord) > 0:
+        if len(self.keyMacro) > 0:
             self.macroConfig['title'] = "Script"
             self.macroConfig['record'] = self.keyMacro.eventsRecord
             self.titleLabel.setText("Script")
             self.icon = FluentIcon.QUICK_NOTE
             self.iconWidget.icon = self.icon
+            self.changedSignal.emit(self.id, True)
 
     def playing(self, enable: bool = None):
         def callback():
@@ -388,52 +660,73 @@ class KeyMacroInfoBar(QFrame):
 
         if enable:
             logger.info("playing...")
-            winsound.PlaySound(str(SOUND_DIR / "playOn.wav"), winsound.SND_FILENAME | winsound.SND_ASYNC)
+            playSound("playOn.wav")
             self.switchPlayStatus(False)
-            self.keyMacro.playRecord(True, self.isLoopCheckBox.isChecked(), self.macroConfig.get('delay', 0), callback)
+            # 解码与生成播放计划在后台执行, 完成后才开始播放; 期间再次切换即取消
+            source = self.keyMacro.planSource(self.getResolver())
+            self.submitJob("play", preparePlan, source, onDone=lambda result: self.__startPlaying(source, result, callback), onError=self.__playFailed)
         else:
             logger.info('stop playing.')
+            self.cancelJob("play")
             self.keyMacro.terminateRecord(False)
             self.switchPlayStatus(True)
-            winsound.PlaySound(str(SOUND_DIR / "playOff.wav"), winsound.SND_FILENAME | winsound.SND_ASYNC)
+            playSound("playOff.wav")
+
+    def __startPlaying(self, source: PlanSource, result: tuple, callback):
+        plan, record = result
+        self.keyMacro.installPlan(source, plan, record)
+        self.keyMacro.playRecord(True, self.isLoopCheckBox.isChecked(), self.macroConfig.get('delay', 0), callback, plan=plan)
+
+    def __playFailed(self, error: Exception):
+        # 组合宏调用的宏已被删除或改名时为 ScriptError
+        self.__jobFailed("播放失败!", error)
+        self.switchPlayStatus(True)
 
     @Slot()
     def __played(self):
         logger.info("play over.")
-        winsound.PlaySound(str(SOUND_DIR / "playOff.wav"), winsound.SND_FILENAME | winsound.SND_ASYNC)
+        playSound("playOff.wav")
         self.switchPlayStatus(True)
 
     def __deleting(self):
         self.clearFlyout()
         if not showMessageDialog("提示", "是否删除脚本?", self):
             return
-        if self.hotkey is not None:
-            keyboard.remove_hotkey(self.hotkey)
+        self.cancelJobs()
+        self.keyMacro.terminateRecord(False)
         self.fadeOut()
         self.deletedSignal.emit(self.id)
 
     def __editing(self, event):
-        contents = ""
-        lastTime = next(iter(self.keyMacro.eventsRecord[0].values()))['time'] if len(self.keyMacro.eventsRecord) > 0 else 0
-        try:
-            for eventRecord in self.keyMacro.eventsRecord:
-                for eventType, record in eventRecord.items():
-                    recordKey = record['key' if "key" in record else ('offset' if 'offset' in record else "delta")]
-                    recordType = record['type']
-                    recordTime = record['time']
-                    if eventType == "mouse" and (recordKey == "left" or recordKey == "right" or recordKey == "middle"):
-                        recordKey = f"mouse {recordKey}"
-
-                    contents += f"{int((recordTime - lastTime) * 1000):04d}\n{recordKey}: {recordType}\n"
-                    lastTime = recordTime
-        except Exception as e:
-            logger.exception(e)
-            InfoBar.error("", "脚本文本化失败!", Qt.Orientation.Horizontal, True, 5000, InfoBarPosition.TOP_LEFT, self.window())
+        if self.editingView is None:
+            self.editingView = EditScriptView('编辑')
+            self.editingView.submitSignal.connect(self.setRecord)
+            self.editingView.pageSubmitSignal.connect(self.setPage)
 
-        self.editingView.setEditText(contents)
+        if self.keyMacro.program is not None:
+            self.__showEditing(self.macroConfig.get('script', ""))
+        else:
+            # 解码与文本化在后台执行, 完成后再弹出编辑框
+            self.submitJob("edit", loadForEditing, self.keyMacro, onDone=self.__showEditing, onError=lambda error: self.__jobFailed("脚本文本化失败!", error))
+
+    def __showEditing(self, contents):
+        if isinstance(contents, str):
+            self.editingView.setEditText(contents)
+        else:
+            # 超过一页的录制按页编辑, 不整体编码
+            self.editingView.setPagedRecord(contents)
         self.flyoutHandler = Flyout.make(self.editingView, self.editButton, self.window(), FlyoutAnimationType.DROP_DOWN, False)
 
     def __setting(self, event):
+        if self.settingView is None:
+            self.settingView = SettingsView("设置")
+            self.settingView.setDelayValue(self.macroConfig.get("delay", 0))
+            self.settingView.setHotKey(self.macroConfig.get("hotkey", ""))
+            self.settingView.setTimeWarp(self.macroConfig.get("speed", 1.0), self.macroConfig.get("maxGap", 0), self.macroConfig.get("minHold", 0))
+            self.settingView.removeSignal.connect(self.__deleting)
+            self.settingView.delayChangedSignal.connect(self.setDelay)
+            self.settingView.hotkeyChangedSignal.connect(self.setHotkey)
+            self.settingView.timeWarpChangedSignal.connect(self.setTimeWarp)
         self.flyoutHandler = Flyout.make(self.settingView, self.settingButton, self.window(), FlyoutAnimationType.DROP_DOWN, False)
 
     def addWidget(self, widget: QWidget, stretch=0):
@@ -444,7 +737,15 @@ class KeyMacroInfoBar(QFrame):
         self.widgetLayout.addSpacing(15)
         self.widgetLayout.addLayout(layout, stretch)
 
+    def __initOpacity(self):
+        if self.opacityEffect is None:
+            self.opacityEffect = QGraphicsOpacityEffect(self)
+            self.opacityAni = QPropertyAnimation(self.opacityEffect, b'opacity', self)
+            self.opacityEffect.setOpacity(1)
+            self.setGraphicsEffect(self.opacityEffect)
+
     def fadeOut(self):
+        self.__initOpacity()
         self.opacityAni.setDuration(100)
         self.opacityAni.setStartValue(1)
         self.opacityAni.setEndValue(0)
@@ -452,11 +753,65 @@ class KeyMacroInfoBar(QFrame):
         self.opacityAni.start()
 
     def fadeIn(self):
+        self.__initOpacity()
         self.opacityAni.setDuration(100)
         self.opacityAni.setStartValue(0)
         self.opacityAni.setEndValue(1)
         self.opacityAni.start()
 
+    def getResolver(self):
+        # 在界面线程调用, 返回的查找函数可交给后台任务
+        if self.snapshotResolver is None:
+            return self.keyMacro.resolver
+        return self.snapshotResolver()
+
+    def submitJob(self, kind: str, func, *args, onDone=None, onError=None) -> Job:
+        # 同一行同类的任务只保留最新的一个; 结果、错误与进度都在界面线程回调
+        job = getWorkerPool().submit(func, *args, name=f"{self.keyMacro.name or self.id} {kind}", key=(self.id, kind),
+                                     onDone=onDone, onError=onError, onProgress=self.__showProgress, onFinished=self.__jobFinished)
+        self.jobs[kind] = job
+        return job
+
+    def cancelJob(self, kind: str):
+        job = self.jobs.get(kind)
+        if job is not None:
+            job.cancel()
+
+    def cancelJobs(self):
+        for job in list(self.jobs.values()):
+            job.cancel()
+
+    def __jobFinished(self, job: Job):
+        kind = job.key[1]
+        if self.jobs.get(kind) is job:
+            self.jobs.pop(kind)
+        if self.progressBar is not None and len(self.jobs) == 0:
+            self.progressBar.setVisible(False)
+
+    def __jobFailed(self, title: str, error: Exception):
+        if isinstance(error, ScriptError):
+            logger.warning(error)
+            InfoBar.error("", f"{title}第{error.line}行: {error.message}", Qt.Orientation.Horizontal, True, 5000, InfoBarPosition.TOP_LEFT, self.window())
+        else:
+            logger.error(f"{title} {error!r}")
+            InfoBar.error("", title, Qt.Orientation.Horizontal, True, 5000, InfoBarPosition.TOP_LEFT, self.window())
+
+    def __showProgress(self, progress: float):
+        if self.progressBar is None:
+            self.progressBar = ProgressBar(self)
+            self.progressBar.setFixedHeight(3)
+            self.__placeProgressBar()
+        self.progressBar.setValue(int(progress * 100))
+        self.progressBar.setVisible(True)
+
+    def __placeProgressBar(self):
+        self.progressBar.setGeometry(8, self.height() - 5, self.width() - 16, 3)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.progressBar is not None:
+            self.__placeProgressBar()
+
     def clearFlyout(self):
         if self.flyoutHandler is not None:
             self.flyoutHandler.close()
@@ -465,7 +820,7 @@ class KeyMacroInfoBar(QFrame):
         self.recordButton.setChecked(not status)
         if status:
             self.recordButton.setIcon(FluentIcon.PLAY)
-            if len(self.keyMacro.eventsRecord) > 0:
+            if len(self.keyMacro) > 0:
                 self.playButton.setEnabled(status)
                 self.settingButton.setEnabled(status)
         else:
@@ -488,8 +843,28 @@ class KeyMacroInfoBar(QFrame):
         self.settingButton.setEnabled(status)
 
     def setOpacity(self, value: float):
+        self.__initOpacity()
         self.opacityEffect.setOpacity(value)
 
+    def isBusy(self) -> bool:
+        # 播放、录制中、有后台任务或弹窗打开时, 行控件不能被列表回收
+        if self.playButton.isChecked() or self.recordButton.isChecked() or len(self.jobs) > 0:
+            return True
+        return self.flyoutHandler is not None and self.flyoutHandler.isVisible()
+
+    def saveState(self) -> dict:
+        return {
+            "isKey": self.isKeyCheckBox.isChecked(),
+            "isMouse": self.isMouseCheckBox.isChecked(),
+            "isLoop": self.isLoopCheckBox.isChecked()
+        }
+
+    def restoreState(self, state: dict | None):
+        if state:
+            self.isKeyCheckBox.setChecked(state["isKey"])
+            self.isMouseCheckBox.setChecked(state["isMouse"])
+            self.isLoopCheckBox.setChecked(state["isLoop"])
+
     def mousePressEvent(self, event):
         self.clickedSignal.emit(self.id)
         return super().mousePressEvent(event)
@@ -501,33 +876,121 @@ class KeyMacroInfoBar(QFrame):
 
 class EditScriptView(FlyoutView):
     submitSignal = Signal(str)
+    # (页号, 页文本), 分页编辑时只提交当前页
+    pageSubmitSignal = Signal(int, str)
 
     def __init__(self, title: str, parent=None):
         super().__init__(title, "", parent=parent)
+        # 为 None 时整体编辑, 否则按页编辑该记录
+        self.eventsRecord = None
+        self.page = 0
+        self.pageText = ""
         self.__initUI()
 
     def __initUI(self):
         self.editText = TextEdit()
         self.editText.setMinimumSize(250, 200)
         setFont(self.editText, 16)
+        # 停止输入后再校验, 只显示当前页的错误行
+        self.validateTimer = QTimer(self)
+        self.validateTimer.setSingleShot(True)
+        self.validateTimer.setInterval(200)
+        self.validateTimer.timeout.connect(self.__validate)
+        self.editText.textChanged.connect(self.validateTimer.start)
+
+        self.prevButton = TransparentToolButton(FluentIcon.LEFT_ARROW, None)
+        self.prevButton.clicked.connect(lambda: self.__turnPage(-1))
+        self.nextButton = TransparentToolButton(FluentIcon.RIGHT_ARROW, None)
+        self.nextButton.clicked.connect(lambda: self.__turnPage(1))
+        self.pageLabel = QLabel()
+        self.pageLabel.setStyleSheet("font: 13px 'Segoe UI', 'Microsoft YaHei', 'PingFang SC';")
+        self.pageWidget = QWidget()
+        pageLayout = QHBoxLayout(self.pageWidget)
+        pageLayout.setContentsMargins(0, 0, 0, 0)
+        pageLayout.addWidget(self.prevButton)
+        pageLayout.addWidget(self.pageLabel)
+        pageLayout.addWidget(self.nextButton)
+        pageLayout.addStretch(1)
+        self.pageWidget.setVisible(False)
+
+        self.errorLabel = QLabel()
+        self.errorLabel.setStyleSheet("font: 13px 'Segoe UI', 'Microsoft YaHei', 'PingFang SC'; color: #c42b1c;")
+        self.errorLabel.setVisible(False)
 
         self.submitButton = PushButton(FluentIcon.SAVE, "保存")
         self.submitButton.clicked.connect(self.__submit)
 
+        self.addWidget(self.pageWidget)
         self.addWidget(self.editText)
+        self.addWidget(self.errorLabel)
         self.addWidget(self.submitButton, align=Qt.AlignmentFlag.AlignRight)
 
     def __submit(self, event):
-        self.submitSignal.emit(self.editText.toPlainText())
+        if self.eventsRecord is None:
+            self.submitSignal.emit(self.editText.toPlainText())
+        else:
+            self.pageSubmitSignal.emit(self.page, self.editText.toPlainText())
 
     def setEditText(self, text: str):
+        self.eventsRecord = None
+        self.pageWidget.setVisible(False)
         self.editText.setText(text)
 
+    def setPagedRecord(self, eventsRecord, page: int = 0):
+        # 大脚本只编码当前页, 保存时只应用改动的行
+        self.eventsRecord = eventsRecord
+        self.pageWidget.setVisible(True)
+        self.__loadPage(page)
+
+    def reloadPage(self):
+        if self.eventsRecord is not None:
+            self.__loadPage(self.page)
+
+    def __loadPage(self, page: int):
+        count = pageCount(self.eventsRecord)
+        self.page = min(max(page, 0), count - 1)
+        self.pageText = encodePage(self.eventsRecord, self.page)
+        self.editText.setPlainText(self.pageText)
+        self.pageLabel.setText(f"{self.page + 1}/{count} 页, 第 {pageLine(self.page) + 1} 行起")
+        self.prevButton.setEnabled(self.page > 0)
+        self.nextButton.setEnabled(self.page < count - 1)
+
+    def __turnPage(self, step: int):
+        text = self.editText.toPlainText()
+        if text != self.pageText:
+            # 翻页前提交本页的修改, 有错误时停留在本页
+            if self.__validate():
+                return
+            self.pageSubmitSignal.emit(self.page, text)
+        self.__loadPage(self.page + step)
+
+    def __validate(self) -> int:
+        # 标出错误行并返回错误数; 单行校验按行文本缓存, 只有改动的行会重新解析
+        self.validateTimer.stop()
+        errors = validateText(self.editText.toPlainText()) if self.eventsRecord is not None else []
+        selections, document = [], self.editText.document()
+        for lineNo, _ in errors:
+            selection = QTextEdit.ExtraSelection()
+            textFormat = QTextCharFormat()
+            textFormat.setBackground(QColor(196, 43, 28, 40))
+            textFormat.setProperty(QTextFormat.Property.FullWidthSelection, True)
+            selection.format = textFormat
+            selection.cursor = QTextCursor(document.findBlockByNumber(lineNo - 1))
+            selections.append(selection)
+        self.editText.setExtraSelections(selections)
+        if errors:
+            lineNo, message = errors[0]
+            more = f" 等 {len(errors)} 处错误" if len(errors) > 1 else ""
+            self.errorLabel.setText(f"第{pageLine(self.page) + lineNo}行: {message}{more}")
+        self.errorLabel.setVisible(len(errors) > 0)
+        return len(errors)
+
 
 class SettingsView(FlyoutView):
     removeSignal = Signal()
     delayChangedSignal = Signal(int)
     hotkeyChangedSignal = Signal(str)
+    timeWarpChangedSignal = Signal(str, object)
 
     def __init__(self, title: str, parent=None):
         super().__init__(title, "", parent=parent)
@@ -553,6 +1016,27 @@ class SettingsView(FlyoutView):
         self.hotkeyEdit = HotKeyEdit()
         self.hotkeyEdit.textChanged.connect(self.hotkeyChangedSignal)
 
+        self.speedEdit = DoubleSpinBox()
+        self.speedEdit.setRange(0.1, 100)
+        self.speedEdit.setSingleStep(0.5)
+        self.speedEdit.valueChanged.connect(lambda value: self.timeWarpChangedSignal.emit("speed", value))
+        self.speedLabel = QLabel("播放倍速")
+        self.speedLabel.setStyleSheet("font: 14px 'Segoe UI', 'Microsoft YaHei', 'PingFang SC';")
+
+        self.maxGapEdit = SpinBox()
+        self.maxGapEdit.setRange(0, 2147483647)
+        self.maxGapEdit.setSingleStep(100)
+        self.maxGapEdit.valueChanged.connect(lambda value: self.timeWarpChangedSignal.emit("maxGap", value))
+        self.maxGapLabel = QLabel("最长空闲/ms (0为不限)")
+        self.maxGapLabel.setStyleSheet("font: 14px 'Segoe UI', 'Microsoft YaHei', 'PingFang SC';")
+
+        self.minHoldEdit = SpinBox()
+        self.minHoldEdit.setRange(0, 10000)
+        self.minHoldEdit.setSingleStep(10)
+        self.minHoldEdit.valueChanged.connect(lambda value: self.timeWarpChangedSignal.emit("minHold", value))
+        self.minHoldLabel = QLabel("最短按住/ms")
+        self.minHoldLabel.setStyleSheet("font: 14px 'Segoe UI', 'Microsoft YaHei', 'PingFang SC';")
+
         self.addWidget(self.removeButton)
 
         self.widgetLayout.addSpacing(5)
@@ -561,6 +1045,13 @@ class SettingsView(FlyoutView):
         self.widgetLayout.addSpacing(5)
         self.addWidget(self.hotkeyLabel)
         self.addWidget(self.hotkeyEdit)
+        self.widgetLayout.addSpacing(5)
+        self.addWidget(self.speedLabel)
+        self.addWidget(self.speedEdit)
+        self.addWidget(self.maxGapLabel)
+        self.addWidget(self.maxGapEdit)
+        self.addWidget(self.minHoldLabel)
+        self.addWidget(self.minHoldEdit)
 
     def getDelayValue(self):
         return self.delayEdit.value()
@@ -571,6 +1062,13 @@ class SettingsView(FlyoutView):
     def getHotkey(self):
         return self.hotkeyEdit.text()
 
+    def setTimeWarp(self, speed: float, maxGap: int, minHold: int):
+        # 初始化数值时不发出修改信号
+        for edit, value in ((self.speedEdit, speed), (self.maxGapEdit, maxGap), (self.minHoldEdit, minHold)):
+            edit.blockSignals(True)
+            edit.setValue(value)
+            edit.blockSignals(False)
+
     def setHotKey(self, hotkey: str):
         self.hotkeyEdit.shortcut = hotkey
         self.hotkeyEdit.setText(hotkey)
@@ -644,21 +1142,87 @@ class LabelEdit(LineEdit):
         self.setReadOnly(True)
 
 
-class BackgroundWidget(QFrame):
+class PerfStatsView(QFrame):
+    # 显示时开启运行统计并每秒刷新, 隐藏时关闭统计
     def __init__(self, parent=None):
-        super().__init__(parent=parent)
+        super().__init__(parent)
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh)
+        self.__initUI()
 
-    def paintEvent(self, event):
-        painter = QPainter(self)
-        painter.setPen(QPen(QColor(200, 200, 200), 0.5, Qt.PenStyle.DotLine))
+    def __initUI(self):
+        self.setObjectName("statsView")
+        self.setStyleSheet("#statsView {border: 1px solid rgb(229, 229, 229); border-radius: 6px; background-color: rgb(246, 246, 246);}")
+        self.contentLabel = QLabel()
+        self.contentLabel.setStyleSheet("font: 13px 'Consolas', 'Microsoft YaHei', 'PingFang SC'; color: black;")
+        self.resetButton = TransparentToolButton(FluentIcon.SYNC, None)
+        self.resetButton.setToolTip("重置统计")
+        self.resetButton.clicked.connect(self.reset)
+
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(10, 6, 6, 6)
+        layout.addWidget(self.contentLabel, 1)
+        layout.addWidget(self.resetButton, alignment=Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignRight)
+
+    def setActive(self, enable: bool):
+        if enable:
+            perfStats.enableStats()
+            self.refresh()
+            self.timer.start()
+        else:
+            self.timer.stop()
+            perfStats.disableStats()
+        self.setVisible(enable)
 
-        # 绘制水平网格线
-        for y in range(0, self.height(), 10):  # 20为网格间距
-            painter.drawLine(0, y, self.width(), y)
+    def reset(self):
+        stats = perfStats.getStats()
+        if stats is not None:
+            stats.reset()
+            self.refresh()
 
-        # 绘制垂直网格线
-        for x in range(0, self.width(), 10):
-            painter.drawLine(x, 0, x, self.height())
+    def refresh(self):
+        def ms(summary: dict, key: str) -> str:
+            return f"{summary[key] / 1e6:.2f}"
+
+        def us(summary: dict, key: str) -> str:
+            return f"{summary[key] / 1e3:.1f}"
+
+        stats = perfStats.getStats()
+        if stats is None:
+            return
+        snapshot = stats.snapshot()
+        lateness, dispatch = snapshot['lateness'], snapshot['dispatch']
+        key, mouse = snapshot['hookDuration']['key'], snapshot['hookDuration']['mouse']
+        runs = sum(macro['runs'] for macro in snapshot['macros'].values())
+        lines = [
+            f"播放事件 {snapshot['events']}  速率 {snapshot['eventsPerSecond']:.0f}/s  运行 {runs} 次",
+            f"延后(ms) p50 {ms(lateness, 'p50Ns')}  p99 {ms(lateness, 'p99Ns')}  最大 {ms(lateness, 'maxNs')}",
+            f"注入耗时(µs) p50 {us(dispatch, 'p50Ns')}  p99 {us(dispatch, 'p99Ns')}  最大 {us(dispatch, 'maxNs')}",
+            f"钩子耗时(µs) 键盘 p99 {us(key, 'p99Ns')}  鼠标 p99 {us(mouse, 'p99Ns')}"
+        ]
+        for name, macro in sorted(snapshot['macros'].items(), key=lambda item: -item[1]['events'])[:3]:
+            lines.append(f"{name or '-'}: 运行 {macro['runs']}  完成 {macro['finished']}  取消 {macro['cancelled']}  事件 {macro['events']}")
+        self.contentLabel.setText("\n".join(lines))
+
+
+class GuiDispatcher(QObject):
+    # 工作线程发出信号, Qt 将其排队到界面线程执行回调; 在界面线程调用时延后到当前事件处理完之后
+    postSignal = Signal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.postSignal.connect(self.__call, Qt.ConnectionType.QueuedConnection)
+
+    def post(self, callback):
+        self.postSignal.emit(callback)
+
+    @Slot(object)
+    def __call(self, callback):
+        try:
+            callback()
+        except Exception as e:
+            logger.exception(f"界面回调失败! {e}")
 
 
 class SplitLineWidget(QFrame):
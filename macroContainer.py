@@ -0,0 +1,270 @@
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+
+from pathlib import Path
+
+import ujson
+
+from eventStore import EventStore
+from segmentStore import MAX_DRIFT, assembleSegments, decodeSegment, encodeSegment, splitSegments
+from utils import loadJson, dumpJson
+
+# 文件结构: 魔数 | 索引长度 | 索引(json) | 各宏的压缩事件块
+# 索引中每项记录宏 id、名称、快捷键、事件数、事件块的字节范围(相对数据区起点)以及其余配置
+MAGIC = b"KMC1"
+# 分片格式: 事件流按内容切成片段, 相同片段只存一份; 索引为 {"segments": {哈希: 字节范围}, "macros": [...]}
+# 每个宏记录 [片段哈希, 片段起始时间] 列表, 读取时再拼接
+SEGMENTED_MAGIC = b"KMS1"
+FILE_HEADER = struct.Struct('<4sI')
+
+
+def encodeBlock(record: EventStore) -> bytes:
+    return zlib.compress(record.toBytes(), 1)
+
+
+def decodeBlock(data) -> EventStore:
+    return EventStore.fromBytes(zlib.decompress(data))
+
+
+def toEventStore(record) -> EventStore:
+    if isinstance(record, EventStore):
+        return record
+    if isinstance(record, LazyRecord):
+        return record.load()
+    return EventStore.fromList(record or [])
+
+
+class LazyRecord:
+    # 尚未解码的事件块, 只在播放、编辑或导出时才读取
+    __slots__ = ("container", "macroID", "count")
+
+    def __init__(self, container, macroID: str, count: int):
+        self.container = container
+        self.macroID = macroID
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __repr__(self):
+        return f"LazyRecord({self.macroID}, {self.count} events)"
+
+    def load(self) -> EventStore:
+        return self.container.loadRecord(self.macroID)
+
+    def rawBlock(self):
+        return self.container.rawBlock(self.macroID)
+
+
+def writeContainer(path: str | Path, keyMacros: dict, segmented: bool = False):
+    path = Path(path)
+    if not path.parent.exists():
+        path.parent.mkdir(parents=True)
+
+    index, blocks, offset = [], [], 0
+    # 分片格式下的 哈希 -> [偏移, 长度]
+    segments = {}
+    for macroID, macroConfig in keyMacros.items():
+        record = macroConfig.get('record')
+        entry = {
+            "id": macroID,
+            "name": macroConfig.get('name', ""),
+            "hotkey": macroConfig.get('hotkey', ""),
+            "count": len(record) if record is not None else 0
+        }
+        if segmented:
+            if isinstance(record, LazyRecord) and record.container.isSegmented:
+                # 未改动的宏直接沿用原片段, 无需解码
+                refs = record.container.segmentRefs(record.macroID)
+                encoded = ((start, segmentHash, record.container.rawSegment) for segmentHash, start in refs)
+            else:
+                encoded = ((start, *encodeSegment(part)) for start, part in splitSegments(toEventStore(record)))
+            refs = []
+            for start, segmentHash, block in encoded:
+                if segmentHash not in segments:
+                    if callable(block):
+                        block = block(segmentHash)
+                    segments[segmentHash] = [offset, len(block)]
+                    blocks.append(block)
+                    offset += len(block)
+                refs.append([segmentHash, start])
+            entry["segments"] = refs
+        else:
+            if isinstance(record, LazyRecord) and not record.container.isSegmented:
+                # 未改动的宏直接复制原事件块, 无需解码
+                block = record.rawBlock()
+            else:
+                record = toEventStore(record)
+                block = encodeBlock(record)
+                entry["count"] = len(record)
+            entry["range"] = [offset, len(block)]
+            blocks.append(block)
+            offset += len(block)
+        entry["config"] = {key: value for key, value in macroConfig.items() if key != 'record'}
+        index.append(entry)
+
+    header = ujson.dumps({"segments": segments, "macros": index} if segmented else index, ensure_ascii=False).encode('utf-8')
+    with path.open('wb') as f:
+        f.write(FILE_HEADER.pack(SEGMENTED_MAGIC if segmented else MAGIC, len(header)))
+        f.write(header)
+        for block in blocks:
+            f.write(block)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class MacroContainer:
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.file = None
+        self.buffer = None
+        self.index: dict = {}
+        self.dataOffset = 0
+        self.isSegmented = False
+        self.segments: dict = {}
+        # 已解码的片段, 多个宏共用的片段只解码一次
+        self.segmentCache: dict = {}
+        # 后台保存替换文件时, 防止其他线程同时读取事件块
+        self.lock = threading.RLock()
+        self.open()
+
+    def __contains__(self, macroID):
+        return macroID in self.index
+
+    def open(self):
+        if not self.path.exists():
+            raise FileNotFoundError(f'[{self.path}] 宏文件读取失败, 文件不存在!')
+        self.file = self.path.open('rb')
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, headerLength = FILE_HEADER.unpack_from(self.buffer, 0)
+        if magic not in {MAGIC, SEGMENTED_MAGIC}:
+            self.close()
+            raise ValueError(f'[{self.path}] 不是有效的宏文件!')
+        self.dataOffset = FILE_HEADER.size + headerLength
+        header = ujson.loads(self.buffer[FILE_HEADER.size:self.dataOffset].decode('utf-8'))
+        self.isSegmented = magic == SEGMENTED_MAGIC
+        if self.isSegmented:
+            self.segments, header = header['segments'], header['macros']
+        self.index = {entry['id']: entry for entry in header}
+
+    def close(self):
+        self.segmentCache.clear()
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def rawBlock(self, macroID: str) -> bytes:
+        if self.isSegmented:
+            return encodeBlock(self.loadRecord(macroID))
+        with self.lock:
+            offset, length = self.index[macroID]['range']
+            start = self.dataOffset + offset
+            return self.buffer[start:start + length]
+
+    def rawSegment(self, segmentHash: str) -> bytes:
+        with self.lock:
+            offset, length = self.segments[segmentHash]
+            start = self.dataOffset + offset
+            return self.buffer[start:start + length]
+
+    def segmentRefs(self, macroID: str) -> list:
+        # [[片段哈希, 片段起始时间], ...]
+        return self.index[macroID]['segments']
+
+    def loadSegment(self, segmentHash: str) -> EventStore:
+        segment = self.segmentCache.get(segmentHash)
+        if segment is None:
+            segment = self.segmentCache[segmentHash] = decodeSegment(self.rawSegment(segmentHash))
+        return segment
+
+    def loadRecord(self, macroID: str) -> EventStore:
+        if self.isSegmented:
+            return assembleSegments((start, self.loadSegment(segmentHash)) for segmentHash, start in self.segmentRefs(macroID))
+        return decodeBlock(self.rawBlock(macroID))
+
+    def segmentReport(self) -> dict:
+        # 分片格式的去重情况: 引用的片段总字节数与实际存储字节数之比
+        if not self.isSegmented:
+            return {}
+        references = [segmentHash for entry in self.index.values() for segmentHash, _ in entry['segments']]
+        referenced = sum(self.segments[segmentHash][1] for segmentHash in references)
+        stored = sum(length for _, length in self.segments.values())
+        return {
+            "segments": len(self.segments),
+            "references": len(references),
+            "referencedBytes": referenced,
+            "storedBytes": stored,
+            "dedupRatio": referenced / stored if stored else 1.0
+        }
+
+    def loadConfigs(self) -> dict:
+        keyMacros = {}
+        for macroID, entry in self.index.items():
+            macroConfig = dict(entry['config'])
+            macroConfig['record'] = LazyRecord(self, macroID, entry['count'])
+            keyMacros[macroID] = macroConfig
+        return keyMacros
+
+    def save(self, keyMacros: dict, segmented: bool = None):
+        # 先写临时文件再替换, 替换前需关闭映射(windows 下无法替换已映射的文件); 默认保持原有格式
+        tempPath = self.path.with_name(self.path.name + ".tmp")
+        with self.lock:
+            writeContainer(tempPath, keyMacros, self.isSegmented if segmented is None else segmented)
+            self.close()
+            os.replace(tempPath, self.path)
+            self.open()
+
+
+def migrateJson(jsonPath: str | Path, containerPath: str | Path):
+    writeContainer(containerPath, loadJson(Path(jsonPath)))
+
+
+def exportJson(containerPath: str | Path, jsonPath: str | Path):
+    container = MacroContainer(containerPath)
+    try:
+        keyMacros = container.loadConfigs()
+        for macroConfig in keyMacros.values():
+            macroConfig['record'] = toEventStore(macroConfig['record']).toList()
+        dumpJson(jsonPath, keyMacros)
+    finally:
+        container.close()
+
+
+def convertContainer(containerPath: str | Path, segmented: bool) -> dict:
+    # 在分片格式与普通格式之间转换, 之后的保存都沿用转换后的格式; 已是目标格式时不重写
+    # 分片时事件时间按 segmentStore.TICK 取整(误差不超过 MAX_DRIFT), 转换回普通格式不能恢复原来的时间
+    container = MacroContainer(containerPath)
+    try:
+        if container.isSegmented != segmented:
+            container.save(container.loadConfigs(), segmented)
+        return container.segmentReport()
+    finally:
+        container.close()
+
+
+if __name__ == "__main__":
+    if not (len(sys.argv) == 4 and sys.argv[1] in {"migrate", "export"}) and not (len(sys.argv) == 3 and sys.argv[1] in {"segment", "flatten"}):
+        print("usage: python macroContainer.py migrate <keyMacros.json> <keyMacros.kmc>\n"
+              "       python macroContainer.py export <keyMacros.kmc> <keyMacros.json>\n"
+              "       python macroContainer.py segment <keyMacros.kmc>    相同的事件片段只保存一份; 有损: 事件时间按 0.1 微秒间隔取整,\n"
+              f"                                                          误差最多约 {MAX_DRIFT * 1e6:.1f} 微秒, 之后 flatten 也不能恢复原来的时间\n"
+              "       python macroContainer.py flatten <keyMacros.kmc>    恢复为每个宏单独保存(保留分片时取整后的时间)")
+        sys.exit(1)
+    if sys.argv[1] == "migrate":
+        migrateJson(sys.argv[2], sys.argv[3])
+    elif sys.argv[1] == "export":
+        exportJson(sys.argv[2], sys.argv[3])
+    elif sys.argv[1] == "segment":
+        print(f"注意: 分片后事件时间按 0.1 微秒间隔取整, 误差最多约 {MAX_DRIFT * 1e6:.1f} 微秒, 不可恢复")
+        report = convertContainer(sys.argv[2], True)
+        print(f"{report['segments']} 个片段, 共引用 {report['references']} 次, 去重率 {report['dedupRatio']:.2f}")
+    else:
+        convertContainer(sys.argv[2], False)
@@ -0,0 +1,172 @@
+import os
+import struct
+import threading
+import time
+import zlib
+
+from pathlib import Path
+
+import ujson
+
+from eventStore import snapshotRecord
+from macroContainer import MacroContainer, decodeBlock, encodeBlock, migrateJson, toEventStore, writeContainer
+from utils import logger
+
+# 日志项: 操作 | 校验和 | 配置长度 | 事件块长度, 之后是配置(json)和事件块
+JOURNAL_ENTRY = struct.Struct('<BIII')
+PUT, PUT_CONFIG, DELETE = 1, 2, 3
+class MacroPersistence:
+    # 改动先以追加日志的方式在后台写入, 日志过大时再整体重写宏文件(原子替换)并清空日志
+    def __init__(self, containerPath: str | Path, jsonPath: str | Path = None, debounce: float = 1.0, compactBytes: int = 8 * 1048576):
+        self.containerPath = Path(containerPath)
+        self.journalPath = self.containerPath.with_suffix(".kmj")
+        self.jsonPath = None if jsonPath is None else Path(jsonPath)
+        self.debounce = debounce
+        self.compactBytes = compactBytes
+        self.container: MacroContainer | None = None
+        self.keyMacros: dict = {}
+        # macroID -> 事件记录是否也有改动
+        self.dirty: dict = {}
+        self.lastChange = 0
+        self.condition = threading.Condition()
+        self.writeLock = threading.RLock()
+        # 已写入宏文件或日志、带有事件块的宏
+        self.stored = set()
+        self.thread = None
+        self.isClosed = False
+
+    def load(self) -> dict:
+        if not self.containerPath.exists():
+            if self.jsonPath is not None and self.jsonPath.exists():
+                logger.info(f"migrate {self.jsonPath.name} to {self.containerPath.name}")
+                migrateJson(self.jsonPath, self.containerPath)
+            else:
+                writeContainer(self.containerPath, {})
+        self.container = MacroContainer(self.containerPath)
+        self.keyMacros = self.container.loadConfigs()
+        self.stored = set(self.keyMacros)
+        self.replayJournal()
+        if self.journalPath.exists():
+            self.compact()
+
+        self.isClosed = False
+        self.thread = threading.Thread(target=self.running, name="macroPersist", daemon=True)
+        self.thread.start()
+        return self.keyMacros
+
+    def replayJournal(self) -> int:
+        # 返回重放的日志项数, 遇到残缺项即停止
+        if not self.journalPath.exists():
+            return 0
+        data, position, count = self.journalPath.read_bytes(), 0, 0
+        while position + JOURNAL_ENTRY.size <= len(data):
+            operation, checksum, configLength, blockLength = JOURNAL_ENTRY.unpack_from(data, position)
+            start = position + JOURNAL_ENTRY.size
+            end = start + configLength + blockLength
+            if end > len(data) or zlib.crc32(data[start:end]) != checksum:
+                # 写入中途崩溃留下的残缺日志项, 丢弃其后的内容
+                logger.warning(f"宏日志在 {position} 字节处损坏, 已忽略后续内容")
+                break
+            macroConfig = ujson.loads(data[start:start + configLength].decode('utf-8'))
+            macroID = macroConfig['id']
+            if operation == DELETE:
+                self.keyMacros.pop(macroID, None)
+                self.stored.discard(macroID)
+            elif operation == PUT_CONFIG and macroID in self.keyMacros:
+                macroConfig['record'] = self.keyMacros[macroID].get('record')
+                self.keyMacros[macroID] = macroConfig
+            else:
+                try:
+                    macroConfig['record'] = decodeBlock(data[start + configLength:end])
+                except Exception as e:
+                    # 校验和正确但事件块无法解码(如写入了不完整的记录), 跳过该项, 保留之前的内容
+                    logger.error(f"宏日志在 {position} 字节处的 {macroID} 事件块无法解码, 已跳过! {e}")
+                    position = end
+                    continue
+                self.keyMacros[macroID] = macroConfig
+                self.stored.add(macroID)
+            position, count = end, count + 1
+        return count
+
+    def markDirty(self, macroID: str, isRecord: bool = True):
+        with self.condition:
+            self.dirty[macroID] = self.dirty.get(macroID, False) or isRecord
+            self.lastChange = time.monotonic()
+            self.condition.notify()
+
+    def running(self):
+        while True:
+            with self.condition:
+                if self.isClosed:
+                    return
+                if len(self.dirty) == 0:
+                    self.condition.wait()
+                    continue
+                remain = self.lastChange + self.debounce - time.monotonic()
+                if remain > 0:
+                    self.condition.wait(remain)
+                    continue
+            self.flush()
+
+    def flush(self):
+        with self.writeLock:
+            with self.condition:
+                dirty, self.dirty = self.dirty, {}
+            if len(dirty) == 0:
+                return
+            try:
+                with self.journalPath.open('ab') as f:
+                    for macroID, isRecord in dirty.items():
+                        f.write(self.journalEntry(macroID, isRecord))
+                    f.flush()
+                    os.fsync(f.fileno())
+                logger.info(f"saved {len(dirty)} macros")
+            except Exception as e:
+                logger.exception(f"保存宏失败! {e}")
+                with self.condition:
+                    for macroID, isRecord in dirty.items():
+                        self.dirty[macroID] = self.dirty.get(macroID, False) or isRecord
+                return
+            if self.journalPath.stat().st_size > max(self.compactBytes, self.containerPath.stat().st_size):
+                self.compact()
+
+    def journalEntry(self, macroID: str, isRecord: bool) -> bytes:
+        macroConfig = self.keyMacros.get(macroID)
+        if macroConfig is None:
+            operation, config, block = DELETE, {"id": macroID}, b""
+            self.stored.discard(macroID)
+        else:
+            # dict() 复制是原子的, 避免界面线程同时修改配置
+            macroConfig = dict(macroConfig)
+            config = {key: value for key, value in macroConfig.items() if key != 'record'}
+            config['id'] = macroID
+            if isRecord or macroID not in self.stored:
+                operation, block = PUT, encodeBlock(toEventStore(snapshotRecord(macroConfig.get('record'))))
+                self.stored.add(macroID)
+            else:
+                operation, block = PUT_CONFIG, b""
+        configBytes = ujson.dumps(config, ensure_ascii=False).encode('utf-8')
+        payload = configBytes + block
+        return JOURNAL_ENTRY.pack(operation, zlib.crc32(payload), len(configBytes), len(block)) + payload
+
+    def compact(self):
+        with self.writeLock:
+            try:
+                keyMacros = {macroID: dict(macroConfig, record=snapshotRecord(macroConfig.get('record'))) for macroID, macroConfig in list(self.keyMacros.items())}
+                self.container.save(keyMacros)
+                self.journalPath.unlink(missing_ok=True)
+                logger.info("macros compacted")
+            except Exception as e:
+                logger.exception(f"整理宏文件失败! {e}")
+
+    def close(self):
+        with self.condition:
+            self.isClosed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+        if self.container is not None:
+            self.container.close()
+            self.container = None
@@ -0,0 +1,341 @@
+from typing import Callable, Iterable
+
+from eventStore import EventStore, MOUSE_MOVE, MOUSE_WHEEL
+from scriptCodec import ScriptError, isDirective, parseDelay, parseEvent
+from timeWarp import TimeWarp
+
+# 组合宏: 脚本中除延迟行与事件行外, 还可以使用指令
+#   @call <宏 id 或名称>       插入另一个宏的全部事件
+#   @repeat <次数> ... @end    重复其中的内容, 可嵌套
+# 指令前的延迟行为距上一个事件的间隔, @end 前的延迟留在重复的内容末尾(即每轮之间的间隔). 被调用的宏直接引用其事件记录, 重复不复制事件,
+# 播放时才按需逐个展开, 内存只与脚本及被调用宏本身的大小相关
+MAX_REPEAT = 1_000_000
+
+
+def hasDirectives(contents: str) -> bool:
+    return "@" in contents and any(isDirective(line.strip()) for line in contents.splitlines())
+
+
+class EventBlock:
+    # 连续的事件行, 时间为相对上一语句最后一个事件的秒数
+    __slots__ = ("record", "elapsed")
+
+    def __init__(self):
+        self.record = EventStore()
+        # 按毫秒累加后再换算, 与 decodeText 一致
+        self.elapsed = 0.0
+
+
+class CallStatement:
+    __slots__ = ("target", "delay", "lineNo")
+
+    def __init__(self, target: str, delay: float, lineNo: int):
+        self.target = target
+        self.delay = delay
+        self.lineNo = lineNo
+
+
+class DelayStatement:
+    # 其后没有事件或指令的延迟行(如 @end 前)
+    __slots__ = ("delay", "lineNo")
+
+    def __init__(self, delay: float, lineNo: int):
+        self.delay = delay
+        self.lineNo = lineNo
+
+
+class RepeatStatement:
+    __slots__ = ("count", "body", "delay", "lineNo")
+
+    def __init__(self, count: int, delay: float, lineNo: int):
+        self.count = count
+        self.body = []
+        self.delay = delay
+        self.lineNo = lineNo
+
+
+class ScriptProgram:
+    # 解析后的脚本, @call 的目标在链接时才查找, 被调用的宏修改后无需重新解析
+    def __init__(self, statements: list, size: int):
+        self.statements = statements
+        # 事件行与指令行的数量
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+
+def parseProgram(lines: Iterable[str]) -> ScriptProgram:
+    # 逐行解析, 错误的行号与原文本一致
+    root = []
+    # [(当前语句列表, 所属的 RepeatStatement)]
+    stack = [(root, None)]
+    block, delay, size = None, 0.0, 0
+    for lineNo, line in enumerate(lines, 1):
+        stripped = line.strip()
+        if len(stripped) == 0:
+            continue
+        statements = stack[-1][0]
+        if isDirective(stripped):
+            directive, _, argument = stripped.partition(" ")
+            argument = argument.strip()
+            if directive == "@call":
+                if len(argument) == 0:
+                    raise ScriptError(lineNo, "@call 缺少宏 id 或名称")
+                statements.append(CallStatement(argument, delay, lineNo))
+            elif directive == "@repeat":
+                try:
+                    count = int(argument)
+                except ValueError:
+                    raise ScriptError(lineNo, f"重复次数格式错误: {argument}") from None
+                if not 0 <= count <= MAX_REPEAT:
+                    raise ScriptError(lineNo, f"重复次数须在 0 ~ {MAX_REPEAT} 之间: {count}")
+                repeat = RepeatStatement(count, delay, lineNo)
+                statements.append(repeat)
+                stack.append((repeat.body, repeat))
+            elif directive == "@end":
+                if len(stack) == 1:
+                    raise ScriptError(lineNo, "多余的 @end")
+                if delay:
+                    statements.append(DelayStatement(delay, lineNo))
+                stack.pop()
+            else:
+                raise ScriptError(lineNo, f"未知的指令: {directive}")
+            block, delay = None, 0.0
+            size += 1
+        elif ':' in stripped:
+            kind, key, x, y, delta = parseEvent(stripped, lineNo)
+            if block is None:
+                block = EventBlock()
+                statements.append(block)
+            block.elapsed += delay
+            block.record.appendKind(kind, block.elapsed / 1000, key, x, y, delta)
+            delay = 0.0
+            size += 1
+        else:
+            delay = parseDelay(stripped, lineNo)
+    if len(stack) > 1:
+        raise ScriptError(stack[-1][1].lineNo, "@repeat 缺少对应的 @end")
+    if delay:
+        # 脚本末尾的延迟, 被其他组合宏调用时作为与其后事件的间隔
+        root.append(DelayStatement(delay, lineNo))
+    return ScriptProgram(root, size)
+
+
+def parseText(contents: str) -> ScriptProgram:
+    return parseProgram(contents.splitlines())
+
+
+# 链接后的节点: count 为事件数, span 为从上一个事件到本节点最后一个事件的秒数,
+# rows(origin) 按顺序产出 (时间, kind, 参数), origin 为上一个事件的时间
+class RecordNode:
+    # 直接引用被调用宏的事件记录; 链接后记录被修改(如分页编辑)时停止展开并抛出 RuntimeError, 由调度器取消这次播放
+    __slots__ = ("record", "version", "first", "count", "span")
+
+    def __init__(self, record: EventStore, first: float):
+        self.record = record
+        self.version = record.version
+        self.first = first
+        self.count = len(record)
+        self.span = record.lastTime - first if self.count > 0 else 0.0
+
+    def rows(self, origin: float):
+        record, version = self.record, self.version
+        times, kinds, value = record.times, record.kinds, record.value
+        base = origin - self.first
+        for index in range(self.count):
+            try:
+                row = base + times[index], kinds[index], value(index)
+            except IndexError:
+                # 修改途中各列长度可能不一致
+                row = None
+            if row is None or record.version != version:
+                raise RuntimeError("被调用的宏在播放期间被修改, 已停止播放")
+            yield row
+
+
+class DelayNode:
+    __slots__ = ("delay", "body", "count", "span")
+
+    def __init__(self, delay: float, body):
+        self.delay = delay
+        self.body = body
+        self.count = body.count
+        self.span = delay + body.span
+
+    def rows(self, origin: float):
+        return self.body.rows(origin + self.delay)
+
+
+class SequenceNode:
+    __slots__ = ("nodes", "count", "span")
+
+    def __init__(self, nodes: list):
+        self.nodes = nodes
+        self.count = sum(node.count for node in nodes)
+        self.span = sum(node.span for node in nodes)
+
+    def rows(self, origin: float):
+        for node in self.nodes:
+            yield from node.rows(origin)
+            origin += node.span
+
+
+class RepeatNode:
+    __slots__ = ("times", "body", "count", "span")
+
+    def __init__(self, times: int, body: SequenceNode):
+        self.times = times
+        self.body = body
+        self.count = times * body.count
+        self.span = times * body.span
+
+    def rows(self, origin: float):
+        body, span = self.body, self.body.span
+        # 按轮次直接算起点, 多次重复不累积误差
+        for loop in range(self.times):
+            yield from body.rows(origin + loop * span)
+
+
+def linkProgram(program: ScriptProgram, resolve: Callable, name: str = "") -> SequenceNode:
+    # resolve(target) 返回 (宏名称, ScriptProgram 或事件记录), 找不到时抛出 LookupError
+    # 被调用的组合宏按对象判断是否已在调用链上, 以检测循环调用
+    return linkStatements(program.statements, resolve, ((program, name or "当前宏"),))
+
+
+def linkStatements(statements: list, resolve: Callable, chain: tuple) -> SequenceNode:
+    nodes = []
+    for statement in statements:
+        if isinstance(statement, EventBlock):
+            nodes.append(RecordNode(statement.record, 0.0))
+        elif isinstance(statement, RepeatStatement):
+            body = linkStatements(statement.body, resolve, chain)
+            nodes.append(DelayNode(statement.delay / 1000, RepeatNode(statement.count, body)))
+        elif isinstance(statement, DelayStatement):
+            nodes.append(DelayNode(statement.delay / 1000, SequenceNode([])))
+        else:
+            nodes.append(DelayNode(statement.delay / 1000, linkCall(statement, resolve, chain)))
+    return SequenceNode(nodes)
+
+
+def linkCall(statement: CallStatement, resolve: Callable, chain: tuple):
+    try:
+        name, source = resolve(statement.target)
+    except LookupError as e:
+        raise ScriptError(statement.lineNo, e.args[0] if e.args else f"找不到宏: {statement.target}") from None
+    if isinstance(source, ScriptProgram):
+        if any(source is program for program, _ in chain):
+            path = " -> ".join([label for _, label in chain] + [name])
+            raise ScriptError(statement.lineNo, f"循环调用: {path}")
+        try:
+            return linkStatements(source.statements, resolve, chain + ((source, name),))
+        except ScriptError as e:
+            # 错误统一报告在当前脚本的 @call 行
+            raise ScriptError(statement.lineNo, f"{name} 第{e.line}行: {e.message}") from None
+    if not isinstance(source, EventStore):
+        source = source.load()
+    return RecordNode(source, source.firstTime)
+
+
+class LazyPlan:
+    # 按需生成的播放计划, 项与 compilePlan 相同; 调度器只顺序访问当前项、上一项与最后一项, 回退时从头重新生成
+    def __init__(self, program: SequenceNode, handlers: list, timeWarp: TimeWarp = TimeWarp()):
+        self.program = program
+        self.handlers = handlers
+        self.timeWarp = timeWarp
+        self.count = program.count
+        self.__restart()
+
+    def __len__(self):
+        return self.count
+
+    def __restart(self):
+        self.items = self.__generate()
+        self.position = -1
+        self.current = self.previous = None
+
+    def __generate(self):
+        handlers = self.handlers
+        for offset, (_, kind, arg) in self.timeWarp.warp(self.program.rows(0.0)):
+            yield offset, handlers[kind], arg
+
+    def __getitem__(self, index: int) -> tuple:
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        if index == self.position:
+            return self.current
+        if index == self.position - 1:
+            return self.previous
+        if index < self.position:
+            self.__restart()
+        while self.position < index:
+            self.previous, self.current = self.current, next(self.items)
+            self.position += 1
+        return self.current
+
+
+def flattenProgram(program: SequenceNode) -> EventStore:
+    # 完整展开为事件记录, 用于导出或对比
+    eventsRecord = EventStore()
+    for time, kind, arg in program.rows(0.0):
+        if kind == MOUSE_MOVE:
+            eventsRecord.appendKind(kind, time, x=arg[0], y=arg[1])
+        elif kind == MOUSE_WHEEL:
+            eventsRecord.appendKind(kind, time, delta=arg)
+        else:
+            eventsRecord.appendKind(kind, time, arg)
+    return eventsRecord
+
+
+def snapshotResolver(entries: dict) -> Callable:
+    # entries 为 {宏 id: (名称, 事件记录、延迟记录、ScriptProgram 或脚本原文)}, 由界面线程取得;
+    # 查找只读取该快照(脚本原文在首次调用时解析并缓存), 可在工作线程中使用
+    names = {}
+    for macroID, (name, _) in entries.items():
+        names.setdefault(name, []).append(macroID)
+    sources = {}
+
+    def resolve(target: str) -> tuple:
+        macroID = target
+        if macroID not in entries:
+            matches = names.get(target, [])
+            if len(matches) == 0:
+                raise LookupError(f"找不到宏: {target}")
+            if len(matches) > 1:
+                raise LookupError(f"名称 {target} 对应多个宏, 请使用宏 id")
+            macroID = matches[0]
+        name, source = entries[macroID]
+        if macroID not in sources:
+            if isinstance(source, str):
+                try:
+                    source = parseText(source)
+                except ScriptError as e:
+                    raise LookupError(f"{name or target} 第{e.line}行: {e.message}") from None
+            elif isinstance(source, list):
+                source = EventStore.fromList(source)
+            elif source is None:
+                source = EventStore()
+            # 同一宏只解析一次, 组合宏按对象检测循环调用
+            sources[macroID] = source
+        return name or target, sources[macroID]
+
+    return resolve
+
+
+def macroResolver(keyMacros: dict, getKeyMacro: Callable) -> Callable:
+    # 按 id 或名称在 keyMacros 中查找, getKeyMacro(macroConfig) 返回对应的 KeyMacro
+    def resolve(target: str) -> tuple:
+        macroConfig = keyMacros.get(target)
+        if macroConfig is None:
+            matches = [config for config in keyMacros.values() if config.get('name') == target]
+            if len(matches) == 0:
+                raise LookupError(f"找不到宏: {target}")
+            if len(matches) > 1:
+                raise LookupError(f"名称 {target} 对应多个宏, 请使用宏 id")
+            macroConfig = matches[0]
+        keyMacro = getKeyMacro(macroConfig)
+        return macroConfig.get('name') or target, keyMacro.eventsRecord if keyMacro.program is None else keyMacro.program
+
+    return resolve
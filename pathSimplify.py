@@ -0,0 +1,94 @@
+import math
+
+from typing import NamedTuple
+
+from eventStore import EventStore, MOUSE_MOVE
+
+
+class SimplifyReport(NamedTuple):
+    removed: int = 0
+    maxError: float = 0
+
+    def merge(self, other):
+        return SimplifyReport(self.removed + other.removed, max(self.maxError, other.maxError))
+
+
+def segmentDistance(px, py, ax, ay, bx, by) -> float:
+    dx, dy = bx - ax, by - ay
+    length = dx * dx + dy * dy
+    if length == 0:
+        return math.hypot(px - ax, py - ay)
+    ratio = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length))
+    return math.hypot(px - ax - ratio * dx, py - ay - ratio * dy)
+
+
+def douglasPeucker(xs, ys, tolerance: float) -> list:
+    if len(xs) <= 2:
+        return list(range(len(xs)))
+    keep = [False] * len(xs)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(xs) - 1)]
+    while stack:
+        first, last = stack.pop()
+        farthest, distance = -1, tolerance
+        for index in range(first + 1, last):
+            current = segmentDistance(xs[index], ys[index], xs[first], ys[first], xs[last], ys[last])
+            if current > distance:
+                farthest, distance = index, current
+        if farthest >= 0:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [index for index, kept in enumerate(keep) if kept]
+
+
+class MoveSimplifier:
+    # tolerance: 折线简化允许的最大偏离(像素); minInterval/minDistance: 与上一个保留点的最小时间(秒)/距离(像素), 0 为不限制
+    def __init__(self, tolerance: float = 1.0, minInterval: float = 0, minDistance: float = 0):
+        self.tolerance = tolerance
+        self.minInterval = minInterval
+        self.minDistance = minDistance
+
+    def decimate(self, times, xs, ys) -> list:
+        if len(times) <= 2 or (self.minInterval <= 0 and self.minDistance <= 0):
+            return list(range(len(times)))
+        kept = [0]
+        for index in range(1, len(times) - 1):
+            last = kept[-1]
+            if times[index] - times[last] < self.minInterval:
+                continue
+            if math.hypot(xs[index] - xs[last], ys[index] - ys[last]) < self.minDistance:
+                continue
+            kept.append(index)
+        kept.append(len(times) - 1)
+        return kept
+
+    def simplifyRun(self, times, xs, ys) -> tuple[list, SimplifyReport]:
+        # 返回一段连续移动中保留的下标, 首尾两点总是保留
+        decimated = self.decimate(times, xs, ys)
+        if self.tolerance > 0:
+            simplified = douglasPeucker([xs[index] for index in decimated], [ys[index] for index in decimated], self.tolerance)
+            decimated = [decimated[index] for index in simplified]
+
+        maxError = 0
+        for first, last in zip(decimated, decimated[1:]):
+            for index in range(first + 1, last):
+                maxError = max(maxError, segmentDistance(xs[index], ys[index], xs[first], ys[first], xs[last], ys[last]))
+        return decimated, SimplifyReport(len(times) - len(decimated), maxError)
+
+    def simplify(self, eventsRecord: EventStore) -> tuple[EventStore, SimplifyReport]:
+        kinds, times, xs, ys = eventsRecord.kinds, eventsRecord.times, eventsRecord.xs, eventsRecord.ys
+        indices, report, start = [], SimplifyReport(), 0
+        while start < len(kinds):
+            if kinds[start] != MOUSE_MOVE:
+                indices.append(start)
+                start += 1
+                continue
+            end = start
+            while end < len(kinds) and kinds[end] == MOUSE_MOVE:
+                end += 1
+            kept, runReport = self.simplifyRun(times[start:end], xs[start:end], ys[start:end])
+            indices.extend(start + index for index in kept)
+            report = report.merge(runReport)
+            start = end
+        return eventsRecord.take(indices), report
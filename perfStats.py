@@ -0,0 +1,242 @@
+import threading
+import time
+
+from array import array
+
+import ujson
+
+# 播放与录制热路径的运行统计, 默认关闭; 关闭时各热路径只多一次 None 判断
+# 直方图以纳秒计, 每个二进制数量级分 SUB_BUCKETS 个桶, 内存与样本数无关
+SUB_BUCKETS = 4
+BUCKET_COUNT = 160
+RATE_SECONDS = 60
+TRACE_FLUSH_LINES = 256
+
+
+def bucketOf(value: int) -> int:
+    if value < SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - 3
+    return min((shift + 1) * SUB_BUCKETS + ((value >> shift) & (SUB_BUCKETS - 1)), BUCKET_COUNT - 1)
+
+
+def bucketUpper(bucket: int) -> int:
+    if bucket < SUB_BUCKETS:
+        return bucket
+    shift = bucket // SUB_BUCKETS - 1
+    return ((SUB_BUCKETS + bucket % SUB_BUCKETS + 1) << shift) - 1
+
+
+class Histogram:
+    # 单写者直方图, 百分位取所在桶的上界(误差不超过 25%)
+    def __init__(self):
+        self.counts = array('q', bytes(8 * BUCKET_COUNT))
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value: int):
+        if value < 0:
+            value = 0
+        self.counts[bucketOf(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def reset(self):
+        self.counts = array('q', bytes(8 * BUCKET_COUNT))
+        self.count = self.total = self.max = 0
+
+    def percentile(self, percent: float) -> int:
+        target = self.count * percent / 100
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(bucketUpper(bucket), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "meanNs": self.total // self.count if self.count else 0,
+            "p50Ns": self.percentile(50),
+            "p90Ns": self.percentile(90),
+            "p99Ns": self.percentile(99),
+            "maxNs": self.max
+        }
+
+
+class EventRate:
+    # 最近 RATE_SECONDS 秒每秒的事件数, 按秒循环复用
+    def __init__(self):
+        self.seconds = array('q', [-1] * RATE_SECONDS)
+        self.counts = array('q', bytes(8 * RATE_SECONDS))
+
+    def add(self, now: float, count: int = 1):
+        second = int(now)
+        slot = second % RATE_SECONDS
+        if self.seconds[slot] != second:
+            self.seconds[slot] = second
+            self.counts[slot] = 0
+        self.counts[slot] += count
+
+    def perSecond(self, now: float, window: int = 5) -> float:
+        # 不含当前未满的一秒
+        second = int(now)
+        total = 0
+        for past in range(second - window, second):
+            slot = past % RATE_SECONDS
+            if self.seconds[slot] == past:
+                total += self.counts[slot]
+        return total / window
+
+
+class MacroStats:
+    __slots__ = ("runs", "finished", "cancelled", "loops", "events")
+
+    def __init__(self):
+        self.runs = self.finished = self.cancelled = self.loops = self.events = 0
+
+    def summary(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class TraceWriter:
+    # 逐行写入 JSON 的跟踪文件, 攒满 TRACE_FLUSH_LINES 行或播放结束时才写盘
+    def __init__(self, path):
+        self.file = open(path, "a", encoding="utf-8")
+        self.lines = []
+        self.lock = threading.Lock()
+
+    def write(self, record: dict):
+        with self.lock:
+            # 关闭后调度线程可能仍持有旧的统计对象, 之后的记录直接丢弃
+            if self.file.closed:
+                return
+            self.lines.append(ujson.dumps(record, ensure_ascii=False))
+            if len(self.lines) >= TRACE_FLUSH_LINES:
+                self.__flush()
+
+    def flush(self):
+        with self.lock:
+            self.__flush()
+
+    def __flush(self):
+        if self.lines and not self.file.closed:
+            self.file.write("\n".join(self.lines) + "\n")
+            self.file.flush()
+            self.lines = []
+
+    def close(self):
+        with self.lock:
+            self.__flush()
+            self.file.close()
+
+
+class PerfStats:
+    # 钩子回调耗时按键盘、鼠标分开, 各自只由对应的钩子线程写入; 播放统计只由调度线程写入
+    def __init__(self, tracePath=None):
+        self.startedAt = time.perf_counter()
+        self.hookDuration = (Histogram(), Histogram())
+        self.dispatch = Histogram()
+        self.lateness = Histogram()
+        self.rate = EventRate()
+        self.events = 0
+        self.macros: dict = {}
+        self.lock = threading.Lock()
+        self.trace = None if tracePath is None else TraceWriter(tracePath)
+
+    def macro(self, name: str) -> MacroStats:
+        macroStats = self.macros.get(name)
+        if macroStats is None:
+            with self.lock:
+                macroStats = self.macros.setdefault(name, MacroStats())
+        return macroStats
+
+    def addRun(self, handle, state: str):
+        # state 为 start、loop、finished 或 cancelled
+        macroStats = self.macro(handle.name)
+        if state == "start":
+            macroStats.runs += 1
+        elif state == "loop":
+            macroStats.loops += 1
+        elif state == "finished":
+            macroStats.finished += 1
+        else:
+            macroStats.cancelled += 1
+        trace = self.trace
+        if trace is not None:
+            trace.write({"type": "run", "time": time.perf_counter(), "id": handle.id, "macro": handle.name, "state": state})
+            if state in {"finished", "cancelled"}:
+                trace.flush()
+
+    def addDispatch(self, handle, deadline: float, began: float, ended: float, count: int = 1):
+        # lateness 只在保留间隔播放时有意义
+        lateness = began - deadline if handle.keepInterval else None
+        if lateness is not None:
+            self.lateness.add(int(lateness * 1e9))
+        self.dispatch.add(int((ended - began) * 1e9))
+        self.events += count
+        self.rate.add(ended, count)
+        self.macro(handle.name).events += count
+        trace = self.trace
+        if trace is not None:
+            trace.write({"type": "event", "time": began, "id": handle.id, "macro": handle.name, "index": handle.index,
+                         "count": count, "latenessUs": None if lateness is None else round(lateness * 1e6, 1),
+                         "dispatchUs": round((ended - began) * 1e6, 1)})
+
+    def snapshot(self) -> dict:
+        now = time.perf_counter()
+        with self.lock:
+            macros = {name: macroStats.summary() for name, macroStats in self.macros.items()}
+        return {
+            "uptime": now - self.startedAt,
+            "events": self.events,
+            "eventsPerSecond": self.rate.perSecond(now),
+            "lateness": self.lateness.summary(),
+            "dispatch": self.dispatch.summary(),
+            "hookDuration": {"key": self.hookDuration[0].summary(), "mouse": self.hookDuration[1].summary()},
+            "macros": macros
+        }
+
+    def reset(self):
+        with self.lock:
+            self.startedAt = time.perf_counter()
+            for histogram in (*self.hookDuration, self.dispatch, self.lateness):
+                histogram.reset()
+            self.rate = EventRate()
+            self.events = 0
+            self.macros = {}
+
+    def close(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+
+stats: PerfStats | None = None
+
+
+def enableStats(tracePath=None) -> PerfStats:
+    # 已开启时沿用原统计, 只在指定跟踪文件时更换
+    global stats
+    if stats is None:
+        stats = PerfStats(tracePath)
+    elif tracePath is not None:
+        if stats.trace is not None:
+            stats.trace.close()
+        stats.trace = TraceWriter(tracePath)
+    return stats
+
+
+def disableStats():
+    global stats
+    current, stats = stats, None
+    if current is not None:
+        current.close()
+
+
+def getStats() -> PerfStats | None:
+    return stats
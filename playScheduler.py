@@ -0,0 +1,320 @@
+import heapq
+import itertools
+import threading
+import time
+
+from array import array
+
+import perfStats
+from utils import logger
+
+# 距截止时间小于该值(秒)时改为忙等, 避开 sleep 的唤醒误差
+SPIN_THRESHOLD = 0.002
+
+PENDING, PLAYING, PAUSED, FINISHED, CANCELLED = "pending", "playing", "paused", "finished", "cancelled"
+ACTIVE_STATES = {PENDING, PLAYING, PAUSED}
+
+
+def waitUntil(deadline: float, spinThreshold: float = SPIN_THRESHOLD):
+    remain = deadline - time.perf_counter()
+    if remain > spinThreshold:
+        time.sleep(remain - spinThreshold)
+    while time.perf_counter() < deadline:
+        pass
+
+
+class PlayHandle:
+    # 一次播放的句柄, 由 PlayScheduler.play 创建, 状态只在调度器的锁内修改
+    __ids = itertools.count(1)
+
+    def __init__(self, scheduler, plan: tuple, backend, keepInterval: bool = True, isLoop: bool = False, delay: int = 0,
+                 priority: int = 0, callback=None, isDeadline: bool = True, name: str = "", lateness: array = None):
+        self.id = next(self.__ids)
+        self.scheduler = scheduler
+        self.plan = plan
+        self.backend = backend
+        self.keepInterval = keepInterval
+        self.isLoop = isLoop
+        self.delay = delay
+        self.priority = priority
+        self.callback = callback
+        self.isDeadline = isDeadline
+        self.name = name
+        # 当前一轮中每个事件相对计划时间的延后(秒)
+        self.lateness = array('d') if lateness is None else lateness
+        self.state = PENDING
+        self.isCallback = True
+        self.index = 0
+        self.loops = 0
+        self.baseTime = 0
+        self.deadline = 0
+        self.pausedAt = 0
+        # 队列中的旧项以代数区分, 暂停、取消后旧项在出队时丢弃
+        self.generation = 0
+        self.done = threading.Event()
+        self.doneCallbacks = []
+
+    def __repr__(self):
+        return f"PlayHandle({self.id}, {self.name or '-'}, {self.state}, {self.index}/{len(self.plan)})"
+
+    @property
+    def isActive(self) -> bool:
+        return self.state in ACTIVE_STATES
+
+    def cancel(self, isCallback: bool = True) -> bool:
+        return self.scheduler.cancel(self, isCallback)
+
+    def pause(self) -> bool:
+        return self.scheduler.pause(self)
+
+    def resume(self) -> bool:
+        return self.scheduler.resume(self)
+
+    def wait(self, timeout: float = None) -> bool:
+        return self.done.wait(timeout)
+
+    def addDoneCallback(self, callback):
+        # 播放结束(包括取消)后在调度线程中以句柄为参数调用, 已结束时立即调用
+        with self.scheduler.condition:
+            if not self.done.is_set():
+                self.doneCallbacks.append(callback)
+                return
+        callback(self)
+
+
+class PlayScheduler:
+    # 所有宏的播放共用一个线程, 按下一个事件的截止时间从堆中取出执行
+    # maxRunning 为同时播放的上限(0 为不限), 超出的播放按优先级排队等待
+    def __init__(self, maxRunning: int = 0, spinThreshold: float = SPIN_THRESHOLD):
+        self.maxRunning = maxRunning
+        self.spinThreshold = spinThreshold
+        # (截止时间, -优先级, 序号, 代数, 句柄)
+        self.queue = []
+        # (-优先级, 序号, 句柄)
+        self.waiting = []
+        self.handles: dict = {}
+        self.finishing = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.thread = None
+        # 正在执行事件的句柄, 执行完后由调度线程推进
+        self.current: PlayHandle | None = None
+        # 为 True 时逐事件输出 debug 日志, 仅用于排查问题
+        self.logEvents = False
+
+    def play(self, plan: tuple, backend, keepInterval: bool = True, isLoop: bool = False, delay: int = 0, priority: int = 0,
+             callback=None, isDeadline: bool = True, name: str = "", lateness: array = None) -> PlayHandle:
+        handle = PlayHandle(self, plan, backend, keepInterval, isLoop, delay, priority, callback, isDeadline, name, lateness)
+        with self.condition:
+            self.handles[handle.id] = handle
+            if len(plan) == 0:
+                handle.state = FINISHED
+                self.finishing.append(handle)
+            elif self.maxRunning > 0 and self.runningCount() >= self.maxRunning:
+                heapq.heappush(self.waiting, (-priority, next(self.sequence), handle))
+            else:
+                self.__start(handle)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.running, name="playScheduler", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return handle
+
+    def active(self) -> list:
+        # 当前播放中、暂停或排队中的句柄, 按开始顺序排列
+        with self.condition:
+            return [handle for handle in self.handles.values() if handle.isActive]
+
+    def runningCount(self) -> int:
+        return sum(1 for handle in self.handles.values() if handle.state in {PLAYING, PAUSED})
+
+    def cancel(self, handle: PlayHandle, isCallback: bool = True) -> bool:
+        with self.condition:
+            if not handle.isActive:
+                return False
+            handle.isCallback = isCallback
+            handle.generation += 1
+            handle.state = CANCELLED
+            self.finishing.append(handle)
+            self.condition.notify()
+        return True
+
+    def pause(self, handle: PlayHandle) -> bool:
+        with self.condition:
+            if handle.state != PLAYING:
+                return False
+            handle.state = PAUSED
+            handle.generation += 1
+            handle.pausedAt = time.perf_counter()
+            self.condition.notify()
+        return True
+
+    def resume(self, handle: PlayHandle) -> bool:
+        with self.condition:
+            if handle.state != PAUSED:
+                return False
+            paused = time.perf_counter() - handle.pausedAt
+            handle.state = PLAYING
+            handle.baseTime += paused
+            if handle is not self.current:
+                self.__push(handle, handle.deadline + paused)
+            self.condition.notify()
+        return True
+
+    def __push(self, handle: PlayHandle, deadline: float):
+        # 暂停中的句柄只记下截止时间, 恢复时再入队
+        handle.deadline = deadline
+        if handle.state == PLAYING:
+            heapq.heappush(self.queue, (deadline, -handle.priority, next(self.sequence), handle.generation, handle))
+
+    def __start(self, handle: PlayHandle):
+        now = time.perf_counter()
+        handle.state = PLAYING
+        handle.index = 0
+        handle.baseTime = now
+        del handle.lateness[:]
+        self.__push(handle, now)
+        if perfStats.stats is not None:
+            perfStats.stats.addRun(handle, "start")
+
+    def __advance(self, handle: PlayHandle):
+        # 在锁内调用, 计算同一句柄下一个事件的截止时间
+        plan = handle.plan
+        handle.index += 1
+        if handle.index < len(plan):
+            if not handle.keepInterval:
+                # 不保留间隔时沿用刚执行事件的截止时间, 立即到期并与其他播放按顺序交替
+                nextDeadline = handle.deadline
+            elif handle.isDeadline:
+                # 按播放开始时刻的绝对截止时间调度, 误差不会逐个累积
+                nextDeadline = handle.baseTime + plan[handle.index][0]
+            else:
+                nextDeadline = time.perf_counter() + max(plan[handle.index][0] - plan[handle.index - 1][0], 0)
+            self.__push(handle, nextDeadline)
+            return
+
+        if not handle.isLoop:
+            handle.state = FINISHED
+            self.finishing.append(handle)
+            return
+        handle.index = 0
+        handle.loops += 1
+        del handle.lateness[:]
+        if perfStats.stats is not None:
+            perfStats.stats.addRun(handle, "loop")
+        if handle.keepInterval and handle.isDeadline:
+            handle.baseTime += plan[-1][0] + handle.delay / 1000
+        else:
+            handle.baseTime = time.perf_counter() + handle.delay / 1000
+        self.__push(handle, handle.baseTime)
+
+    def __fail(self, handle: PlayHandle):
+        # 在锁内调用, 出错的播放按取消结束, 不执行播放回调
+        handle.isCallback = False
+        handle.generation += 1
+        handle.state = CANCELLED
+        self.finishing.append(handle)
+
+    def __finish(self, handle: PlayHandle):
+        if perfStats.stats is not None:
+            perfStats.stats.addRun(handle, handle.state)
+        if handle.index > 0 or handle.loops > 0:
+            try:
+                handle.backend.restoreState()
+            except Exception as e:
+                logger.exception(f"恢复按键状态失败! {e}")
+        if handle.callback is not None and handle.isCallback:
+            logger.info("calling back...")
+            try:
+                handle.callback()
+            except Exception as e:
+                logger.exception(f"播放回调失败! {e}")
+
+        with self.condition:
+            self.handles.pop(handle.id, None)
+            while self.waiting and (self.maxRunning <= 0 or self.runningCount() < self.maxRunning):
+                _, _, waiting = heapq.heappop(self.waiting)
+                if waiting.state == PENDING:
+                    self.__start(waiting)
+            handle.done.set()
+            doneCallbacks, handle.doneCallbacks = handle.doneCallbacks, []
+        for callback in doneCallbacks:
+            try:
+                callback(handle)
+            except Exception as e:
+                logger.exception(f"播放结束回调失败! {e}")
+
+    def running(self):
+        # 每个事件只进出一次锁: 推进上一个事件所属的句柄, 再取出下一个到期的事件
+        handle, isFailed = None, False
+        while True:
+            finishing = None
+            with self.condition:
+                if handle is not None:
+                    self.current = None
+                    # 执行期间可能已被取消或暂停
+                    if isFailed and handle.isActive:
+                        self.__fail(handle)
+                    elif handle.state in {PLAYING, PAUSED}:
+                        try:
+                            self.__advance(handle)
+                        except Exception as e:
+                            # 按需生成的计划(组合宏)可能在取下一项时出错, 只取消这次播放, 调度线程继续运行
+                            logger.exception(f"生成播放计划失败! {e}")
+                            self.__fail(handle)
+                    handle = None
+                if self.finishing:
+                    finishing, self.finishing = self.finishing, []
+                else:
+                    queue = self.queue
+                    while queue and queue[0][3] != queue[0][4].generation:
+                        heapq.heappop(queue)
+                    if not queue:
+                        self.condition.wait()
+                        continue
+                    deadline = queue[0][0]
+                    remain = deadline - time.perf_counter()
+                    if remain > self.spinThreshold:
+                        # 等待期间可被新的播放、取消或暂停唤醒
+                        self.condition.wait(remain - self.spinThreshold)
+                        continue
+                    handle = heapq.heappop(queue)[4]
+                    self.current = handle
+
+            if finishing is not None:
+                for finished in finishing:
+                    self.__finish(finished)
+                continue
+
+            if remain > 0:
+                waitUntil(deadline, 0)
+            try:
+                _, handler, arg = handle.plan[handle.index]
+            except Exception as e:
+                logger.exception(f"生成播放计划失败! {e}")
+                isFailed = True
+                continue
+            began = time.perf_counter()
+            if handle.keepInterval:
+                handle.lateness.append(began - deadline)
+            try:
+                handler(arg)
+                isFailed = False
+            except Exception as e:
+                logger.exception(f"执行宏失败! {e}")
+                isFailed = True
+            if self.logEvents:
+                logger.debug(f"{handle.name or handle.id} #{handle.index} {handler.__name__}({arg!r})")
+            stats = perfStats.stats
+            if stats is not None:
+                # 合批项按批内事件数计
+                stats.addDispatch(handle, deadline, began, time.perf_counter(), len(arg) if handler == handle.backend.injectBatch else 1)
+
+scheduler: PlayScheduler | None = None
+
+
+def getScheduler() -> PlayScheduler:
+    global scheduler
+    if scheduler is None:
+        scheduler = PlayScheduler()
+    return scheduler
@@ -0,0 +1,364 @@
+import sys
+
+from typing import NamedTuple
+
+from eventStore import EventStore, KEY_DOWN, KEY_UP, MOUSE_DOUBLE, MOUSE_DOWN, MOUSE_MOVE, MOUSE_UP, MOUSE_WHEEL
+from hotkeyDispatcher import modifierOf
+
+# 录制过滤: 整理线程把按时间合并好的事件行 (time, kind, name, x, y, delta) 依次交给各级过滤器, 钩子回调仍只写入环形缓冲
+# 每级过滤器的 process(rows) 为生成器, 状态跨批次保留; 需要暂存事件的过滤器在 finish() 中产出剩余事件
+# 宏配置 filters 为 [{"type": 过滤器名, 其余为参数}, ...], 按顺序串联; 同一串过滤器也可用于已有的记录(FilterPipeline.apply)
+KEY_KINDS = {KEY_DOWN, KEY_UP}
+BUTTON_KINDS = {MOUSE_DOWN, MOUSE_UP, MOUSE_DOUBLE}
+# 等待组合键主键时最多暂存的事件数, 超过后按未触发快捷键处理
+MAX_HELD = 4096
+
+
+class FilterReport(NamedTuple):
+    received: int = 0
+    removed: int = 0
+
+    def merge(self, other):
+        return FilterReport(self.received + other.received, self.removed + other.removed)
+
+
+class RecordFilter:
+    name = ""
+
+    def reset(self):
+        pass
+
+    def process(self, rows):
+        return rows
+
+    def finish(self):
+        return ()
+
+
+class CollapseRepeats(RecordFilter):
+    # 按住不放时系统产生的重复按下只保留第一个
+    name = "collapseRepeats"
+
+    def __init__(self):
+        self.held = set()
+
+    def reset(self):
+        self.held.clear()
+
+    def process(self, rows):
+        held = self.held
+        for row in rows:
+            kind = row[1]
+            if kind == KEY_DOWN:
+                if row[2] in held:
+                    continue
+                held.add(row[2])
+            elif kind == KEY_UP:
+                held.discard(row[2])
+            yield row
+
+
+class StripHotkeys(RecordFilter):
+    # 去掉快捷键(如开始/停止录制的 ctrl+alt+f9)本身的按键: 修饰键按下先暂存, 随后按下的主键组成快捷键时连同暂存的修饰键一起丢弃,
+    # 这些键之后的释放与重复按下也一并丢弃; 开始录制前已按下的快捷键按键, 其释放同样丢弃
+    name = "stripHotkeys"
+
+    def __init__(self, hotkeys=("ctrl+alt+f9",)):
+        self.combos = set()
+        self.masks = set()
+        self.keys = set()
+        for hotkey in hotkeys:
+            modifiers, mainKeys = 0, []
+            for part in hotkey.split("+"):
+                part = part.strip().lower() or "plus"
+                modifier = modifierOf(part)
+                if modifier:
+                    modifiers |= modifier
+                else:
+                    mainKeys.append(part)
+            if len(mainKeys) != 1:
+                raise ValueError(f"快捷键 {hotkey} 必须且只能包含一个非修饰键")
+            self.combos.add((modifiers, mainKeys[0]))
+            self.masks.add(modifiers)
+            self.keys.add(mainKeys[0])
+        self.modifiers = 0
+        # 暂存的事件及其中的修饰键按下
+        self.held = []
+        self.heldModifiers = []
+        # 已输出按下的键; 属于快捷键、需要丢弃其后续事件的键
+        self.pressed = set()
+        self.swallowed = set()
+
+    def reset(self):
+        self.modifiers = 0
+        self.held.clear()
+        self.heldModifiers.clear()
+        self.pressed.clear()
+        self.swallowed.clear()
+
+    def __release(self):
+        held, pressed = self.held, self.pressed
+        for row in held:
+            if row[1] == KEY_DOWN:
+                pressed.add(row[2])
+        self.held, self.heldModifiers = [], []
+        return held
+
+    def __isPrefix(self) -> bool:
+        # 当前按住的修饰键是否可能是某个快捷键的一部分
+        return any(self.modifiers & ~mask == 0 for mask in self.masks)
+
+    def process(self, rows):
+        pressed, swallowed = self.pressed, self.swallowed
+        for row in rows:
+            kind, name = row[1], row[2]
+            if kind not in KEY_KINDS:
+                if self.held:
+                    if kind in BUTTON_KINDS or len(self.held) >= MAX_HELD:
+                        yield from self.__release()
+                    else:
+                        self.held.append(row)
+                        continue
+                yield row
+                continue
+
+            modifier = modifierOf(name)
+            if name in swallowed:
+                if kind == KEY_UP:
+                    swallowed.discard(name)
+                    self.modifiers &= ~modifier
+                continue
+            if modifier:
+                if kind == KEY_DOWN:
+                    if name in pressed or any(other[2] == name for other in self.heldModifiers):
+                        # 修饰键的重复按下, 随其首次按下一起暂存或输出
+                        if self.held:
+                            self.held.append(row)
+                        else:
+                            yield row
+                        continue
+                    self.modifiers |= modifier
+                    if self.__isPrefix():
+                        self.held.append(row)
+                        self.heldModifiers.append(row)
+                        continue
+                    yield from self.__release()
+                    pressed.add(name)
+                    yield row
+                    continue
+                self.modifiers &= ~modifier
+                if self.held:
+                    yield from self.__release()
+                elif name not in pressed and any(mask & modifier for mask in self.masks):
+                    continue
+                pressed.discard(name)
+                yield row
+                continue
+
+            key = name.lower() if name else name
+            if kind == KEY_DOWN and (self.modifiers, key) in self.combos:
+                swallowed.add(name)
+                swallowed.update(other[2] for other in self.heldModifiers)
+                # 暂存的其他事件(如鼠标移动)照常输出
+                for other in self.held:
+                    if other[1] not in KEY_KINDS:
+                        yield other
+                self.held, self.heldModifiers = [], []
+                continue
+            if kind == KEY_UP and key in self.keys and name not in pressed:
+                continue
+            if self.held:
+                yield from self.__release()
+            if kind == KEY_DOWN:
+                pressed.add(name)
+            else:
+                pressed.discard(name)
+            yield row
+
+    def finish(self):
+        # 快捷键的主键被抑制时(如 ctrl+alt+f9 停止录制)不会进入录制, 结束时仍暂存的修饰键按下属于该快捷键, 丢弃; 其他暂存事件照常输出
+        if self.__isPrefix():
+            held = [row for row in self.held if row[1] not in KEY_KINDS]
+            self.held, self.heldModifiers = [], []
+            return held
+        return self.__release()
+
+
+class KeyFilter(RecordFilter):
+    # 只保留 allow 中的按键(为空时不限制), 并去掉 deny 中的按键; 只作用于键盘事件
+    name = "keys"
+
+    def __init__(self, allow=(), deny=()):
+        self.allow = {key.lower() for key in allow}
+        self.deny = {key.lower() for key in deny}
+
+    def process(self, rows):
+        allow, deny = self.allow, self.deny
+        for row in rows:
+            if row[1] in KEY_KINDS and row[2] is not None:
+                key = row[2].lower()
+                if (allow and key not in allow) or key in deny:
+                    continue
+            yield row
+
+
+class RegionFilter(RecordFilter):
+    # region 为 [left, top, right, bottom](含边界); clip 时把区域外的移动收到边界上, 否则丢弃区域外的移动,
+    # 以及指针在区域外时的按键与滚轮(按下被丢弃的按键, 其释放也丢弃)
+    name = "region"
+
+    def __init__(self, region, clip: bool = True):
+        self.left, self.top, self.right, self.bottom = region
+        if self.left > self.right or self.top > self.bottom:
+            raise ValueError(f"区域格式错误: {region}")
+        self.clip = clip
+        self.inside = True
+        self.dropped = set()
+
+    def reset(self):
+        self.inside = True
+        self.dropped.clear()
+
+    def process(self, rows):
+        left, top, right, bottom, clip, dropped = self.left, self.top, self.right, self.bottom, self.clip, self.dropped
+        # 指针是否在区域内只在变化时写回, 供下一批使用
+        inside = self.inside
+        for row in rows:
+            kind = row[1]
+            if kind == MOUSE_MOVE:
+                x, y = row[3], row[4]
+                if left <= x <= right and top <= y <= bottom:
+                    if not inside:
+                        self.inside = inside = True
+                elif clip:
+                    row = (row[0], kind, row[2], min(max(x, left), right), min(max(y, top), bottom), row[5])
+                else:
+                    if inside:
+                        self.inside = inside = False
+                    continue
+            elif not clip and (kind in BUTTON_KINDS or kind == MOUSE_WHEEL):
+                if kind == MOUSE_UP:
+                    if row[2] in dropped:
+                        dropped.discard(row[2])
+                        continue
+                elif not inside:
+                    if kind == MOUSE_DOWN:
+                        dropped.add(row[2])
+                    continue
+            yield row
+
+
+class Deduplicate(RecordFilter):
+    # 与上一个输出的事件(不计时间)完全相同时丢弃, interval 为最大时间间隔(秒), 0 为不限制
+    name = "dedupe"
+
+    def __init__(self, interval: float = 0):
+        self.interval = interval
+        self.last = None
+
+    def reset(self):
+        self.last = None
+
+    def process(self, rows):
+        interval, last = self.interval, self.last
+        for row in rows:
+            if last is not None and row[1:] == last[1:] and (interval <= 0 or row[0] - last[0] <= interval):
+                continue
+            last = self.last = row
+            yield row
+
+
+FILTERS = {stage.name: stage for stage in (CollapseRepeats, StripHotkeys, KeyFilter, RegionFilter, Deduplicate)}
+
+
+class FilterPipeline:
+
+    def __init__(self, stages=()):
+        self.stages = list(stages)
+        self.report = FilterReport()
+
+    def __len__(self):
+        return len(self.stages)
+
+    def __repr__(self):
+        return f"FilterPipeline({', '.join(stage.name for stage in self.stages)})"
+
+    @classmethod
+    def fromConfig(cls, configs: list):
+        stages = []
+        for config in configs or ():
+            config = dict(config)
+            stage = FILTERS.get(config.pop('type', None))
+            if stage is None:
+                raise ValueError(f"未知的录制过滤器: {config}")
+            stages.append(stage(**config))
+        return cls(stages)
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+        self.report = FilterReport()
+
+    def process(self, rows: list) -> list:
+        # 一批事件依次经过各级生成器, 每个事件只在被丢弃或到达末级时才离开管道
+        output = rows
+        for stage in self.stages:
+            output = stage.process(output)
+        output = list(output)
+        self.report = self.report.merge(FilterReport(len(rows), len(rows) - len(output)))
+        return output
+
+    def finish(self) -> list:
+        # 录制结束: 依次排空各级暂存的事件, 前一级排出的事件仍经过其后各级
+        output = ()
+        for stage in self.stages:
+            output = drainStage(stage, output)
+        output = list(output)
+        self.report = self.report.merge(FilterReport(0, -len(output)))
+        return output
+
+    def apply(self, eventsRecord: EventStore) -> tuple[EventStore, FilterReport]:
+        # 离线过滤已有的记录, 返回新的记录; 过滤器状态在前后都会重置
+        self.reset()
+        filtered = EventStore()
+        try:
+            for rows in (self.process(list(recordRows(eventsRecord))), self.finish()):
+                for time, kind, name, x, y, delta in rows:
+                    filtered.appendKind(kind, time, name, x, y, delta)
+            report = self.report
+        finally:
+            self.reset()
+        return filtered, report
+
+
+def drainStage(stage: RecordFilter, rows):
+    # finish() 须在上一级的事件全部经过本级之后才调用
+    yield from stage.process(rows)
+    yield from stage.finish()
+
+
+def recordRows(eventsRecord: EventStore):
+    times, kinds, keys, xs, ys, deltas, keyNames = (eventsRecord.times, eventsRecord.kinds, eventsRecord.keys, eventsRecord.xs,
+                                                     eventsRecord.ys, eventsRecord.deltas, eventsRecord.keyNames)
+    for index in range(len(times)):
+        yield times[index], kinds[index], keyNames[keys[index]], xs[index], ys[index], deltas[index]
+
+
+if __name__ == "__main__":
+    # 按各宏配置中的 filters 过滤宏文件中已有的记录
+    if len(sys.argv) < 2:
+        print("usage: python recordFilter.py <keyMacros.kmc> [宏 id ...]")
+        sys.exit(1)
+    from macroContainer import MacroContainer, toEventStore
+
+    container = MacroContainer(sys.argv[1])
+    try:
+        keyMacros = container.loadConfigs()
+        for macroID, macroConfig in keyMacros.items():
+            if not macroConfig.get('filters') or (len(sys.argv) > 2 and macroID not in sys.argv[2:]):
+                continue
+            macroConfig['record'], report = FilterPipeline.fromConfig(macroConfig['filters']).apply(toEventStore(macroConfig['record']))
+            print(f"{macroID}\t{macroConfig.get('name', '')}\t去掉 {report.removed}/{report.received} 个事件")
+        container.save(keyMacros)
+    finally:
+        container.close()
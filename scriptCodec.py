@@ -0,0 +1,115 @@
+from typing import Iterable, Iterator
+
+from eventStore import EventStore, KEY_DOWN, KEY_UP, KINDS, MOUSE_DOUBLE, MOUSE_DOWN, MOUSE_MOVE, MOUSE_UP, MOUSE_WHEEL
+
+# 脚本文本格式: 延迟行(毫秒, 如 0106) 与事件行(如 "mouse left: down", "a: up", "[100, 200]: move", "-1.0: wheel") 交替出现
+MOUSE_BUTTONS = {"mouse left": "left", "mouse right": "right", "mouse middle": "middle"}
+KEY_TYPES = {"down": KEY_DOWN, "up": KEY_UP}
+BUTTON_TYPES = {"down": MOUSE_DOWN, "up": MOUSE_UP, "double": MOUSE_DOUBLE}
+
+
+class ScriptError(Exception):
+
+    def __init__(self, line: int, message: str):
+        super().__init__(f"第{line}行: {message}")
+        self.line = line
+        self.message = message
+
+
+def encodeLines(eventsRecord: EventStore, start: int = 0, end: int = None) -> Iterator[str]:
+    # 只编码 [start, end) 的事件, 首个事件的延迟仍相对其前一个事件, 与整体编码的对应行一致
+    times, kinds, keys, xs, ys, deltas = eventsRecord.columns
+    keyNames = eventsRecord.keyNames
+    end = len(times) if end is None else min(end, len(times))
+    # 按绝对时间取整到毫秒后再求差, 避免逐段截断累积误差
+    lastTime = round((times[start - 1] if start > 0 else eventsRecord.firstTime) * 1000)
+    for index in range(start, end):
+        kind = kinds[index]
+        eventType, type = KINDS[kind]
+        if kind == MOUSE_MOVE:
+            recordKey = f"[{xs[index]}, {ys[index]}]"
+        elif kind == MOUSE_WHEEL:
+            recordKey = deltas[index]
+        elif eventType == "mouse" and keyNames[keys[index]] in {"left", "right", "middle"}:
+            recordKey = f"mouse {keyNames[keys[index]]}"
+        else:
+            recordKey = keyNames[keys[index]]
+        current = round(times[index] * 1000)
+        yield f"{current - lastTime:04d}\n{recordKey}: {type}\n"
+        lastTime = current
+
+
+def encodeText(eventsRecord: EventStore) -> str:
+    return "".join(encodeLines(eventsRecord))
+
+
+def parseEvent(line: str, lineNo: int) -> tuple:
+    # 返回 (kind, key, x, y, delta)
+    recordKey, _, recordType = line.rpartition(":")
+    recordKey, recordType = recordKey.strip(), recordType.strip()
+    if len(recordKey) == 0:
+        raise ScriptError(lineNo, f"缺少按键: {line.strip()}")
+    if recordType == "move":
+        if not (recordKey.startswith("[") and recordKey.endswith("]")):
+            raise ScriptError(lineNo, f"鼠标坐标格式错误: {recordKey}")
+        offset = recordKey[1:-1].split(",")
+        try:
+            x, y = (int(value) for value in offset)
+        except ValueError:
+            raise ScriptError(lineNo, f"鼠标坐标格式错误: {recordKey}") from None
+        return MOUSE_MOVE, None, x, y, 0
+    if recordType == "wheel":
+        try:
+            return MOUSE_WHEEL, None, 0, 0, float(recordKey)
+        except ValueError:
+            raise ScriptError(lineNo, f"滚轮数值错误: {recordKey}") from None
+    if recordKey in MOUSE_BUTTONS:
+        kind = BUTTON_TYPES.get(recordType)
+        if kind is None:
+            raise ScriptError(lineNo, f"未知的鼠标事件: {recordType}")
+        return kind, MOUSE_BUTTONS[recordKey], 0, 0, 0
+    kind = KEY_TYPES.get(recordType)
+    if kind is None:
+        raise ScriptError(lineNo, f"未知的按键事件: {recordType}")
+    return kind, recordKey, 0, 0, 0
+
+
+def isDirective(line: str) -> bool:
+    # "@call"、"@repeat" 等; "@: down" 仍是按键事件
+    return len(line) > 1 and line[0] == "@" and line[1].isalpha()
+
+
+def parseDelay(line: str, lineNo: int) -> float:
+    try:
+        return float(line)
+    except ValueError:
+        raise ScriptError(lineNo, f"延迟时间格式错误: {line}") from None
+
+
+def decodeLines(lines: Iterable[str]) -> Iterator[tuple]:
+    # 逐行解析, 产出 (行号, 距上一事件的毫秒数, kind, key, x, y, delta)
+    delay = 0
+    for lineNo, line in enumerate(lines, 1):
+        stripped = line.strip()
+        if len(stripped) == 0:
+            continue
+        if isDirective(stripped):
+            # 组合宏的指令由 macroProgram 解析
+            raise ScriptError(lineNo, f"事件脚本中不能使用指令: {stripped}")
+        if ':' in stripped:
+            yield (lineNo, delay) + parseEvent(stripped, lineNo)
+            delay = 0
+        else:
+            delay = parseDelay(stripped, lineNo)
+
+
+def decodeRecord(lines: Iterable[str]) -> EventStore:
+    eventsRecord, elapsed = EventStore(), 0
+    for lineNo, delay, kind, key, x, y, delta in decodeLines(lines):
+        elapsed += delay
+        eventsRecord.appendKind(kind, elapsed / 1000, key, x, y, delta)
+    return eventsRecord
+
+
+def decodeText(contents: str) -> EventStore:
+    return decodeRecord(contents.splitlines())
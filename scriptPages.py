@@ -0,0 +1,107 @@
+from array import array
+from functools import lru_cache
+
+from eventStore import EventStore
+from scriptCodec import ScriptError, decodeLines, encodeLines, isDirective, parseDelay, parseEvent
+
+# 大脚本按页编辑: 每页 PAGE_EVENTS 个事件(每个事件占延迟行与事件行两行), 只编码当前页;
+# 保存时与该页原文逐行比较, 只解析改动的行并替换对应的事件, 其余事件的文本保持不变
+PAGE_EVENTS = 500
+
+
+def pageCount(eventsRecord: EventStore) -> int:
+    return max(1, -(-len(eventsRecord) // PAGE_EVENTS))
+
+
+def pageRange(eventsRecord: EventStore, page: int) -> tuple[int, int]:
+    start = page * PAGE_EVENTS
+    return start, min(start + PAGE_EVENTS, len(eventsRecord))
+
+
+def pageLine(page: int) -> int:
+    # 页内第 1 行在整体脚本中的行号 - 1
+    return page * PAGE_EVENTS * 2
+
+
+def encodePage(eventsRecord: EventStore, page: int) -> str:
+    return "".join(encodeLines(eventsRecord, *pageRange(eventsRecord, page)))
+
+
+@lru_cache(maxsize=8192)
+def lineError(line: str) -> str | None:
+    # 单行校验与上下文无关, 按行文本缓存, 编辑时未改动的行不再解析
+    stripped = line.strip()
+    if len(stripped) == 0:
+        return None
+    try:
+        if isDirective(stripped):
+            return f"事件脚本中不能使用指令: {stripped}"
+        if ':' in stripped:
+            parseEvent(stripped, 0)
+        else:
+            parseDelay(stripped, 0)
+    except ScriptError as e:
+        return e.message
+    return None
+
+
+def validateText(text: str) -> list[tuple[int, str]]:
+    # 返回 [(页内行号, 错误信息)]
+    return [(lineNo, message) for lineNo, line in enumerate(text.splitlines(), 1) if (message := lineError(line)) is not None]
+
+
+def diffLines(oldLines: list, newLines: list) -> tuple[int, int]:
+    # 返回首尾相同的行数
+    limit = min(len(oldLines), len(newLines))
+    prefix = 0
+    while prefix < limit and oldLines[prefix] == newLines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and oldLines[-1 - suffix] == newLines[-1 - suffix]:
+        suffix += 1
+    return prefix, suffix
+
+
+def applyPage(eventsRecord: EventStore, page: int, text: str) -> tuple[int, int, int]:
+    # 将编辑后的页文本应用到记录, 返回 (首个改动事件的下标, 删除的事件数, 新增的事件数); 出错时抛出 ScriptError(整体行号), 记录不变
+    start, end = pageRange(eventsRecord, page)
+    oldLines, newLines = encodePage(eventsRecord, page).splitlines(), text.splitlines()
+    prefix, suffix = diffLines(oldLines, newLines)
+    # 原文严格为 延迟行/事件行 成对出现, 首尾未改动的完整事件保持原样
+    kept, tail = prefix // 2, suffix // 2
+    first, last = start + kept, end - tail
+    changed = newLines[kept * 2:len(newLines) - tail * 2]
+    if first == last and len(changed) == 0:
+        return first, 0, 0
+
+    # 按文本显示的毫秒数计算: 各行延迟为相邻事件的时间取整到毫秒后的差(见 encodeLines), 新事件与 decodeText 一样落在整毫秒上
+    times = eventsRecord.times
+    previous = round((times[first - 1] if first > 0 else eventsRecord.firstTime) * 1000)
+    replacement = EventStore()
+    try:
+        for lineNo, delay, kind, key, x, y, delta in decodeLines(changed):
+            previous += delay
+            replacement.appendKind(kind, previous / 1000, key, x, y, delta)
+    except ScriptError as e:
+        raise ScriptError(pageLine(page) + kept * 2 + e.line, e.message) from None
+
+    shift = 0
+    if last < len(times) and (len(replacement) > 0 or first > 0):
+        # 其后首个事件的延迟行保持原值(原为首个事件时为 0); 平移整毫秒, 其后各行的文本不变
+        current = round(times[last] * 1000)
+        gap = current - round(times[last - 1] * 1000) if last > 0 else 0
+        shift = previous + gap - current
+    tail = array('d', shiftTimes(times[last:], shift)) if shift else None
+    eventsRecord.splice(first, last, replacement)
+    if tail is not None:
+        times[first + len(replacement):] = tail
+    return first, last - first, len(replacement)
+
+
+def shiftTimes(times, shiftMs: int):
+    # 平移 shiftMs 毫秒; 浮点误差会使恰在 0.5 毫秒附近的时间取整后差 1, 这些事件改为落在应显示的整毫秒上
+    shift = shiftMs / 1000
+    for time in times:
+        shifted = time + shift
+        target = round(time * 1000) + shiftMs
+        yield shifted if round(shifted * 1000) == target else target / 1000
@@ -0,0 +1,86 @@
+import hashlib
+import struct
+import zlib
+
+from array import array
+from itertools import accumulate
+
+from eventStore import EventStore
+
+# 按内容切分事件流: 滚动哈希(最近 32 个事件)的低位为 0 时切分, 相同的事件序列在不同宏中切出相同的片段
+# 片段内的时间保存为相对上一个事件的间隔(以 TICK 秒为单位取整, 首个事件为 0), 与事件在宏中的绝对时间无关
+# 各片段的起始时间由引用方保存, 取整误差只在片段内累积, 还原后的时间与原值最多相差约 MAX_SEGMENT * TICK / 2 (12.8 微秒);
+# 因此分片格式是有损的, 转换回普通格式(flatten)也只能得到取整后的时间
+TICK = 1e-7
+MIN_SEGMENT = 16
+AVERAGE_MASK = 63
+MAX_SEGMENT = 256
+# 取整误差的上限(秒)
+MAX_DRIFT = MAX_SEGMENT * TICK / 2
+EVENT_FINGERPRINT = struct.Struct('<Biidq')
+
+
+def fingerprint(kind: int, key, x: int, y: int, delta: float, gap: int) -> int:
+    data = EVENT_FINGERPRINT.pack(kind, x, y, delta, gap)
+    if key is not None:
+        data += str(key).encode('utf-8')
+    return zlib.crc32(data)
+
+
+def splitSegments(record: EventStore) -> list:
+    # 返回 [(片段首个事件的时间, 片段)], 片段为 times 列存放间隔(TICK 数)的 EventStore
+    if len(record) == 0:
+        return []
+    times, kinds, keys, xs, ys, deltas, keyNames = record.times, record.kinds, record.keys, record.xs, record.ys, record.deltas, record.keyNames
+    gaps = [0] + [round((times[index] - times[index - 1]) / TICK) for index in range(1, len(times))]
+    segments, begin, rolling = [], 0, 0
+    for index in range(len(times)):
+        rolling = ((rolling << 1) + fingerprint(kinds[index], keyNames[keys[index]], xs[index], ys[index], deltas[index], gaps[index])) & 0xffffffff
+        size = index + 1 - begin
+        if (size >= MIN_SEGMENT and rolling & AVERAGE_MASK == 0) or size >= MAX_SEGMENT or index == len(times) - 1:
+            segments.append((times[begin], sliceSegment(record, begin, index + 1, gaps)))
+            begin = index + 1
+    return segments
+
+
+def sliceSegment(record: EventStore, begin: int, end: int, gaps: list) -> EventStore:
+    # 按列切片, 按键名表只保留片段内出现的名称(按出现顺序), 保证相同内容的片段字节一致
+    segment = EventStore()
+    segment.times = array('d', gaps[begin:end])
+    segment.times[0] = 0
+    segment.kinds = record.kinds[begin:end]
+    keyNames, keyCode = record.keyNames, segment.keyCode
+    segment.keys = array('H', [keyCode(keyNames[code]) for code in record.keys[begin:end]])
+    segment.xs = record.xs[begin:end]
+    segment.ys = record.ys[begin:end]
+    segment.deltas = record.deltas[begin:end]
+    return segment
+
+
+def segmentHash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def encodeSegment(segment: EventStore) -> tuple[str, bytes]:
+    # 返回 (内容哈希, 压缩后的片段块)
+    data = segment.toBytes()
+    return segmentHash(data), zlib.compress(data, 1)
+
+
+def decodeSegment(block) -> EventStore:
+    return EventStore.fromBytes(zlib.decompress(block))
+
+
+def assembleSegments(segments) -> EventStore:
+    # segments 为 [(起始时间, 片段)], 按列整体拼接, 按键名映射到合并后的名表
+    store = EventStore()
+    for start, segment in segments:
+        store.times.extend(start + offset * TICK for offset in accumulate(segment.times))
+        store.kinds.extend(segment.kinds)
+        codes = [store.keyCode(key) for key in segment.keyNames]
+        store.keys.extend(codes[code] for code in segment.keys)
+        store.xs.extend(segment.xs)
+        store.ys.extend(segment.ys)
+        store.deltas.extend(segment.deltas)
+    store.version += 1
+    return store
@@ -0,0 +1,48 @@
+from array import array
+from typing import NamedTuple
+
+from eventStore import EventStore, KEY_DOWN, KEY_UP, MOUSE_DOWN, MOUSE_UP
+
+# 按下种类 -> 对应的释放种类
+HOLD_KINDS = {KEY_DOWN: KEY_UP, MOUSE_DOWN: MOUSE_UP}
+
+
+class TimeWarp(NamedTuple):
+    # speed: 播放倍速; maxGap: 倍速换算后任意两个相邻事件的最大间隔(秒), 0 为不限制;
+    # minHold: 倍速换算后按下到释放的最短时长(秒), 0 为不限制
+    speed: float = 1.0
+    maxGap: float = 0
+    minHold: float = 0
+
+    @classmethod
+    def fromConfig(cls, macroConfig: dict):
+        # 宏配置中的间隔与时长以毫秒保存
+        return cls(macroConfig.get('speed', 1.0), macroConfig.get('maxGap', 0) / 1000, macroConfig.get('minHold', 0) / 1000)
+
+    def offsets(self, eventsRecord: EventStore) -> array:
+        # 返回每个事件相对首个事件的播放时间, 保持原有顺序
+        rows = zip(eventsRecord.times, eventsRecord.kinds, eventsRecord.keys)
+        return array('d', (offset for offset, _ in self.warp(rows)))
+
+    def warp(self, rows):
+        # rows 为 (时间, 事件种类, 按键) 序列, 逐个产出 (播放时间, row), 可用于按需生成的事件流
+        speed, maxGap, minHold = self.speed, self.maxGap, self.minHold
+        # (释放种类, 按键) -> 按下时的播放时间
+        pressed = {}
+        offset, lastTime = 0.0, None
+        for row in rows:
+            time, kind, key = row
+            if lastTime is not None:
+                # 时间倒退(如手动编辑的脚本)按间隔 0 处理, 保持事件顺序
+                gap = max(time - lastTime, 0) / speed
+                if 0 < maxGap < gap:
+                    gap = maxGap
+                offset += gap
+            lastTime = time
+            if minHold > 0:
+                if kind in HOLD_KINDS:
+                    pressed[(HOLD_KINDS[kind], key)] = offset
+                elif (kind, key) in pressed:
+                    # 释放过早时推迟释放, 其后的事件随之顺延
+                    offset = max(offset, pressed.pop((kind, key)) + minHold)
+            yield offset, row
@@ -1,6 +1,9 @@
+import atexit
 import logging
+import queue
 import ujson
 
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
 
@@ -20,25 +23,36 @@ def dumpJson(jsonPath: str | Path, json: dict, mode: str = 'w', encoding: str =
         ujson.dump(json, f, indent=2, ensure_ascii=False)
 
 
-def initLogger(name: str = "logs", maxBytes: int = 0):
-    logsPath = Path.cwd() / f"{name}.log"
-    if logsPath.exists() and 0 < maxBytes < logsPath.stat().st_size:
-        logsPath.unlink()
-
-    if name in logging.Logger.manager.loggerDict:
-        return logging.getLogger(name)
+def initLogger(name: str = "logs", maxBytes: int = 0, backupCount: int = 3, level: int = logging.INFO):
+    # 由程序入口调用, 导入本模块时不再创建日志文件和处理器
+    # 记录日志的线程只把记录放入队列, 由后台监听线程写控制台和文件, 播放线程不会被慢速磁盘或控制台阻塞
+    # 日志超过 maxBytes 时轮转, 最多保留 backupCount 个旧文件; maxBytes 为 0 时不轮转
+    logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger
 
+    logsPath = Path.cwd() / f"{name}.log"
     formatter = logging.Formatter("%(asctime)s [%(threadName)s] %(name)s (%(filename)s:%(lineno)d) %(levelname)s - %(message)s")
-    fileHandler = logging.FileHandler(str(logsPath), delay=True, encoding='utf-8')
+    fileHandler = RotatingFileHandler(str(logsPath), maxBytes=maxBytes, backupCount=backupCount, delay=True, encoding='utf-8')
     fileHandler.setFormatter(formatter)
     streamHandler = logging.StreamHandler()
     streamHandler.setFormatter(formatter)
 
-    logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    logger.addHandler(streamHandler)
-    logger.addHandler(fileHandler)
+    queueHandler, listener = createQueueHandler(streamHandler, fileHandler)
+    # 退出时写完队列中剩余的日志
+    atexit.register(listener.stop)
+
+    logger.setLevel(level)
+    logger.addHandler(queueHandler)
     return logger
 
 
-logger = initLogger("keyMacro", 10 * 1048576)
+def createQueueHandler(*handlers) -> tuple[QueueHandler, QueueListener]:
+    # 返回只入队的处理器与已启动的后台监听器, 由监听线程依次交给 handlers
+    logQueue = queue.SimpleQueue()
+    listener = QueueListener(logQueue, *handlers, respect_handler_level=True)
+    listener.start()
+    return QueueHandler(logQueue), listener
+
+
+logger = logging.getLogger("keyMacro")
@@ -0,0 +1,209 @@
+import itertools
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import logger
+
+# 耗时的宏操作(解码、文本化、解析、生成播放计划)在后台线程执行, 界面线程只接收结果
+# 所有回调(进度、结果、错误、结束)都经 dispatch 投递到界面线程执行(见 keyMacroUI.GuiDispatcher), 未设置时在工作线程直接调用
+PENDING, RUNNING, DONE, FAILED, CANCELLED = "pending", "running", "done", "failed", "cancelled"
+# 进度回调的最短间隔(秒), 避免投递过多事件
+PROGRESS_INTERVAL = 1 / 30
+CHECK_EVERY = 1024
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    __slots__ = ("id", "name", "key", "state", "progress", "result", "error", "future", "cancelled", "done", "delivered", "lastReport",
+                 "pool", "onDone", "onError", "onProgress", "onFinished")
+
+    def __init__(self, pool, id: int, name: str, key, onDone=None, onError=None, onProgress=None, onFinished=None):
+        self.pool = pool
+        self.id = id
+        self.name = name
+        # 同 key 的任务只保留最新的一个
+        self.key = key
+        self.state = PENDING
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.future = None
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        # 结果已在界面线程交付, 之后取消无效
+        self.delivered = False
+        self.lastReport = 0.0
+        self.onDone = onDone
+        self.onError = onError
+        self.onProgress = onProgress
+        self.onFinished = onFinished
+
+    def __repr__(self):
+        return f"Job({self.id}, {self.name or '-'}, {self.state}, {self.progress:.0%})"
+
+    @property
+    def isCancelled(self) -> bool:
+        return self.cancelled.is_set()
+
+    @property
+    def isActive(self) -> bool:
+        return self.state in {PENDING, RUNNING}
+
+    def cancel(self) -> bool:
+        # 未开始的任务直接取消; 运行中的任务在下次 check/report 时退出; 已完成但未交付的结果被丢弃
+        if self.delivered or self.isCancelled:
+            return False
+        self.cancelled.set()
+        if self.future is not None and self.future.cancel():
+            self.pool.finish(self, CANCELLED)
+        return True
+
+    def wait(self, timeout: float = None) -> bool:
+        return self.done.wait(timeout)
+
+    def check(self):
+        # 由工作函数在循环中调用, 已取消时抛出 JobCancelled
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    def report(self, progress: float):
+        # 由工作函数调用, progress 为 0 ~ 1; 同时检查取消
+        self.check()
+        now = time.perf_counter()
+        if now - self.lastReport < PROGRESS_INTERVAL and progress < 1:
+            return
+        self.lastReport = now
+        self.progress = progress
+        if self.onProgress is not None:
+            self.pool.post(self.__deliverProgress, progress)
+
+    def __deliverProgress(self, progress: float):
+        if not self.isCancelled and not self.delivered:
+            self.onProgress(progress)
+
+    def iterate(self, items, total: int = None):
+        # 遍历时每 CHECK_EVERY 项报告一次进度并检查取消
+        total = len(items) if total is None else total
+        for index, item in enumerate(items):
+            if index % CHECK_EVERY == 0:
+                self.report(index / total if total else 0.0)
+                # 主动让出 GIL, 界面线程不必等满切换间隔
+                time.sleep(0)
+            yield item
+
+
+class WorkerPool:
+
+    def __init__(self, maxWorkers: int = 2, dispatch=None):
+        self.executor = ThreadPoolExecutor(maxWorkers, thread_name_prefix="keyMacroWorker")
+        # dispatch(callback) 在界面线程执行 callback, 是结果回到界面线程的唯一途径
+        self.dispatch = dispatch
+        self.jobs: dict = {}
+        self.lock = threading.Lock()
+        self.counter = itertools.count(1)
+
+    def post(self, callback, *args):
+        if self.dispatch is None:
+            callback(*args)
+        elif args:
+            self.dispatch(lambda: callback(*args))
+        else:
+            self.dispatch(callback)
+
+    def submit(self, func, *args, name: str = "", key=None, onDone=None, onError=None, onProgress=None, onFinished=None) -> Job:
+        # func(job, *args) 在工作线程执行, 返回值交给 onDone; key 相同的旧任务被取消
+        job = Job(self, next(self.counter), name, key, onDone, onError, onProgress, onFinished)
+        previous = None
+        with self.lock:
+            if key is not None:
+                previous = self.jobs.get(key)
+                self.jobs[key] = job
+        if previous is not None:
+            previous.cancel()
+        job.future = self.executor.submit(self.__run, job, func, args)
+        return job
+
+    def cancel(self, key) -> bool:
+        with self.lock:
+            job = self.jobs.get(key)
+        return job is not None and job.cancel()
+
+    def active(self) -> list:
+        with self.lock:
+            return [job for job in self.jobs.values() if job.isActive]
+
+    def __run(self, job: Job, func, args):
+        if job.isCancelled:
+            self.finish(job, CANCELLED)
+            return
+        job.state = RUNNING
+        try:
+            job.result = func(job, *args)
+        except JobCancelled:
+            self.finish(job, CANCELLED)
+            return
+        except Exception as e:
+            job.error = e
+            self.finish(job, FAILED)
+            return
+        self.finish(job, CANCELLED if job.isCancelled else DONE)
+
+    def finish(self, job: Job, state: str):
+        job.state = state
+        with self.lock:
+            if job.key is not None and self.jobs.get(job.key) is job:
+                self.jobs.pop(job.key)
+        job.done.set()
+        self.post(self.__deliver, job)
+
+    def __deliver(self, job: Job):
+        # 在界面线程执行; 投递期间被取消的结果直接丢弃
+        if job.state == DONE and job.isCancelled:
+            job.state = CANCELLED
+        job.delivered = True
+        try:
+            if job.state == DONE and job.onDone is not None:
+                job.onDone(job.result)
+            elif job.state == FAILED:
+                if job.onError is not None:
+                    job.onError(job.error)
+                else:
+                    logger.error(f"后台任务 {job.name or job.id} 失败! {job.error!r}")
+        except Exception as e:
+            logger.exception(f"后台任务 {job.name or job.id} 回调失败! {e}")
+        finally:
+            if job.onFinished is not None:
+                try:
+                    job.onFinished(job)
+                except Exception as e:
+                    logger.exception(f"后台任务 {job.name or job.id} 回调失败! {e}")
+
+    def shutdown(self, wait: bool = False):
+        # 取消所有未完成的任务, 运行中的任务在下次检查时退出
+        with self.lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            job.cancel()
+        self.executor.shutdown(wait, cancel_futures=True)
+
+
+pool: WorkerPool | None = None
+
+
+def getWorkerPool() -> WorkerPool:
+    global pool
+    if pool is None:
+        pool = WorkerPool()
+    return pool
+
+
+def shutdownWorkerPool(wait: bool = False):
+    global pool
+    current, pool = pool, None
+    if current is not None:
+        current.shutdown(wait)